@@ -0,0 +1,112 @@
+"""Run the benchmark suite and compare it against a stored baseline.
+
+    python -m benchmarks                                  # run everything, print a table
+    python -m benchmarks --json results.json              # also write the results as JSON
+    python -m benchmarks --compare baseline.json          # flag regressions, exit 1 if any
+    python -m benchmarks -k e2e --quick                   # only names containing 'e2e', fewer repeats
+
+This is the only way to run the benchmarks; use ``-k <name>`` for a single one. Every
+benchmark module in this directory exposes ``BENCHMARKS``, a dict mapping a name to
+``(func, ops)`` where one call of ``func`` performs ``ops`` operations. Each benchmark is
+reported as the best of several repeats in nanoseconds per operation.
+"""
+import argparse
+import importlib
+import json
+import platform
+import sys
+import time
+import timeit
+
+
+MODULES = [
+    'bench_request_params', 'bench_qr', 'bench_messages', 'bench_errors', 'bench_responses', 'bench_metrics',
+    'bench_e2e',
+]
+
+
+def collect_benchmarks(name_filter=None):
+    benchmarks = {}
+    for module_name in MODULES:
+        module = importlib.import_module(f'{__package__}.{module_name}')
+        for name, (func, ops) in module.BENCHMARKS.items():
+            if name_filter is None or name_filter in name:
+                benchmarks[name] = (func, ops)
+    return benchmarks
+
+
+def measure(func, ops, repeat=5, min_time=0.2):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return {'ns_per_op': best / (number * ops) * 1e9, 'number': number, 'repeat': repeat}
+
+
+def run(benchmarks, repeat, min_time):
+    results = {}
+    for name, (func, ops) in benchmarks.items():
+        results[name] = measure(func, ops, repeat=repeat, min_time=min_time)
+        print(f"{name:<45} {results[name]['ns_per_op']:>14,.0f} ns/op", flush=True)
+    
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold):
+    """Print the change of every benchmark and return the names that got slower than ``threshold``."""
+    regressions = []
+    print(f"\n{'benchmark':<45} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print(f"{name:<45} {'-':>12} {result['ns_per_op']:>12,.0f} {'new':>8}")
+            continue
+        
+        change = result['ns_per_op'] / base['ns_per_op'] - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<45} {base['ns_per_op']:>12,.0f} {result['ns_per_op']:>12,.0f} {change:>+8.1%}{flag}")
+    
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__.split('\n')[0])
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='baseline results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.15, help='slowdown that counts as regression (0.15 = 15%%)')
+    parser.add_argument('-k', dest='name_filter', help='only run benchmarks whose name contains this')
+    parser.add_argument('--quick', action='store_true', help='fewer and shorter repeats')
+    args = parser.parse_args(argv)
+
+    benchmarks = collect_benchmarks(args.name_filter)
+    if args.quick:
+        current = run(benchmarks, repeat=3, min_time=0.05)
+    else:
+        current = run(benchmarks, repeat=5, min_time=0.2)
+
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump(current, fp, indent=2)
+
+    if args.compare:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+    
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""End-to-end auth -> collect -> complete cycles against an in-process stub transport.
+
+Every cycle goes through ``BankIdClient`` and ``requests`` exactly like a real order,
+only the network is replaced by ``StubAdapter``.
+"""
+import itertools
+
+from bankid6 import BankIdClient, CollectStatuses
+from bankid6.transport import StubAdapter
+
+
+PENDING_ROUNDS = 2
+
+
+class ScriptedBankId():
+    """Answers every order with ``PENDING_ROUNDS`` pending collects and then completes it."""
+
+    def __init__(self) -> None:
+        self.counter = itertools.count()
+        self.collects = {}
+    
+    def __call__(self, endpoint, data):
+        if endpoint in ('auth', 'sign'):
+            order_ref = '%08d-0bcb-4d65-bb5b-7580c300f098' % next(self.counter)
+            return 200, {
+                'orderRef': order_ref,
+                'autoStartToken': '79439e65-1862-4b27-aefb-dacdb9e62cba',
+                'qrStartToken': 'c56e2cd6-c4da-45f1-a104-e59e7cc6d2fa',
+                'qrStartSecret': '3cd671e5-3389-4134-9565-decc8388bc8c',
+            }
+        
+        if endpoint == 'collect':
+            order_ref = data['orderRef']
+            rounds = self.collects.get(order_ref, 0)
+            if rounds < PENDING_ROUNDS:
+                self.collects[order_ref] = rounds + 1
+                return 200, {'orderRef': order_ref, 'status': 'pending', 'hintCode': 'userSign'}
+            
+            del self.collects[order_ref]
+            return 200, {
+                'orderRef': order_ref,
+                'status': 'complete',
+                'completionData': {
+                    'user': {'personalNumber': '197311108711', 'name': 'Jack Sparrow'},
+                    'device': {'ipAddress': '78.66.48.127'},
+                    'bankIdIssueDate': '2024-02-12Z',
+                    'signature': 'PD94bWwgdmVyc2lvbj0iMS4wIj8+' * 100,
+                },
+            }
+        
+        self.collects.pop(data.get('orderRef'), None)
+        return 200, {}
+
+
+def stub_client():
+    client = BankIdClient()
+    client.client.mount(client.api_url, StubAdapter(ScriptedBankId(), codec=client.codec))
+    return client
+
+
+CLIENT = stub_client()
+
+
+def auth_cycle(client=CLIENT):
+    order = client.auth('192.168.0.1')
+    order.qr_data
+    while True:
+        collect_response = order.collect()
+        if collect_response.status != CollectStatuses.pending:
+            break
+    
+    assert collect_response.status == CollectStatuses.complete
+    return collect_response.completionData.user.name
+
+
+def sign_cancel_cycle(client=CLIENT):
+    order = client.sign('2001:db8::1', userVisibleData='Sign the agreement')
+    order.collect()
+    order.cancel()
+
+
+BENCHMARKS = {
+    'e2e.auth_collect_complete': (auth_cycle, 1),
+    'e2e.sign_collect_cancel': (sign_cancel_cycle, 1),
+}
@@ -0,0 +1,29 @@
+"""Cost of turning a BankID error response into a ``BankIdError``."""
+from bankid6 import BankIdError
+from bankid6.exceptions import check_bankid_error
+from bankid6.message import _invalidate_message_caches
+from bankid6.transport import BankIdHttpResponse
+
+
+RESPONSE = BankIdHttpResponse(503, b'{"errorCode": "maintenance", "details": "Try again"}', 'collect')
+OK_RESPONSE = BankIdHttpResponse(200, b'{"orderRef": "a", "status": "pending", "hintCode": "started"}', 'collect')
+
+
+def raise_error():
+    try:
+        check_bankid_error(RESPONSE)
+    except BankIdError:
+        pass
+
+
+def raise_error_uncached():
+    # In 1.1 the error description table was built for every error; clearing the caches does the same
+    _invalidate_message_caches()
+    raise_error()
+
+
+BENCHMARKS = {
+    'check_bankid_error[ok]': (lambda: check_bankid_error(OK_RESPONSE), 1),
+    'check_bankid_error[503]': (raise_error, 1),
+    'check_bankid_error[503, legacy]': (raise_error_uncached, 1),
+}
@@ -0,0 +1,48 @@
+"""Per-collect cost of the user message lookup."""
+from bankid6 import CollectStatuses, HintCodes, Messages
+from bankid6.message import get_bankid_collect_message, _collect_message_map, UseTypeMessage, DeviceTypeMessage
+
+
+CASES = [
+    (CollectStatuses.pending, HintCodes.outstandingTransaction),
+    (CollectStatuses.pending, HintCodes.noClient),
+    (CollectStatuses.pending, HintCodes.started),
+    (CollectStatuses.pending, HintCodes.userSign),
+    (CollectStatuses.pending, HintCodes.userCallConfirm),
+    (CollectStatuses.failed, HintCodes.expiredTransaction),
+    (CollectStatuses.failed, HintCodes.startFailed),
+    (CollectStatuses.failed, HintCodes.userDeclinedCall),
+]
+
+
+class CustomMessages(Messages):
+    RFA1 = {'html': '<b>Start your BankID app.</b>'}
+    RFA13 = ('<p>Försöker starta BankID-appen.</p>', '<p>Trying to start your BankID app.</p>')
+
+
+def legacy_collect_message(status, hint_code, is_mobile, messages):
+    """The lookup of 1.1: the message map is built and serialised again on every call."""
+    status_messages = _collect_message_map(messages).get(status)
+    if status_messages is None:
+        return None
+    msg = status_messages.get(hint_code, status_messages['default'])
+    if isinstance(msg, DeviceTypeMessage):
+        msg = msg.mobile if is_mobile else msg.pc
+    if not isinstance(msg, UseTypeMessage):
+        msg = UseTypeMessage(msg)
+    return msg.json()
+
+
+def collect_messages(messages, lookup=get_bankid_collect_message):
+    for status, hint_code in CASES:
+        lookup(status, hint_code, True, messages)
+        lookup(status, hint_code, False, messages)
+
+
+BENCHMARKS = {
+    'get_bankid_collect_message': (lambda: collect_messages(Messages), len(CASES) * 2),
+    'get_bankid_collect_message[custom]': (lambda: collect_messages(CustomMessages), len(CASES) * 2),
+    'get_bankid_collect_message[legacy]': (
+        lambda: collect_messages(Messages, legacy_collect_message), len(CASES) * 2
+    ),
+}
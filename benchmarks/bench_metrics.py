@@ -0,0 +1,27 @@
+"""Cost of recording client metrics for one request and one collect."""
+from bankid6 import BankIdClient
+from bankid6.handlers import BankIdCollectResponse
+from bankid6.metrics import BankIdMetrics
+from bankid6.transport import BankIdHttpResponse
+
+
+CLIENT = BankIdClient(metrics=BankIdMetrics())
+URI = CLIENT._uri('collect')
+COLLECT = BankIdCollectResponse(
+    BankIdHttpResponse(200, b'{"orderRef": "a", "status": "pending", "hintCode": "started"}', URI)
+)
+FAILED = BankIdCollectResponse(
+    BankIdHttpResponse(200, b'{"orderRef": "b", "status": "failed", "hintCode": "userCancel"}', URI)
+)
+
+
+def record_request():
+    endpoint, started = CLIENT._measure(URI)
+    CLIENT._measured(endpoint, started)
+
+
+BENCHMARKS = {
+    'metrics.request': (record_request, 1),
+    'metrics.collect': (lambda: CLIENT._observe_collect(COLLECT, None, (None,)), 1),
+    'metrics.collect.failed': (lambda: CLIENT._observe_collect(FAILED, None, (1700000000,)), 1),
+}
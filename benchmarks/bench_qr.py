@@ -0,0 +1,26 @@
+"""Cost of computing the animated QR code data of one order."""
+import time
+
+from bankid6 import generate_qr_data
+from bankid6.qr import QrFrames
+from bankid6.store import OrderState
+from bankid6.token import OrderTokens
+
+
+ORDER_TIME = int(time.time())
+TOKEN = 'c56e2cd6-c4da-45f1-a104-e59e7cc6d2fa'
+SECRET = '3cd671e5-3389-4134-9565-decc8388bc8c'
+ORDER_REF = '131daac9-16c6-4618-beb0-365768f37288'
+KEY = 'benchmark-order-token-key'
+
+
+_FRAMES = QrFrames(ORDER_TIME, TOKEN, SECRET)
+_TOKENS = OrderTokens(KEY)
+_ORDER_TOKEN = _TOKENS.encode(OrderState(ORDER_REF, ORDER_TIME, TOKEN, SECRET))
+
+BENCHMARKS = {
+    'generate_qr_data': (lambda: generate_qr_data(ORDER_TIME, TOKEN, SECRET), 1),
+    'QrFrames.current': (_FRAMES.current, 1),
+    'OrderTokens.decode': (lambda: _TOKENS.decode(_ORDER_TOKEN), 1),
+    'generate_qr_data(token)': (lambda: generate_qr_data(token=_ORDER_TOKEN, key=KEY), 1),
+}
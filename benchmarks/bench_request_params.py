@@ -0,0 +1,80 @@
+"""Cost of ``RequestParams.clean`` over a realistic mix of requests."""
+import random
+import re
+
+from bankid6.handlers import RequestParams, IPV4_PATTERN, IPV6_PATTERN
+
+
+IPV4 = ['192.168.0.1', '10.12.120.3', '78.66.48.127', '255.255.255.0']
+IPV6 = ['2001:0db8:85a3:0000:0000:8a2e:0370:7334', 'fe80::1ff:fe23:4567:890a', '2001:db8::1', '::1']
+
+SMALL_TEXT = 'Log in to Example AB'
+LARGE_TEXT = '# Agreement\n\n' + 'You agree to the terms of service. ' * 30
+
+
+def payloads(count=200, seed=1):
+    rand = random.Random(seed)
+    result = []
+    for _ in range(count):
+        ip = rand.choice(IPV4 * 3 + IPV6)
+        kind = rand.random()
+        if kind < 0.6:
+            result.append({'orderRef': '894c311b-0bcb-4d65-bb5b-7580c300f098'})
+        elif kind < 0.85:
+            result.append({'endUserIp': ip, 'userVisibleData': SMALL_TEXT})
+        else:
+            result.append({
+                'endUserIp': ip, 'userVisibleData': LARGE_TEXT, 'userVisibleDataFormat': True,
+                'requirement': {'pinCode': True, 'certificatePolicies': ['1.2.752.78.1.5']},
+            })
+    return result
+
+
+class LegacyRequestParams(RequestParams):
+    """Validation of 1.1: validators found by name and patterns matched by string on every call."""
+
+    def _ctype(self, param, value, ctype):
+        try:
+            return ctype(value)
+        except Exception:
+            self._error(param, value, f"Invalid Type. Must be instance of or can be converted to {ctype}")
+
+    def clean_endUserIp(self, value):
+        value = self._ctype('endUserIp', value, str)
+        if not re.match(IPV4_PATTERN.pattern, value) and not re.match(IPV6_PATTERN.pattern, value):
+            self._error('endUserIp', value, "Must be IPV4/IPV6 ip address")
+        return value
+
+    def clean_personalNumber(self, value):
+        value = self._ctype('personalNumber', value, str)
+        if not re.match(r'^\d{12}$', value):
+            self._error('personalNumber', value, "Must be 12 digits")
+        return value
+
+    def clean(self) -> dict:
+        cleaned_data = {}
+        for key in self.kwargs.keys():
+            value = self.kwargs[key]
+            if value is None:
+                continue
+            if hasattr(self, f'clean_{key}'):
+                cleaned_data[key] = getattr(self, f'clean_{key}')(value)
+            else:
+                cleaned_data[key] = value
+        return cleaned_data
+
+
+def clean_all(items, params_class=RequestParams):
+    for kwargs in items:
+        params_class(**kwargs).clean()
+
+
+_ITEMS = payloads()
+
+BENCHMARKS = {
+    'RequestParams.clean[mixed]': (lambda: clean_all(_ITEMS), len(_ITEMS)),
+    'RequestParams.clean[ipv4]': (lambda: RequestParams(endUserIp=IPV4[0]).clean(), 1),
+    'RequestParams.clean[ipv6]': (lambda: RequestParams(endUserIp=IPV6[0]).clean(), 1),
+    'RequestParams.clean[mixed, legacy]': (lambda: clean_all(_ITEMS, LegacyRequestParams), len(_ITEMS)),
+    'RequestParams.clean[ipv4, legacy]': (lambda: LegacyRequestParams(endUserIp=IPV4[0]).clean(), 1),
+}
@@ -0,0 +1,47 @@
+"""Cost of building response objects from decoded BankID responses."""
+import time
+
+from bankid6.codec import default_codec
+from bankid6.handlers import BankIdStartResponse, BankIdCollectResponse
+from bankid6.transport import BankIdHttpResponse
+
+
+CODEC = default_codec()
+URL = 'https://appapi2.test.bankid.com/rp/v6.0/'
+
+START_BODY = CODEC.dumps({
+    'orderRef': '894c311b-0bcb-4d65-bb5b-7580c300f098',
+    'autoStartToken': '79439e65-1862-4b27-aefb-dacdb9e62cba',
+    'qrStartToken': 'c56e2cd6-c4da-45f1-a104-e59e7cc6d2fa',
+    'qrStartSecret': '3cd671e5-3389-4134-9565-decc8388bc8c',
+})
+PENDING_BODY = CODEC.dumps({
+    'orderRef': '894c311b-0bcb-4d65-bb5b-7580c300f098', 'status': 'pending', 'hintCode': 'userSign',
+})
+COMPLETE_BODY = CODEC.dumps({
+    'orderRef': '894c311b-0bcb-4d65-bb5b-7580c300f098',
+    'status': 'complete',
+    'completionData': {
+        'user': {'personalNumber': '197311108711', 'name': 'Jack Sparrow', 'givenName': 'Jack', 'surname': 'Sparrow'},
+        'device': {'ipAddress': '78.66.48.127', 'uhi': 'gjLD+nM+BniMcZyTlPHVg3wu+/eW'},
+        'bankIdIssueDate': '2024-02-12Z',
+        'signature': 'PD94bWwgdmVyc2lvbj0iMS4wIj8+' * 400,
+        'ocspResponse': 'MIIHfgoBAKCCB3cwggdzBgkrBgEFBQcwAQEEggdkMIIHYDCCAT' * 120,
+    },
+})
+QR_ARGS = (int(time.time()), 'c56e2cd6-c4da-45f1-a104-e59e7cc6d2fa', '3cd671e5-3389-4134-9565-decc8388bc8c')
+
+
+def http_response(body, endpoint):
+    return BankIdHttpResponse(200, body, URL + endpoint, codec=CODEC)
+
+
+BENCHMARKS = {
+    'BankIdStartResponse': (lambda: BankIdStartResponse(http_response(START_BODY, 'auth')), 1),
+    'BankIdCollectResponse[pending]': (
+        lambda: BankIdCollectResponse(http_response(PENDING_BODY, 'collect'), QR_ARGS), 1
+    ),
+    'BankIdCollectResponse[complete]': (
+        lambda: BankIdCollectResponse(http_response(COMPLETE_BODY, 'collect'), QR_ARGS), 1
+    ),
+}
@@ -1,5 +1,10 @@
 from .message import Messages
-from .exceptions import BankIdError, BankIdValidationError
+from .exceptions import (
+    BankIdError, BankIdValidationError, BankIdTokenError, BankIdCircuitOpenError, BankIdRateLimitError,
+    BankIdOverloadError
+)
 from .client import BankIdClient
+from .aio import AsyncBankIdClient
+from .poller import CollectPoller
 from .handlers import generate_qr_data
 from .listify import Languages, CollectStatuses, HintCodes, UseTypes
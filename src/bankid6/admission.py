@@ -0,0 +1,184 @@
+"""Admission control for new BankID orders.
+
+An ``AdmissionController`` given to a client as ``admission`` caps the orders a process has
+open at once. ``auth``, ``sign``, ``phone_auth`` and ``phone_sign`` wait in a queue for a free
+slot, or raise ``BankIdOverloadError`` with a ``retry_after`` hint when the queue is full or the
+wait times out::
+
+    admission = AdmissionController(max_orders=200, max_queue=50, queue_timeout=5.0)
+    bankid_client = BankIdClient(admission=admission)
+
+An order holds its slot until a collect returns ``complete`` or ``failed``, it is cancelled,
+BankID reports it unknown, or ``order_ttl`` seconds passed. ``queued`` and ``stats()`` (or the
+``admission`` metrics of ``BankIdMetrics``) show the queue depth and wait times, so autoscaling
+can react before orders start expiring.
+"""
+import asyncio
+import collections
+import threading
+import time
+
+from .exceptions import BankIdOverloadError
+
+
+class AdmissionController():
+    """Caps the live orders at ``max_orders``.
+
+    ``max_queue`` calls may wait for a slot at once (no limit when ``None``, no queue when 0),
+    each for up to ``queue_timeout`` seconds (forever when ``None``). Orders are forgotten
+    ``order_ttl`` seconds after they started, even if never collected to the end.
+    """
+
+    def __init__(
+            self, max_orders: int=100, max_queue: int=None, queue_timeout: float=5.0,
+            order_ttl: float=180.0, clock=time.monotonic
+        ) -> None:
+        self.max_orders = max_orders
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.order_ttl = order_ttl
+        self.clock = clock
+
+        self.admitted = 0
+        self.rejected = 0
+        self.expired = 0
+        self.wait_total = 0.0
+        self.max_wait = 0.0
+
+        self._orders = collections.OrderedDict()
+        self._starting = 0
+        self._queued = 0
+        self._lifetime = 30.0
+        self._cond = threading.Condition(threading.Lock())
+
+    @property
+    def live(self) -> int:
+        """Orders holding a slot, including those whose start call is in flight."""
+        return len(self._orders) + self._starting
+
+    @property
+    def queued(self) -> int:
+        """Calls waiting for a slot."""
+        return self._queued
+
+    def __contains__(self, orderRef: str) -> bool:
+        return orderRef in self._orders
+
+    def _expire(self, now):
+        while self._orders:
+            order_ref, started = next(iter(self._orders.items()))
+            if now - started < self.order_ttl:
+                break
+            del self._orders[order_ref]
+            self.expired += 1
+
+    def _try_admit(self, now, waited):
+        self._expire(now)
+        if len(self._orders) + self._starting >= self.max_orders:
+            return False
+
+        self._starting += 1
+        self.admitted += 1
+        self.wait_total += waited
+        self.max_wait = max(self.max_wait, waited)
+        return True
+
+    def _wake_in(self, now, remaining):
+        """Seconds until the oldest order expires and frees a slot, capped at ``remaining``."""
+        if self._orders:
+            expires_in = next(iter(self._orders.values())) + self.order_ttl - now
+            remaining = expires_in if remaining is None else min(remaining, expires_in)
+        return max(remaining, 0.001) if remaining is not None else None
+
+    def retry_after(self) -> float:
+        """Estimated seconds until a slot frees up for a new caller."""
+        return max(1.0, (self._queued + 1) * self._lifetime / self.max_orders)
+
+    def _reject(self):
+        self.rejected += 1
+        return BankIdOverloadError(self.retry_after(), self.live, self._queued)
+
+    def _enqueue(self):
+        if self.max_queue is not None and self._queued >= self.max_queue:
+            raise self._reject()
+        self._queued += 1
+
+    def admit(self) -> float:
+        """Take a slot for a new order, waiting in the queue if needed. Returns the seconds waited."""
+        started = self.clock()
+        with self._cond:
+            if self._try_admit(started, 0.0):
+                return 0.0
+
+            self._enqueue()
+            try:
+                deadline = started + self.queue_timeout if self.queue_timeout is not None else None
+                while True:
+                    now = self.clock()
+                    remaining = deadline - now if deadline is not None else None
+                    if remaining is not None and remaining <= 0:
+                        raise self._reject()
+                    self._cond.wait(self._wake_in(now, remaining))
+
+                    now = self.clock()
+                    if self._try_admit(now, now - started):
+                        return now - started
+            finally:
+                self._queued -= 1
+
+    async def admit_async(self, poll_interval: float=0.01) -> float:
+        """``admit`` for coroutines, checking for a free slot every ``poll_interval`` seconds."""
+        started = self.clock()
+        with self._cond:
+            if self._try_admit(started, 0.0):
+                return 0.0
+            self._enqueue()
+
+        try:
+            deadline = started + self.queue_timeout if self.queue_timeout is not None else None
+            while True:
+                await asyncio.sleep(poll_interval)
+                now = self.clock()
+                with self._cond:
+                    if self._try_admit(now, now - started):
+                        return now - started
+                    if deadline is not None and now >= deadline:
+                        raise self._reject()
+        finally:
+            with self._cond:
+                self._queued -= 1
+
+    def release(self) -> None:
+        """Give back a slot taken by ``admit`` whose order was never started."""
+        with self._cond:
+            self._starting -= 1
+            self._cond.notify()
+
+    def started(self, orderRef: str) -> None:
+        """Hand the slot taken by ``admit`` to the started order ``orderRef``."""
+        with self._cond:
+            self._starting -= 1
+            self._orders[orderRef] = self.clock()
+
+    def finish(self, orderRef: str) -> None:
+        """Free the slot of ``orderRef``; orders that are unknown or already finished are ignored."""
+        with self._cond:
+            started = self._orders.pop(orderRef, None)
+            if started is None:
+                return
+            self._lifetime = 0.9 * self._lifetime + 0.1 * (self.clock() - started)
+            self._cond.notify()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'live': self.live,
+                'max_orders': self.max_orders,
+                'queued': self._queued,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'expired': self.expired,
+                'mean_wait': self.wait_total / self.admitted if self.admitted else 0.0,
+                'max_wait': self.max_wait,
+                'retry_after': self.retry_after(),
+            }
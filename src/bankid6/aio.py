@@ -0,0 +1,291 @@
+import asyncio
+import ssl
+import time
+import weakref
+from typing import Union
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+from .client import BaseBankIdClient, _ORDER_ATTRS, _NO_ORDER
+from .message import Messages
+from .exceptions import BankIdError, BankIdOverloadError
+from .codec import JsonCodec
+from .transport import BankIdHttpResponse
+from .metrics import BankIdMetrics
+from .tracing import Tracer
+from .compat import context_var, get_running_loop
+from .timing import RequestTimings, aiohttp_trace_config
+from .retry import RetryPolicy, CircuitBreaker
+from .ratelimit import RateLimiter
+from .admission import AdmissionController
+from .token import OrderTokens
+from .store import OrderStore
+
+
+class AsyncBankIdClient(BaseBankIdClient):
+    """asyncio counterpart of ``BankIdClient``.
+
+    All coroutines share one ``aiohttp`` session, so every order driven from the event loop
+    reuses the same pool of mutual-TLS connections. Close it with ``await client.close()`` or
+    use the client as an async context manager.
+    """
+
+    def __init__(
+            self, prod_env: bool=False, cert_pem: str=None, key_pem: str=None, ca_pem: str=None, 
+            request_timeout: int=None, messages: Messages=Messages, is_mobile: bool=False,
+            pool_size: int=100, codec: JsonCodec=None, keep_response: bool=True, base_url: str=None,
+            metrics: BankIdMetrics=None, tracer: Tracer=None, timings: bool=False,
+            retry: RetryPolicy=None, circuit_breaker: CircuitBreaker=None, rate_limiter: RateLimiter=None,
+            admission: AdmissionController=None, store: OrderStore=None,
+            token_key: Union[str, bytes, OrderTokens]=None
+        ) -> None:
+        if aiohttp is None:
+            raise ImportError("AsyncBankIdClient requires aiohttp. Install it with 'pip install bankid6[async]'")
+
+        super().__init__(
+            prod_env=prod_env, cert_pem=cert_pem, key_pem=key_pem, ca_pem=ca_pem,
+            request_timeout=request_timeout, messages=messages, is_mobile=is_mobile, codec=codec,
+            keep_response=keep_response, base_url=base_url, metrics=metrics, tracer=tracer, timings=timings,
+            retry=retry, circuit_breaker=circuit_breaker, rate_limiter=rate_limiter, admission=admission,
+            store=store, token_key=token_key
+        )
+
+        self.pool_size = pool_size
+        self.client = None
+        # Coroutines of one loop share a thread, so the last started order is kept per task
+        self._last = context_var(f'bankid_last_order_{id(self)}')
+
+        self._in_flight = 0
+        if metrics is not None:
+            client_ref = weakref.ref(self)
+            metrics.add_pool(pool_size, lambda: getattr(client_ref(), '_in_flight', 0))
+
+    def _last_order(self):
+        return self._last.get() or _NO_ORDER
+
+    def _remember(self, start_response):
+        self._last.set(tuple(getattr(start_response, attr, None) for attr in _ORDER_ATTRS))
+
+    def _ssl_context(self):
+        context = ssl.create_default_context(cafile=self.ca_pem)
+        context.load_cert_chain(self.cert_pem, self.key_pem)
+        return context
+    
+    def _session(self):
+        if self.client is None or self.client.closed:
+            self.client = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(ssl=self._ssl_context(), limit=self.pool_size),
+                headers={"Content-Type": "application/json"},
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                trace_configs=[aiohttp_trace_config()] if self.timings else None,
+            )
+        return self.client
+    
+    async def close(self):
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+    
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _post(self, uri, json_data):
+        if self.retry is not None or self.circuit_breaker is not None:
+            return await self._post_resilient(uri, json_data)
+        await self._limit(uri)
+        return await self._attempt(uri, json_data)
+
+    async def _limit(self, uri):
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire_async(uri[len(self.api_url):])
+
+    async def _attempt(self, uri, json_data):
+        if self.metrics is not None:
+            return await self._post_measured(uri, json_data)
+        return await self._send(uri, json_data)
+
+    async def _post_resilient(self, uri, json_data):
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            # An open breaker fails the call before it takes a token; every attempt sent takes one
+            self._before_attempt()
+            try:
+                await self._limit(uri)
+            except BaseException:
+                self._attempt_cancelled()
+                raise
+            try:
+                response = await self._attempt(uri, json_data)
+            except Exception as e:
+                self._after_attempt(e)
+                delay = self._retry_delay(uri, e, attempt, started)
+                if delay is None:
+                    raise
+            except BaseException:
+                # asyncio.CancelledError says nothing about BankID, but must free a trial slot
+                self._attempt_cancelled()
+                raise
+            else:
+                self._after_attempt()
+                return response
+
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _post_measured(self, uri, json_data):
+        endpoint, started = self._measure(uri)
+        error = None
+        self._in_flight += 1
+        try:
+            return await self._send(uri, json_data)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._in_flight -= 1
+            self._measured(endpoint, started, error)
+
+    async def _send(self, uri, json_data):
+        with self.tracer.start_span('bankid.http') as span:
+            if self.timings:
+                response = await self._send_timed(uri, json_data)
+            else:
+                async with self._session().post(uri, data=self.codec.dumps(json_data)) as resp:
+                    content = await resp.read()
+                    response = BankIdHttpResponse(
+                        resp.status, content, str(resp.url), dict(resp.headers), codec=self.codec
+                    )
+            span.set_attribute('http.status_code', response.status_code)
+        self._check(response)
+
+        return response
+
+    async def _send_timed(self, uri, json_data):
+        timings = RequestTimings()
+        started = time.perf_counter()
+        async with self._session().post(uri, data=self.codec.dumps(json_data), trace_request_ctx=timings) as resp:
+            read_started = time.perf_counter()
+            content = await resp.read()
+            timings.read = time.perf_counter() - read_started
+
+            response = BankIdHttpResponse(resp.status, content, str(resp.url), dict(resp.headers), codec=self.codec)
+
+        return self._decoded(response, timings, started)
+    
+    async def _initiate_bankid_action(self, url, **kwargs):
+        with self.tracer.start_span(f'bankid.{url}', {'endpoint': url}) as span:
+            data = self._clean(**kwargs)
+            if self.admission is not None:
+                start_response = await self._start_admitted(url, data)
+            else:
+                response = await self._post(self._uri(url), data)
+                start_response = self._start_response(url, response)
+            span.set_attribute('orderRef', start_response.orderRef)
+
+        self._update(start_response)
+        return start_response
+
+    async def _start_admitted(self, url, data):
+        try:
+            self._admitted(await self.admission.admit_async())
+        except BankIdOverloadError:
+            self._admitted(None)
+            raise
+
+        try:
+            response = await self._post(self._uri(url), data)
+            start_response = self._start_response(url, response)
+        except BaseException:
+            self.admission.release()
+            raise
+        self.admission.started(start_response.orderRef)
+        return start_response
+
+    async def auth(
+            self, endUserIp: str, requirement: dict=None, userVisibleData: str=None, 
+            userNonVisibleData: str=None, userVisibleDataFormat: Union[str, bool]=None
+        ):
+        return await self._initiate_bankid_action(
+            'auth', endUserIp=endUserIp, requirement=requirement, userVisibleData=userVisibleData,
+            userNonVisibleData=userNonVisibleData, userVisibleDataFormat=userVisibleDataFormat
+        )
+
+    async def sign(
+            self, endUserIp: str, userVisibleData: str, requirement: dict=None, 
+            userNonVisibleData: str=None, userVisibleDataFormat: Union[str, bool]=None
+        ):
+        return await self._initiate_bankid_action(
+            'sign', endUserIp=endUserIp, userVisibleData=userVisibleData, requirement=requirement,
+            userNonVisibleData=userNonVisibleData, userVisibleDataFormat=userVisibleDataFormat
+        )
+
+    async def phone_auth(
+            self, personalNumber: str, callInitiator: str, requirement: dict=None, userVisibleData: str=None, 
+            userNonVisibleData: str=None, userVisibleDataFormat: Union[str, bool]=None
+        ):
+        return await self._initiate_bankid_action(
+            'phone/auth', personalNumber=personalNumber, callInitiator=callInitiator, 
+            requirement=requirement, userVisibleData=userVisibleData, 
+            userNonVisibleData=userNonVisibleData, userVisibleDataFormat=userVisibleDataFormat
+        )
+
+    async def phone_sign(
+            self, personalNumber: str, callInitiator: str, userVisibleData: str, requirement: dict=None, 
+            userNonVisibleData: str=None, userVisibleDataFormat: Union[str, bool]=None
+        ):
+        return await self._initiate_bankid_action(
+            'phone/sign', personalNumber=personalNumber, callInitiator=callInitiator, 
+            userVisibleData=userVisibleData, requirement=requirement, 
+            userNonVisibleData=userNonVisibleData, userVisibleDataFormat=userVisibleDataFormat
+        )
+
+    async def _stored_async(self, order_ref, order=None):
+        if order is None and self.store is not None and self.store.blocking:
+            # Reading an SQLite or network store would stall every coroutine of the loop
+            return await get_running_loop().run_in_executor(None, self.store.get, order_ref)
+        return self._stored(order_ref, order)
+
+    async def collect(
+            self, orderRef: str=None, qrStartToken: str=None, qrStartSecret: str=None, 
+            order_time: int=None, order=None, token: str=None
+        ):
+        if token is not None:
+            order = self._from_token(token)
+        order_ref = self._order_ref(orderRef, order)
+        order = await self._stored_async(order_ref, order)
+        with self.tracer.start_span('bankid.collect', {'endpoint': 'collect', 'orderRef': order_ref}) as span:
+            data = self._clean(orderRef=order_ref)
+            try:
+                response = await self._post(self._uri('collect'), data)
+            except BankIdError as e:
+                self._order_failed(order_ref, e)
+                raise
+
+            qr_args = self._qr_args(qrStartToken, qrStartSecret, order_time, order, orderRef)
+            collect_response = self._collect_response(response, qr_args, order)
+            span.set_attribute('status', collect_response.status)
+            span.set_attribute('hintCode', collect_response.hintCode)
+
+        return collect_response
+    
+    async def cancel(self, orderRef: str=None, order=None, token: str=None):
+        if token is not None:
+            order = self._from_token(token)
+        order_ref = self._order_ref(orderRef, order)
+        with self.tracer.start_span('bankid.cancel', {'endpoint': 'cancel', 'orderRef': order_ref}):
+            data = self._clean(orderRef=order_ref)
+            try:
+                response = await self._post(self._uri('cancel'), data)
+            except BankIdError as e:
+                self._order_failed(order_ref, e)
+                raise
+            self._order_finished(order_ref)
+
+            return self._cancel_response(response)
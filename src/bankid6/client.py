@@ -1,15 +1,33 @@
 import os
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 from urllib.parse import urljoin
-from typing import Union
+from typing import Union, Iterable
 
 from .handlers import (
     RequestParams, BankIdStartResponse, BankIdPhoneStartResponse, BankIdCollectResponse,
     BankIdCancelResponse
 )
 from .message import Messages
-from .exceptions import check_bankid_error, BankIdValidationError
+from .listify import CollectStatuses
+from .exceptions import (
+    check_bankid_error, BankIdError, BankIdValidationError, BankIdOverloadError
+)
+from .codec import JsonCodec, default_codec
+from .transport import BankIdHttpResponse
+from .metrics import BankIdMetrics
+from .tracing import Tracer, NOOP_TRACER
+from .timing import RequestTimings, TimingHTTPAdapter
+from .retry import RetryPolicy, CircuitBreaker
+from .ratelimit import RateLimiter
+from .admission import AdmissionController
+from .token import OrderTokens
+from .store import OrderStore, OrderState, COMPLETE_TTL, FAILED_TTL
 
 
 BASE_DIR = Path(__file__).resolve().parent
@@ -18,12 +36,39 @@ TEST_CERT_PEM = os.path.join(BASE_DIR, 'certs/testCert.pem')
 TEST_KEY_PEM = os.path.join(BASE_DIR, 'certs/testPrivateKey.pem')
 TEST_CA_PEM = os.path.join(BASE_DIR, 'certs/testCARootCert.pem')
 
+# The last order started by a thread (or, in AsyncBankIdClient, a task), for collect() and cancel() without orderRef
+_ORDER_ATTRS = ('orderRef', 'qrStartToken', 'qrStartSecret', 'order_time')
+_NO_ORDER = (None, None, None, None)
+
+
+def connections_in_use(adapter: HTTPAdapter) -> int:
+    """Connections of ``adapter`` that are checked out by a request right now."""
+    in_use = 0
+    pools = adapter.poolmanager.pools
+    for key in pools.keys():
+        pool = pools.get(key)
+        if pool is not None and pool.pool is not None:
+            in_use += pool.pool.maxsize - pool.pool.qsize()
+    return in_use
 
-class BankIdClient(object):
+
+class BaseBankIdClient(object):
+    """Environment, certificate and order state shared by the sync and async clients.
+
+    The client does not keep any order state of its own that other callers could overwrite.
+    Order initiators return a handle (the start response) carrying its own QR and collect
+    state. For backwards compatibility the last order started is also remembered per thread
+    so that ``collect()``/``cancel()`` without arguments keep working.
+    """
 
     def __init__(
             self, prod_env: bool=False, cert_pem: str=None, key_pem: str=None, ca_pem: str=None, 
-            request_timeout: int=None, messages: Messages=Messages, is_mobile: bool=False
+            request_timeout: int=None, messages: Messages=Messages, is_mobile: bool=False,
+            codec: JsonCodec=None, keep_response: bool=True, base_url: str=None,
+            metrics: BankIdMetrics=None, tracer: Tracer=None, timings: bool=False,
+            retry: RetryPolicy=None, circuit_breaker: CircuitBreaker=None, rate_limiter: RateLimiter=None,
+            admission: AdmissionController=None, store: OrderStore=None,
+            token_key: Union[str, bytes, OrderTokens]=None
         ) -> None:
         if prod_env:
             self.api_url = "https://appapi2.bankid.com/rp/v6.0/"
@@ -40,125 +85,496 @@ class BankIdClient(object):
             self.key_pem = key_pem or TEST_KEY_PEM
             self.cert_pem = cert_pem or TEST_CERT_PEM
             self.ca_pem = ca_pem or TEST_CA_PEM
-        
-        self.client = requests.Session()
-        self.client.verify = self.ca_pem
-        self.client.cert = (self.cert_pem, self.key_pem)
-        self.client.headers = {"Content-Type": "application/json"}
+
+        if base_url:
+            self.api_url = base_url if base_url.endswith('/') else base_url + '/'
 
         self.timeout = request_timeout
         self.messages = messages
         self.is_mobile = is_mobile
+        self.codec = codec or default_codec()
+        self.keep_response = keep_response
+        self.metrics = metrics
+        self.tracer = tracer or NOOP_TRACER
+        self.timings = timings
+        self.retry = retry
+        self.circuit_breaker = circuit_breaker
+        self.rate_limiter = rate_limiter
+        self.admission = admission
+        self.store = store
+        if token_key is None or isinstance(token_key, OrderTokens):
+            self.tokens = token_key
+        else:
+            self.tokens = OrderTokens(token_key)
+        if metrics is not None and admission is not None:
+            metrics.add_admission(admission)
 
-        self._update({})
+        self._local = threading.local()
+
+    def _last_order(self):
+        return getattr(self._local, 'order', None) or _NO_ORDER
+
+    def _remember(self, start_response):
+        self._local.order = tuple(getattr(start_response, attr, None) for attr in _ORDER_ATTRS)
     
+    @property
+    def _orderRef(self):
+        return self._last_order()[0]
+
+    @property
+    def _qrStartToken(self):
+        return self._last_order()[1]
+
+    @property
+    def _qrStartSecret(self):
+        return self._last_order()[2]
+
+    @property
+    def _order_time(self):
+        return self._last_order()[3]
+
+    def _result(self, result):
+        if not self.keep_response:
+            result.response = None
+        return result
+
     def _uri(self, url):
         return urljoin(self.api_url, url)
     
+    def _update(self, start_response):
+        self._remember(start_response)
+        if self.metrics is not None:
+            self.metrics.observe_start(start_response.orderRef)
+        if self.store is not None:
+            self.store.put(OrderState.from_order(start_response))
+
+    def _stored(self, order_ref, order=None):
+        if order is None and self.store is not None:
+            return self.store.get(order_ref)
+        return order
+
+    def _order_is_mobile(self, order):
+        # Order tokens carry the device the order was started for
+        is_mobile = getattr(order, 'is_mobile', None)
+        return self.is_mobile if is_mobile is None else is_mobile
+
+    def _from_token(self, token):
+        if self.tokens is None:
+            raise BankIdValidationError("Order tokens need a client with a token_key")
+        return self.tokens.decode(token)
+
+    def qr_data(self, orderRef: str=None, token: str=None) -> str:
+        """Current QR data of an order token or a stored order.
+
+        ``None`` if the order is unknown, expired or a phone order.
+        """
+        if token is not None:
+            return self._from_token(token).qr_data
+        if self.store is None:
+            raise BankIdValidationError("qr_data(orderRef) needs a client with a store")
+        state = self.store.get(orderRef)
+        if state is not None:
+            return state.qr_data
+    
+    def _measure(self, uri):
+        return uri[len(self.api_url):], time.perf_counter()
+
+    def _measured(self, endpoint, started, error=None):
+        self.metrics.observe_request(endpoint, time.perf_counter() - started)
+        if isinstance(error, BankIdError):
+            self.metrics.observe_error(error)
+
+    def _before_attempt(self):
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.before_call()
+
+    def _after_attempt(self, error=None):
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record(error)
+
+    def _attempt_cancelled(self):
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.cancel()
+
+    def _retry_delay(self, uri, error, attempt, started):
+        if self.retry is None:
+            return None
+        return self.retry.next_delay(uri[len(self.api_url):], error, attempt, time.monotonic() - started)
+
+    def _admitted(self, waited):
+        if self.metrics is not None:
+            self.metrics.observe_admission(waited)
+
+    def _order_finished(self, order_ref):
+        if self.admission is not None:
+            self.admission.finish(order_ref)
+        if self.metrics is not None:
+            self.metrics.forget(order_ref)
+        if self.store is not None:
+            self.store.delete(order_ref)
+
+    def _order_failed(self, order_ref, error):
+        # BankID answers 400 for orders it no longer knows, so they do not hold a slot
+        if error.response_status == 400:
+            self._order_finished(order_ref)
+
+    def _clean(self, **kwargs):
+        with self.tracer.start_span('bankid.validate'):
+            return RequestParams(**kwargs).clean()
+
+    def _start_response(self, url, response):
+        with self.tracer.start_span('bankid.response'):
+            if url.startswith('phone/'):
+                return self._result(BankIdPhoneStartResponse(response, client=self))
+            return self._result(BankIdStartResponse(response, self.is_mobile, client=self))
+
+    def _collect_response(self, response, qr_args, order=None):
+        with self.tracer.start_span('bankid.response'):
+            collect_response = self._result(BankIdCollectResponse(
+                response, qr_args, self.messages, self._order_is_mobile(order),
+                qr_frames=self._qr_frames(order, qr_args)
+            ))
+        if order is not None:
+            order.last_collect = collect_response
+        if collect_response.status != CollectStatuses.pending:
+            if self.admission is not None:
+                self.admission.finish(collect_response.orderRef)
+            if self.store is not None:
+                ttl = COMPLETE_TTL if collect_response.status == CollectStatuses.complete else FAILED_TTL
+                self.store.set_ttl(collect_response.orderRef, ttl)
+        if self.metrics is not None:
+            self._observe_collect(collect_response, order, qr_args)
+
+        return collect_response
+
+    def _cancel_response(self, response):
+        with self.tracer.start_span('bankid.response'):
+            return self._result(BankIdCancelResponse(response))
+
+    def _check(self, response):
+        with self.tracer.start_span('bankid.check_error'):
+            try:
+                check_bankid_error(response, self.messages, self.keep_response)
+            except BankIdError as e:
+                e.timings = getattr(response, 'timings', None)
+                raise
+
+    def _decoded(self, response, timings, started):
+        decode_started = time.perf_counter()
+        try:
+            response.json()
+        except ValueError:
+            pass
+        finished = time.perf_counter()
+
+        timings.decode = finished - decode_started
+        timings.total = finished - started
+        response.timings = timings
+        return response
+
+    def _observe_collect(self, collect_response, order, qr_args):
+        # Orders started in another process carry their start; QR orders at least their order_time
+        started = getattr(order, 'started', None) or qr_args[0]
+        self.metrics.observe_collect(collect_response, started)
+
+    def _order_ref(self, orderRef, order=None):
+        order_ref = orderRef or (order.orderRef if order is not None else self._orderRef)
+        if not order_ref:
+            raise BankIdValidationError("orderRef is empty. Start BankId or give orderRef parameter")
+        
+        return order_ref
+    
+    def _qr_frames(self, order, qr_args):
+        frames = getattr(order, 'qr_frames', None)
+        if frames is not None and (frames.order_time, frames.qrStartToken) == (qr_args[0], qr_args[1]):
+            return frames
+
+    def _qr_args(self, qrStartToken, qrStartSecret, order_time, order=None, orderRef=None):
+        if order is not None:
+            return (
+                order_time or getattr(order, 'order_time', None),
+                qrStartToken or getattr(order, 'qrStartToken', None),
+                qrStartSecret or getattr(order, 'qrStartSecret', None)
+            )
+        if orderRef is not None and orderRef != self._orderRef:
+            # Another order than the last one started here: its QR values are only those given
+            return (order_time, qrStartToken, qrStartSecret)
+
+        return (
+            order_time or self._order_time,
+            qrStartToken or self._qrStartToken,
+            qrStartSecret or self._qrStartSecret
+        )
+
+
+class BankIdClient(BaseBankIdClient):
+
+    def __init__(
+            self, prod_env: bool=False, cert_pem: str=None, key_pem: str=None, ca_pem: str=None, 
+            request_timeout: int=None, messages: Messages=Messages, is_mobile: bool=False,
+            pool_maxsize: int=10, executor: Executor=None, codec: JsonCodec=None,
+            keep_response: bool=True, base_url: str=None, metrics: BankIdMetrics=None,
+            tracer: Tracer=None, timings: bool=False, retry: RetryPolicy=None,
+            circuit_breaker: CircuitBreaker=None, rate_limiter: RateLimiter=None,
+            admission: AdmissionController=None, store: OrderStore=None,
+            token_key: Union[str, bytes, OrderTokens]=None
+        ) -> None:
+        super().__init__(
+            prod_env=prod_env, cert_pem=cert_pem, key_pem=key_pem, ca_pem=ca_pem,
+            request_timeout=request_timeout, messages=messages, is_mobile=is_mobile, codec=codec,
+            keep_response=keep_response, base_url=base_url, metrics=metrics, tracer=tracer, timings=timings,
+            retry=retry, circuit_breaker=circuit_breaker, rate_limiter=rate_limiter, admission=admission,
+            store=store, token_key=token_key
+        )
+        
+        self.pool_maxsize = pool_maxsize
+        self.client = requests.Session()
+        self.client.verify = self.ca_pem
+        self.client.cert = (self.cert_pem, self.key_pem)
+        self.client.headers = {"Content-Type": "application/json"}
+
+        adapter_class = TimingHTTPAdapter if timings else HTTPAdapter
+        adapter = adapter_class(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.client.mount('https://', adapter)
+        self.client.mount('http://', adapter)
+        if metrics is not None:
+            metrics.add_pool(pool_maxsize, partial(connections_in_use, adapter))
+
+        self.executor = executor
+        self._own_executor = None
+        self._executor_lock = threading.Lock()
+    
+    def _get_executor(self, executor=None):
+        if executor is not None:
+            return executor
+        if self.executor is not None:
+            return self.executor
+        
+        with self._executor_lock:
+            if self._own_executor is None:
+                self._own_executor = ThreadPoolExecutor(
+                    max_workers=self.pool_maxsize, thread_name_prefix='bankid6'
+                )
+            return self._own_executor
+    
+    def close(self):
+        with self._executor_lock:
+            if self._own_executor is not None:
+                self._own_executor.shutdown()
+                self._own_executor = None
+        self.client.close()
+    
     def _post(self, uri, json_data):
-        response = self.client.post(uri, json=json_data, timeout=self.timeout)
-        check_bankid_error(response, self.messages)
+        if self.retry is not None or self.circuit_breaker is not None:
+            return self._post_resilient(uri, json_data)
+        self._limit(uri)
+        return self._attempt(uri, json_data)
+
+    def _limit(self, uri):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(uri[len(self.api_url):])
+
+    def _attempt(self, uri, json_data):
+        if self.metrics is not None:
+            return self._post_measured(uri, json_data)
+        return self._send(uri, json_data)
+
+    def _post_resilient(self, uri, json_data):
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            # An open breaker fails the call before it takes a token; every attempt sent takes one
+            self._before_attempt()
+            try:
+                self._limit(uri)
+            except BaseException:
+                self._attempt_cancelled()
+                raise
+            try:
+                response = self._attempt(uri, json_data)
+            except Exception as e:
+                self._after_attempt(e)
+                delay = self._retry_delay(uri, e, attempt, started)
+                if delay is None:
+                    raise
+            except BaseException:
+                # KeyboardInterrupt and the like say nothing about BankID, but must free a trial slot
+                self._attempt_cancelled()
+                raise
+            else:
+                self._after_attempt()
+                return response
+
+            time.sleep(delay)
+            attempt += 1
+
+    def _post_measured(self, uri, json_data):
+        endpoint, started = self._measure(uri)
+        error = None
+        try:
+            return self._send(uri, json_data)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._measured(endpoint, started, error)
+
+    def _send(self, uri, json_data):
+        with self.tracer.start_span('bankid.http') as span:
+            if self.timings:
+                response = self._send_timed(uri, json_data)
+            else:
+                raw = self.client.post(uri, data=self.codec.dumps(json_data), timeout=self.timeout)
+                response = BankIdHttpResponse(
+                    raw.status_code, raw.content, raw.url, raw.headers, codec=self.codec, raw=raw
+                )
+            span.set_attribute('http.status_code', response.status_code)
+        self._check(response)
 
         return response
-    
-    def _update(self, start_response):
-        for attr in ['orderRef', 'qrStartToken', 'qrStartSecret', 'order_time']:
-            setattr(self, '_' + attr, getattr(start_response, attr, None))
+
+    def _send_timed(self, uri, json_data):
+        started = time.perf_counter()
+        raw = self.client.post(uri, data=self.codec.dumps(json_data), timeout=self.timeout, stream=True)
+        timings = getattr(raw, 'timings', None) or RequestTimings()
+
+        read_started = time.perf_counter()
+        content = raw.content
+        timings.read = time.perf_counter() - read_started
+
+        response = BankIdHttpResponse(raw.status_code, content, raw.url, raw.headers, codec=self.codec, raw=raw)
+        return self._decoded(response, timings, started)
     
     def _initiate_bankid_action(self, url, **kwargs):
-        uri = self._uri(url)
-        data = RequestParams(**kwargs).clean()
+        with self.tracer.start_span(f'bankid.{url}', {'endpoint': url}) as span:
+            data = self._clean(**kwargs)
+            if self.admission is not None:
+                start_response = self._start_admitted(url, data)
+            else:
+                response = self._post(self._uri(url), data)
+                start_response = self._start_response(url, response)
+            span.set_attribute('orderRef', start_response.orderRef)
 
-        return self._post(uri, data)
+        self._update(start_response)
+        return start_response
+
+    def _start_admitted(self, url, data):
+        try:
+            self._admitted(self.admission.admit())
+        except BankIdOverloadError:
+            self._admitted(None)
+            raise
+
+        try:
+            response = self._post(self._uri(url), data)
+            start_response = self._start_response(url, response)
+        except BaseException:
+            self.admission.release()
+            raise
+        self.admission.started(start_response.orderRef)
+        return start_response
 
     def auth(
             self, endUserIp: str, requirement: dict=None, userVisibleData: str=None, 
             userNonVisibleData: str=None, userVisibleDataFormat: Union[str, bool]=None
         ):
-        response = self._initiate_bankid_action(
+        return self._initiate_bankid_action(
             'auth', endUserIp=endUserIp, requirement=requirement, userVisibleData=userVisibleData,
             userNonVisibleData=userNonVisibleData, userVisibleDataFormat=userVisibleDataFormat
         )
 
-        start_response = BankIdStartResponse(response, self.is_mobile)
-        self._update(start_response)
-
-        return start_response
-
     def sign(
             self, endUserIp: str, userVisibleData: str, requirement: dict=None, 
             userNonVisibleData: str=None, userVisibleDataFormat: Union[str, bool]=None
         ):
-        response = self._initiate_bankid_action(
+        return self._initiate_bankid_action(
             'sign', endUserIp=endUserIp, userVisibleData=userVisibleData, requirement=requirement,
             userNonVisibleData=userNonVisibleData, userVisibleDataFormat=userVisibleDataFormat
         )
 
-        start_response = BankIdStartResponse(response, self.is_mobile)
-        self._update(start_response)
-
-        return start_response
-
     def phone_auth(
             self, personalNumber: str, callInitiator: str, requirement: dict=None, userVisibleData: str=None, 
             userNonVisibleData: str=None, userVisibleDataFormat: Union[str, bool]=None
         ):
-        response = self._initiate_bankid_action(
+        return self._initiate_bankid_action(
             'phone/auth', personalNumber=personalNumber, callInitiator=callInitiator, 
             requirement=requirement, userVisibleData=userVisibleData, 
             userNonVisibleData=userNonVisibleData, userVisibleDataFormat=userVisibleDataFormat
         )
 
-        start_response = BankIdPhoneStartResponse(response)
-        self._update(start_response)
-
-        return start_response
-
     def phone_sign(
             self, personalNumber: str, callInitiator: str, userVisibleData: str, requirement: dict=None, 
             userNonVisibleData: str=None, userVisibleDataFormat: Union[str, bool]=None
         ):
-        response = self._initiate_bankid_action(
+        return self._initiate_bankid_action(
             'phone/sign', personalNumber=personalNumber, callInitiator=callInitiator, 
             userVisibleData=userVisibleData, requirement=requirement, 
             userNonVisibleData=userNonVisibleData, userVisibleDataFormat=userVisibleDataFormat
         )
 
-        start_response = BankIdPhoneStartResponse(response)
-        self._update(start_response)
-
-        return start_response
-
     def collect(
             self, orderRef: str=None, qrStartToken: str=None, qrStartSecret: str=None, 
-            order_time: int=None
+            order_time: int=None, order=None, token: str=None
         ):
-        uri = self._uri('collect')
-
-        order_ref = orderRef or self._orderRef
-        if not order_ref:
-            raise BankIdValidationError("orderRef is empty. Start BankId or give orderRef parameter")
-
-        data = RequestParams(orderRef=order_ref).clean()
-
-        response = self._post(uri, data)
-
-        qr_args = (
-            order_time or self._order_time,
-            qrStartToken or self._qrStartToken,
-            qrStartSecret or self._qrStartSecret
-        )
-        return BankIdCollectResponse(response, qr_args, self.messages, self.is_mobile)
+        if token is not None:
+            order = self._from_token(token)
+        order_ref = self._order_ref(orderRef, order)
+        order = self._stored(order_ref, order)
+        with self.tracer.start_span('bankid.collect', {'endpoint': 'collect', 'orderRef': order_ref}) as span:
+            data = self._clean(orderRef=order_ref)
+            try:
+                response = self._post(self._uri('collect'), data)
+            except BankIdError as e:
+                self._order_failed(order_ref, e)
+                raise
+
+            qr_args = self._qr_args(qrStartToken, qrStartSecret, order_time, order, orderRef)
+            collect_response = self._collect_response(response, qr_args, order)
+            span.set_attribute('status', collect_response.status)
+            span.set_attribute('hintCode', collect_response.hintCode)
+
+        return collect_response
     
-    def cancel(self, orderRef: str=None):
-        uri = self._uri('cancel')
-
-        order_ref = orderRef or self._orderRef
-        if not order_ref:
-            raise BankIdValidationError("orderRef is empty. Start BankId or give orderRef parameter")
+    def cancel(self, orderRef: str=None, order=None, token: str=None):
+        if token is not None:
+            order = self._from_token(token)
+        order_ref = self._order_ref(orderRef, order)
+        with self.tracer.start_span('bankid.cancel', {'endpoint': 'cancel', 'orderRef': order_ref}):
+            data = self._clean(orderRef=order_ref)
+            try:
+                response = self._post(self._uri('cancel'), data)
+            except BankIdError as e:
+                self._order_failed(order_ref, e)
+                raise
+            self._order_finished(order_ref)
+
+            return self._cancel_response(response)
+
+    def _run_many(self, func, orders, executor):
+        executor = self._get_executor(executor)
+
+        calls = {}
+        for order in orders:
+            # Order handles, stored states and decoded tokens all carry their orderRef
+            order_ref = getattr(order, 'orderRef', order)
+            if order_ref in calls:
+                raise BankIdValidationError(f"Order {order_ref} is given more than once")
+            calls[order_ref] = {'order': order} if hasattr(order, 'orderRef') else {'orderRef': order}
+
+        futures = [(order_ref, executor.submit(func, **kwargs)) for order_ref, kwargs in calls.items()]
+
+        results = {}
+        for order_ref, future in futures:
+            try:
+                results[order_ref] = future.result()
+            except Exception as exc:
+                # Each order gets its own failure, a malformed response as much as a BankID error
+                results[order_ref] = exc
         
-        data = RequestParams(orderRef=order_ref).clean()
-        
-        response = self._post(uri, data)
+        return results
 
-        return BankIdCancelResponse(response)
+    def collect_many(self, orders: Iterable, executor: Executor=None) -> dict:
+        return self._run_many(self.collect, orders, executor)
+    
+    def cancel_many(self, orders: Iterable, executor: Executor=None) -> dict:
+        return self._run_many(self.cancel, orders, executor)
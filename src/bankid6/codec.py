@@ -0,0 +1,39 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class JsonCodec():
+    """Encodes request bodies and decodes response bodies with the standard library."""
+
+    name = 'json'
+
+    def dumps(self, data) -> bytes:
+        return json.dumps(data, separators=(',', ':')).encode('utf-8')
+    
+    def loads(self, content: bytes):
+        return json.loads(content)
+
+
+class OrjsonCodec(JsonCodec):
+    name = 'orjson'
+
+    def __init__(self) -> None:
+        if orjson is None:
+            raise ImportError("OrjsonCodec requires orjson. Install it with 'pip install orjson'")
+
+    def dumps(self, data) -> bytes:
+        return orjson.dumps(data)
+    
+    def loads(self, content: bytes):
+        return orjson.loads(content)
+
+
+def default_codec() -> JsonCodec:
+    """``OrjsonCodec`` when orjson is installed, otherwise ``JsonCodec``."""
+    if orjson is not None:
+        return OrjsonCodec()
+    return JsonCodec()
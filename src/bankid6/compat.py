@@ -0,0 +1,40 @@
+"""Stand-ins for what Python 3.6 lacks, shared by the sync and asyncio code."""
+import asyncio
+import threading
+
+try:
+    from contextvars import ContextVar
+except ImportError:  # pragma: no cover - Python 3.6
+    ContextVar = None
+
+
+class LocalVar(object):
+    """Minimal per-thread stand-in for ``ContextVar`` on Python 3.6."""
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+
+    def get(self):
+        return getattr(self._local, 'value', None)
+
+    def set(self, value):
+        token = self.get()
+        self._local.value = value
+        return token
+
+    def reset(self, token) -> None:
+        self._local.value = token
+
+
+def context_var(name: str):
+    """A ``ContextVar`` defaulting to ``None``, per thread instead of per task on Python 3.6."""
+    if ContextVar is None:
+        return LocalVar()
+    return ContextVar(name, default=None)
+
+
+def get_running_loop() -> asyncio.AbstractEventLoop:
+    """The loop running the calling coroutine."""
+    if hasattr(asyncio, 'get_running_loop'):
+        return asyncio.get_running_loop()
+    return asyncio.get_event_loop()
@@ -0,0 +1,390 @@
+"""One process polling BankID for all workers of a host.
+
+With several worker processes each polling the orders it started, an order watched from
+another worker or browser tab is collected twice. A ``PollCoordinator`` instead owns all
+collect polling of the host: workers register their orders and read the latest collect
+result over a local Unix socket, without calling BankID, so every order is collected once
+per interval however many workers and tabs watch it.
+
+Run the coordinator as its own process next to the workers::
+
+    python -m bankid6.coordinator --socket /run/myapp/bankid.sock --adaptive
+
+and in the workers::
+
+    coordinator = CoordinatorClient('/run/myapp/bankid.sock')
+
+    order = bankid_client.auth('192.168.0.1')
+    coordinator.add(order)
+    ...
+    result = coordinator.collect(orderRef)      # BankIdCollectResponse, None before the first collect
+
+The protocol is length-prefixed frames: a JSON request ``{"op": ...}`` and a reply
+``<status> <body>``, where a ``get`` reply carries the HTTP status and body of BankID's last
+collect response for the order as is.
+"""
+import argparse
+import os
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+
+from .client import BankIdClient
+from .codec import JsonCodec, default_codec
+from .exceptions import BankIdError, BankIdValidationError, check_bankid_error
+from .handlers import BankIdCollectResponse
+from .listify import CollectStatuses
+from .message import Messages
+from .poller import CollectPoller, PollingPolicy, AdaptivePollingPolicy, is_transient
+from .store import COMPLETE_TTL
+from .transport import BankIdHttpResponse
+
+
+_LENGTH = struct.Struct('>I')
+MAX_FRAME = 1 << 20
+
+NO_RESULT = 204
+UNKNOWN_ORDER = 404
+# The collect failed without a BankID error, e.g. on a malformed response; polling of the order ended
+COLLECT_FAILED = 502
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("Coordinator connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def send_frame(sock, payload: bytes) -> None:
+    sock.sendall(_LENGTH.pack(len(payload)) + payload)
+
+
+def recv_frame(sock) -> bytes:
+    size, = _LENGTH.unpack(_recv_exactly(sock, _LENGTH.size))
+    if size > MAX_FRAME:
+        raise ConnectionError(f"Coordinator frame of {size} bytes is too large")
+    return _recv_exactly(sock, size)
+
+
+class _CoordinatorHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        coordinator = self.server.coordinator
+        while True:
+            try:
+                request = recv_frame(self.request)
+            except (ConnectionError, OSError):
+                return
+
+            try:
+                status, body = coordinator.dispatch(coordinator.codec.loads(request))
+            except Exception as e:
+                status, body = 400, coordinator.codec.dumps({'error': f'{type(e).__name__}: {e}'})
+            send_frame(self.request, b'%d %s' % (status, body))
+
+
+class _ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class PollCoordinator():
+    """Polls the registered orders with a ``CollectPoller`` and serves their results on ``path``.
+
+    Results of finished orders are kept ``result_ttl`` seconds for workers that read them late.
+    """
+
+    def __init__(
+            self, client: BankIdClient, path: str, interval: float=2.0, max_workers: int=8,
+            policy: PollingPolicy=None, max_calls_per_second: float=None, result_ttl: float=COMPLETE_TTL
+        ) -> None:
+        self.client = client
+        self.path = path
+        self.result_ttl = result_ttl
+        self.codec = client.codec
+        self.poller = CollectPoller(
+            client, interval=interval, max_workers=max_workers, on_result=self._on_result, policy=policy,
+            max_calls_per_second=max_calls_per_second
+        )
+
+        # orderRef -> (status, body, finished), finished being the time.monotonic() of the final result
+        self._results = {}
+        self._lock = threading.Lock()
+        self._purged = time.monotonic()
+        self._server = None
+        self._thread = None
+
+        self.collects = 0
+        self.reads = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def add(
+            self, orderRef: str, qrStartToken: str=None, qrStartSecret: str=None, order_time: int=None,
+            phone: bool=False, started: float=None
+        ) -> bool:
+        """Start polling ``orderRef``; returns ``False`` if it is already polled or finished."""
+        with self._lock:
+            if orderRef in self._results or orderRef in self.poller:
+                return False
+            self._results[orderRef] = (NO_RESULT, b'null', None)
+        if self.client.metrics is not None:
+            self.client.metrics.observe_start(orderRef, started or order_time)
+        self.poller.add(orderRef, qrStartToken, qrStartSecret, order_time, phone=phone)
+        return True
+
+    def remove(self, orderRef: str) -> bool:
+        with self._lock:
+            self._results.pop(orderRef, None)
+        return self.poller.remove(orderRef)
+
+    def get(self, orderRef: str):
+        """``(status, body)`` of the last collect of ``orderRef``."""
+        with self._lock:
+            self.reads += 1
+            entry = self._results.get(orderRef)
+        if entry is None:
+            return UNKNOWN_ORDER, b'null'
+        return entry[0], entry[1]
+
+    def _on_result(self, order_ref, result):
+        if isinstance(result, BankIdCollectResponse):
+            finished = result.status in (CollectStatuses.complete, CollectStatuses.failed)
+            entry = (200, self.codec.dumps(result.data), time.monotonic() if finished else None)
+        elif is_transient(result):
+            # Connection problems, maintenance and the like: the order is collected again, keep its last result
+            return
+        elif isinstance(result, BankIdError):
+            entry = (result.response_status, self.codec.dumps(result.response_data or {}), time.monotonic())
+        else:
+            body = {'errorCode': 'collectFailed', 'details': f'{type(result).__name__}: {result}'}
+            entry = (COLLECT_FAILED, self.codec.dumps(body), time.monotonic())
+
+        now = time.monotonic()
+        with self._lock:
+            self.collects += 1
+            if order_ref in self._results:
+                self._results[order_ref] = entry
+            if now - self._purged >= 1.0:
+                self._purge(now)
+
+    def _purge(self, now):
+        self._purged = now
+        oldest = now - self.result_ttl
+        for order_ref in [ref for ref, entry in self._results.items() if entry[2] is not None and entry[2] < oldest]:
+            del self._results[order_ref]
+
+    def stats(self) -> dict:
+        return dict(self.poller.stats(), results=len(self._results), collects=self.collects, reads=self.reads)
+
+    def dispatch(self, request: dict):
+        op = request.get('op')
+        if op == 'get':
+            return self.get(request['orderRef'])
+        if op == 'add':
+            added = self.add(
+                request['orderRef'], request.get('qrStartToken'), request.get('qrStartSecret'),
+                request.get('order_time'), bool(request.get('phone')), request.get('started')
+            )
+            return 200, self.codec.dumps(added)
+        if op == 'remove':
+            return 200, self.codec.dumps(self.remove(request['orderRef']))
+        if op == 'stats':
+            return 200, self.codec.dumps(self.stats())
+        return 400, self.codec.dumps({'error': f'Unknown op {op!r}'})
+
+    def _bind(self):
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except OSError:
+                os.unlink(self.path)
+            else:
+                raise RuntimeError(f"A coordinator is already serving {self.path}")
+            finally:
+                probe.close()
+
+        server = _ThreadingUnixServer(self.path, _CoordinatorHandler)
+        server.coordinator = self
+        return server
+
+    def start(self) -> None:
+        """Start polling and serving. Raises ``RuntimeError`` if another coordinator serves ``path``."""
+        if self._server is not None:
+            return
+
+        self._server = self._bind()
+        self.poller.start()
+        self._thread = threading.Thread(target=self._server.serve_forever, name='bankid6-coordinator', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._server is None:
+            return
+
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self.poller.stop()
+        self._server = None
+        self._thread = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def serve_forever(self) -> None:
+        self.start()
+        try:
+            self._thread.join()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+
+class CoordinatorClient():
+    """Worker side of a ``PollCoordinator``. Each thread keeps its own connection to ``path``."""
+
+    def __init__(
+            self, path: str, messages: Messages=Messages, is_mobile: bool=False, codec: JsonCodec=None,
+            timeout: float=2.0
+        ) -> None:
+        self.path = path
+        self.messages = messages
+        self.is_mobile = is_mobile
+        self.codec = codec or default_codec()
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        self._local.sock = sock
+        return sock
+
+    def _call(self, request):
+        payload = self.codec.dumps(request)
+        for attempt in range(2):
+            sock = getattr(self._local, 'sock', None)
+            fresh = sock is None
+            if fresh:
+                sock = self._connect()
+            try:
+                send_frame(sock, payload)
+                reply = recv_frame(sock)
+                break
+            except (ConnectionError, OSError):
+                sock.close()
+                self._local.sock = None
+                # A kept connection may have been closed by a restarted coordinator; retry once
+                if fresh or attempt:
+                    raise
+
+        status, _, body = reply.partition(b' ')
+        return int(status), body
+
+    def close(self) -> None:
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def add(self, order=None, orderRef: str=None, phone: bool=None) -> bool:
+        """Have the coordinator poll a start response or ``orderRef``; ``False`` if it already does."""
+        request = {'op': 'add', 'orderRef': orderRef or order.orderRef}
+        if order is not None:
+            request['order_time'] = getattr(order, 'order_time', None)
+            request['qrStartToken'] = getattr(order, 'qrStartToken', None)
+            request['qrStartSecret'] = getattr(order, 'qrStartSecret', None)
+            request['started'] = getattr(order, 'started', None)
+        if phone is None:
+            phone = order is not None and getattr(order, 'qrStartSecret', None) is None
+        request['phone'] = phone
+
+        status, body = self._call(request)
+        return self.codec.loads(body)
+
+    def remove(self, orderRef: str) -> bool:
+        status, body = self._call({'op': 'remove', 'orderRef': orderRef})
+        return self.codec.loads(body)
+
+    def stats(self) -> dict:
+        status, body = self._call({'op': 'stats'})
+        return self.codec.loads(body)
+
+    def collect(self, orderRef: str=None, order=None) -> BankIdCollectResponse:
+        """The coordinator's last collect result of the order, like ``BankIdClient.collect``.
+
+        Returns ``None`` while the order has not been collected yet and raises ``BankIdError``
+        when BankID answered with an error. ``order``, a start response, adds its QR data.
+        """
+        order_ref = orderRef or (order.orderRef if order is not None else None)
+        if not order_ref:
+            raise BankIdValidationError("orderRef is empty. Give orderRef or order")
+
+        status, body = self._call({'op': 'get', 'orderRef': order_ref})
+        if status == NO_RESULT:
+            return None
+        if status == UNKNOWN_ORDER:
+            raise BankIdValidationError(f"Order {order_ref} is not polled by the coordinator")
+
+        response = BankIdHttpResponse(status, body, f'unix:{self.path}', codec=self.codec)
+        check_bankid_error(response, self.messages)
+        qr_args = (
+            getattr(order, 'order_time', None), getattr(order, 'qrStartToken', None),
+            getattr(order, 'qrStartSecret', None)
+        )
+        return BankIdCollectResponse(response, qr_args, self.messages, self.is_mobile)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m bankid6.coordinator', description='Poll BankID collects for all workers of this host'
+    )
+    parser.add_argument('--socket', required=True, help='path of the Unix socket to serve')
+    parser.add_argument('--interval', type=float, default=2.0, help='seconds between collects of an order')
+    parser.add_argument('--adaptive', action='store_true', help='choose the interval from the hintCode')
+    parser.add_argument('--max-workers', type=int, default=8, help='concurrent collect calls')
+    parser.add_argument('--max-calls-per-second', type=float, help='cap on collect calls per second')
+    parser.add_argument('--prod', action='store_true', help='use the production environment')
+    parser.add_argument('--cert', help='client certificate (defaults to the BankID test certificate)')
+    parser.add_argument('--key', help='private key of --cert')
+    parser.add_argument('--ca', help='CA certificate of the server')
+    parser.add_argument('--base-url', help='RP API base url, e.g. of a bankid6.simulator')
+    parser.add_argument('--timeout', type=float, default=10, help='request timeout in seconds')
+    args = parser.parse_args(argv)
+
+    client = BankIdClient(
+        prod_env=args.prod, cert_pem=args.cert, key_pem=args.key, ca_pem=args.ca, request_timeout=args.timeout,
+        pool_maxsize=args.max_workers, base_url=args.base_url
+    )
+    coordinator = PollCoordinator(
+        client, args.socket, interval=args.interval, max_workers=args.max_workers,
+        policy=AdaptivePollingPolicy() if args.adaptive else None, max_calls_per_second=args.max_calls_per_second
+    )
+    print(f'bankid6 coordinator serving {args.socket}', file=sys.stderr)
+    coordinator.serve_forever()
+    client.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,6 @@
 from requests import Response
 
-from .message import Messages, MesssageDetail
+from .message import Messages, message_cache, compile_for_messages, freeze_message
 
 
 class BankIdError(Exception):
@@ -15,6 +15,7 @@ class BankIdError(Exception):
         self.response = response
         self.response_status = response_status
         self.response_data = response_data
+        self.timings = None
         super().__init__(
             f"response status: {response_status}, errorCode: {error_code}\nreason: {reason}"
         )
@@ -25,21 +26,57 @@ class BankIdValidationError(Exception):
         super().__init__(*args)
 
 
+class BankIdTokenError(BankIdValidationError):
+    """An order token is forged, corrupted, made with an unknown key or expired."""
+
+
+class BankIdCircuitOpenError(Exception):
+    """Raised without calling BankID while the client's circuit breaker is open."""
+
+    def __init__(self, retry_after: float) -> None:
+        self.retry_after = retry_after
+        super().__init__(f"BankID circuit breaker is open, retry after {retry_after:.1f}s")
+
+
+class BankIdRateLimitError(Exception):
+    """Raised without calling BankID when the client's rate limiter does not allow the call in time."""
+
+    def __init__(self, endpoint: str, retry_after: float) -> None:
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+        super().__init__(f"BankID rate limit reached for {endpoint}, retry after {retry_after:.2f}s")
+
+
+class BankIdOverloadError(Exception):
+    """Raised without calling BankID when admission control has no room for a new order."""
+
+    def __init__(self, retry_after: float, live_orders: int, queued: int) -> None:
+        self.retry_after = retry_after
+        self.live_orders = live_orders
+        self.queued = queued
+        super().__init__(
+            f"Too many BankID orders in progress ({live_orders} live, {queued} queued), "
+            f"retry after {retry_after:.1f}s"
+        )
+
+
 class ErrorDescription():
     def __init__(self, reason, action, message=None):
         self.reason = reason
         self.action = action
-        if isinstance(message, MesssageDetail):
-            self.message = message.json()
+        if message is None:
+            self.message = None
         else:
-            self.message = message
+            self.message = freeze_message(message)
 
 
-known_400_errors = ["alreadyInProgress", "invalidParameters", "dummy"]
+known_400_errors = frozenset(["alreadyInProgress", "invalidParameters", "dummy"])
 
+UNKNOWN_ERROR_DESCRIPTION = ErrorDescription(None, None, None)
 
-def get_error_description(status_code, error_code, messages:Messages):
-    ErrorDescriptions = {
+
+def _error_description_map(messages):
+    return {
         400: {
             "alreadyInProgress": ErrorDescription(
                 ("An auth or sign request with a personal number was sent, "
@@ -49,7 +86,7 @@ def get_error_description(status_code, error_code, messages:Messages):
                 ("RP must inform the user that an auth or sign order is already "
                 "in progress for the user. Message RFA4 should be used."),
 
-                messages.RFA4.json()
+                messages.RFA4
             ),
             "invalidParameters": ErrorDescription(
                 ("Invalid parameter. Invalid use of method. Details are found in details.\n\n"
@@ -77,7 +114,7 @@ def get_error_description(status_code, error_code, messages:Messages):
                 ("RP may inform the user that the cancelled was successful. "
                 "Message RFA3 should be used."),
 
-                messages.RFA3.json()
+                messages.RFA3
             ),
             "unknownError": ErrorDescription(
                 ("We may introduce new error codes without prior notice. "
@@ -88,7 +125,7 @@ def get_error_description(status_code, error_code, messages:Messages):
                 "RP should update their implementation to support the new "
                 "errorCode as soon as possible."),
 
-                messages.RFA22.json()
+                messages.RFA22
             )
         },
         401: {
@@ -137,7 +174,7 @@ def get_error_description(status_code, error_code, messages:Messages):
                 "at RP or the communication is too slow. RP must inform the user. "
                 "Message RFA5 should be used."),
 
-                messages.RFA5.json()
+                messages.RFA5
             )
         },
         415: {
@@ -155,7 +192,7 @@ def get_error_description(status_code, error_code, messages:Messages):
 
                 "RP must not automatically try again. RP must inform the user. Message RFA5 should be used.",
 
-                messages.RFA5.json()
+                messages.RFA5
             )
         },
         503: {
@@ -165,18 +202,38 @@ def get_error_description(status_code, error_code, messages:Messages):
                 ("RP may try again without informing the user. If this error is returned repeatedly, "
                 "RP must inform the user. Message RFA5 should be used."),
 
-                messages.RFA5.json()
+                messages.RFA5
             )
         }
     }
 
+
+def _build_error_description_table(messages):
+    return {
+        (status_code, error_code): description
+        for status_code, descriptions in _error_description_map(messages).items()
+        for error_code, description in descriptions.items()
+    }
+
+
+_error_description_tables = message_cache()
+
+
+def compile_error_descriptions(messages: Messages=Messages) -> dict:
+    """Error descriptions of ``messages`` keyed by ``(status_code, errorCode)``. Built once per messages class."""
+    return compile_for_messages(_error_description_tables, messages, _build_error_description_table)
+
+
+def get_error_description(status_code, error_code, messages:Messages):
     try:
-        return ErrorDescriptions[status_code][error_code]
+        table = _error_description_tables[id(messages)][0]
     except KeyError:
-        return ErrorDescription(None, None, None)
+        table = compile_error_descriptions(messages)
+    
+    return table.get((status_code, error_code), UNKNOWN_ERROR_DESCRIPTION)
 
 
-def check_bankid_error(response, messages: Messages=Messages):
+def check_bankid_error(response, messages: Messages=Messages, keep_response: bool=True):
     try:
         response_data = response.json()
     except Exception:
@@ -200,7 +257,7 @@ def check_bankid_error(response, messages: Messages=Messages):
             action=error_description.action,
             message=error_description.message,
             error_code=error_code,
-            response=response,
+            response=response if keep_response else None,
             response_status=status_code,
             response_data=response_data
         )
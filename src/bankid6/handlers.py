@@ -4,20 +4,81 @@ import hmac
 import json
 import re
 import base64
-from datetime import datetime
+from datetime import datetime, timezone
+from functools import lru_cache
 import urllib.parse
+from sys import intern
 
 from requests import Response
 
 from .listify import CollectStatuses
+from .qr import QrFrames
+from .signature import (
+    BankIdSignedData, BankIdOcspResponse, decode_base64, parse_signed_data, parse_ocsp_response
+)
 from .message import get_bankid_collect_message
-from .exceptions import BankIdValidationError
+from .exceptions import BankIdValidationError, BankIdTokenError
 from .message import Messages
+from .transport import BankIdHttpResponse
+from .token import encode_order_token, decode_order_token
+
+
+IPV4_PATTERN = re.compile(
+    r'^((25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)$'
+)
+IPV6_PATTERN = re.compile(
+    r'^([0-9a-fA-F]{1,4}:){7,7}[0-9a-fA-F]{1,4}$|^([0-9a-fA-F]{1,4}:){1,7}:'
+    r'|([0-9a-fA-F]{1,4}:){1,6}:[0-9a-fA-F]{1,4}$|^([0-9a-fA-F]{1,4}:){1,5}'
+    r'(:[0-9a-fA-F]{1,4}){1,2}$|^([0-9a-fA-F]{1,4}:){1,4}(:[0-9a-fA-F]{1,4})'
+    r'{1,3}$|^([0-9a-fA-F]{1,4}:){1,3}(:[0-9a-fA-F]{1,4}){1,4}$|^([0-9a-fA-F]'
+    r'{1,4}:){1,2}(:[0-9a-fA-F]{1,4}){1,5}$|^[0-9a-fA-F]{1,4}:((:[0-9a-fA-F]'
+    r'{1,4}){1,6})$|:((:[0-9a-fA-F]{1,4}){1,7}|:)$'
+)
+PERSONAL_NUMBER_PATTERN = re.compile(r'^\d{12}$')
+
+
+def is_ip_address(value: str) -> bool:
+    return IPV4_PATTERN.match(value) is not None or IPV6_PATTERN.match(value) is not None
+
+
+class CompiledRequestParams():
+    """Validator table of a ``RequestParams`` class, built once per class."""
+
+    __slots__ = ('validators', 'is_ip_address')
+
+    def __init__(self, params_class) -> None:
+        self.validators = {
+            name[len('clean_'):]: getattr(params_class, name)
+            for name in dir(params_class)
+            if name.startswith('clean_') and callable(getattr(params_class, name))
+        }
+
+        if params_class.ip_cache_size:
+            self.is_ip_address = lru_cache(maxsize=params_class.ip_cache_size)(is_ip_address)
+        else:
+            self.is_ip_address = is_ip_address
+
+
+def compile_request_params(params_class) -> CompiledRequestParams:
+    # Kept on the class itself, so classes created at runtime are freed together with their table
+    try:
+        return params_class.__dict__['_compiled_params']
+    except KeyError:
+        compiled = params_class._compiled_params = CompiledRequestParams(params_class)
+        return compiled
 
 
 class RequestParams():
+    # Bounded LRU of endUserIp validation results. Set to 0 (before first use) to disable.
+    ip_cache_size = 1024
+    requirement_keys = ('pinCode', 'mrtd', 'cardReader', 'certificatePolicies', 'personalNumber')
+
     def __init__(self, **kwrags):
         self.kwargs = kwrags
+        try:
+            self._compiled = type(self).__dict__['_compiled_params']
+        except KeyError:
+            self._compiled = compile_request_params(type(self))
     
     def _error(self, param, value, message):
         raise BankIdValidationError(
@@ -25,6 +86,9 @@ class RequestParams():
         )
     
     def _ctype(self, param, value, ctype):
+        if type(value) is ctype:
+            return value
+
         try:
             return ctype(value)
         except:
@@ -36,19 +100,7 @@ class RequestParams():
     def clean_endUserIp(self, value):
         value = self._ctype('endUserIp', value, str)
 
-        ipv4_pattern = (
-            r'^((25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)$'
-        )
-        ipv6_pattern = (
-            r'^([0-9a-fA-F]{1,4}:){7,7}[0-9a-fA-F]{1,4}$|^([0-9a-fA-F]{1,4}:){1,7}:'
-            r'|([0-9a-fA-F]{1,4}:){1,6}:[0-9a-fA-F]{1,4}$|^([0-9a-fA-F]{1,4}:){1,5}'
-            r'(:[0-9a-fA-F]{1,4}){1,2}$|^([0-9a-fA-F]{1,4}:){1,4}(:[0-9a-fA-F]{1,4})'
-            r'{1,3}$|^([0-9a-fA-F]{1,4}:){1,3}(:[0-9a-fA-F]{1,4}){1,4}$|^([0-9a-fA-F]'
-            r'{1,4}:){1,2}(:[0-9a-fA-F]{1,4}){1,5}$|^[0-9a-fA-F]{1,4}:((:[0-9a-fA-F]'
-            r'{1,4}){1,6})$|:((:[0-9a-fA-F]{1,4}){1,7}|:)$'
-        )
-
-        if not re.match(ipv4_pattern, value) and not re.match(ipv6_pattern, value):
+        if not self._compiled.is_ip_address(value):
             self._error('endUserIp', value, "Must be IPV4/IPV6 ip address")
         
         return value
@@ -81,7 +133,7 @@ class RequestParams():
     def clean_personalNumber(self, value):
         value = self._ctype('personalNumber', value, str)
 
-        if not re.match(r'^\d{12}$', value):
+        if not PERSONAL_NUMBER_PATTERN.match(value):
             self._error('personalNumber', value, "Must be 12 digits")
 
         return value
@@ -89,9 +141,10 @@ class RequestParams():
     def clean_callInitiator(self, value):
         value = self._ctype('callInitiator', value, str)
 
-        if value.lower() == "rp": 
+        lower_value = value.lower()
+        if lower_value == "rp": 
             return "RP"
-        if value.lower() == "user":
+        if lower_value == "user":
             return "user"
             
         self._error('callInitiator', value, "Value must be 'RP' or 'user'")
@@ -99,16 +152,12 @@ class RequestParams():
     def clean_requirement(self, value):
         value = self._ctype('requirement', value, dict)
         
-        valid_keys = [
-            'pinCode', 'mrtd', 'cardReader', 'certificatePolicies', 'personalNumber'
-        ]
+        for key in value:
+            if key not in self.requirement_keys:
+                self._error(
+                    'requirement', key, f"Invalid key. valid keys: {list(self.requirement_keys)}"
+                )
 
-        [
-            self._error(
-                'requirement', key, f"Invalid key. valid keys: {valid_keys}"
-            )
-            for key in value.keys() if key not in valid_keys
-        ]
         if value.get('personalNumber'):
             self.clean_personalNumber(value['personalNumber'])
         
@@ -127,33 +176,57 @@ class RequestParams():
         return self._ctype('qrStartToken', value, str)
 
     def clean(self) -> dict:
+        validators = self._compiled.validators
         cleaned_data = {}
 
-        for key in self.kwargs.keys():
-            value = self.kwargs[key]
+        for key, value in self.kwargs.items():
             if value is None:
                 continue
 
-            if hasattr(self, f'clean_{key}'):
-                cleaned_data[key] = getattr(self, f'clean_{key}')(value)
-            else:
+            validator = validators.get(key)
+            if validator is None:
                 cleaned_data[key] = value
+            else:
+                cleaned_data[key] = validator(self, value)
         
         return cleaned_data
 
 
-def generate_qr_data(order_time, qr_start_token, qr_start_secret):
+def generate_qr_data(order_time=None, qr_start_token=None, qr_start_secret=None, token: str=None, key=None):
+    """QR data of an order, from its start values or from an order ``token`` made with ``key``."""
+    if token is not None:
+        if key is None:
+            raise BankIdTokenError("Decoding an order token needs the key it was made with")
+        state = decode_order_token(token, key)
+        order_time, qr_start_token, qr_start_secret = state.order_time, state.qrStartToken, state.qrStartSecret
+        if qr_start_secret is None:
+            raise BankIdValidationError("The order token has no QR code start values")
+
     qr_time = str(int(time.time() - int(order_time)))
     qr_auth_code = hmac.new(qr_start_secret.encode(), qr_time.encode(), hashlib.sha256).hexdigest()
     return ".".join(["bankid", qr_start_token, qr_time, qr_auth_code])
 
 
+def _order_token(order, key):
+    if key is not None:
+        return encode_order_token(order, key)
+
+    tokens = getattr(order._client, 'tokens', None)
+    if tokens is None:
+        raise BankIdValidationError("Give a key or start the order with a client that has a token_key")
+    return tokens.encode(order)
+
+
 class BankIdBaseResponse():
+    # __dict__ keeps attributes set by callers working; it is only allocated when used
+    __slots__ = ('response', 'status_code', 'data', 'url', 'timings', '__dict__')
+
     def __init__(self, response: Response):
         self.response = response
         self.status_code = response.status_code
         self.data = response.json()
         self.url = response.url
+        self.timings = response.timings if isinstance(response, BankIdHttpResponse) else None
     
     def __str__(self) -> str:
         return (
@@ -169,8 +242,43 @@ class BankIdBaseResponse():
         )
 
 
-class BankIdStartResponse(BankIdBaseResponse):
-    def __init__(self, response, is_mobile: bool=True):
+class BankIdOrder():
+    """Order handle behaviour shared by the start responses.
+
+    A start response returned by a client carries everything needed to follow up on its own
+    order, so one client can serve any number of concurrent orders.
+    """
+
+    __slots__ = ()
+
+    def _bind(self, client):
+        self._client = client
+        self.last_collect = None
+
+    def _bound_client(self):
+        if self._client is None:
+            raise BankIdValidationError("Order is not bound to a client. Use the client's collect/cancel")
+        return self._client
+
+    @property
+    def status(self):
+        if self.last_collect is not None:
+            return self.last_collect.status
+    
+    def collect(self):
+        return self._bound_client().collect(order=self)
+    
+    def cancel(self):
+        return self._bound_client().cancel(order=self)
+
+
+class BankIdStartResponse(BankIdBaseResponse, BankIdOrder):
+    __slots__ = (
+        'orderRef', 'autoStartToken', 'qrStartToken', 'qrStartSecret', 'order_time', '_is_mobile',
+        '_qr_frames', '_client', 'last_collect'
+    )
+
+    def __init__(self, response, is_mobile: bool=True, client=None):
         super().__init__(response)
         
         self.orderRef = str(self.data['orderRef'])
@@ -180,6 +288,8 @@ class BankIdStartResponse(BankIdBaseResponse):
 
         self.order_time = int(time.time())
         self._is_mobile = is_mobile
+        self._qr_frames = None
+        self._bind(client)
 
     def launch_url(self, redirect='null'):
         redirect = urllib.parse.quote_plus(redirect)
@@ -187,19 +297,38 @@ class BankIdStartResponse(BankIdBaseResponse):
             return f'https://app.bankid.com/?autostarttoken={self.autoStartToken}&redirect={redirect}'
         return f"bankid:///?autostarttoken={self.autoStartToken}&redirect={redirect}"
     
+    @property
+    def qr_frames(self) -> QrFrames:
+        if self._qr_frames is None:
+            self._qr_frames = QrFrames(self.order_time, self.qrStartToken, self.qrStartSecret)
+        return self._qr_frames
+
     @property
     def qr_data(self):
-        return generate_qr_data(self.order_time, self.qrStartToken, self.qrStartSecret)
+        return self.qr_frames.current()
 
+    def to_token(self, key=None) -> str:
+        """Encrypted token of this order, made with ``key`` or the ``token_key`` of the client."""
+        return _order_token(self, key)
 
-class BankIdPhoneStartResponse(BankIdBaseResponse):
-    def __init__(self, response):
+
+class BankIdPhoneStartResponse(BankIdBaseResponse, BankIdOrder):
+    __slots__ = ('orderRef', '_client', 'last_collect')
+
+    def __init__(self, response, client=None):
         super().__init__(response)
 
         self.orderRef = str(self.data['orderRef'])
+        self._bind(client)
+
+    def to_token(self, key=None) -> str:
+        """Encrypted token of this order, made with ``key`` or the ``token_key`` of the client."""
+        return _order_token(self, key)
 
 
 class BankIdCompletionUserData():
+    __slots__ = ('personalNumber', 'name', 'givenName', 'surname')
+
     def __init__(self, completion_data_user) -> None:
         self.personalNumber = completion_data_user.get('personalNumber')
         self.name = completion_data_user.get('name')
@@ -208,59 +337,144 @@ class BankIdCompletionUserData():
 
 
 class BankIdCompletionDeviceData():
+    __slots__ = ('ipAddress', 'uhi')
+
     def __init__(self, completion_data_device) -> None:
         self.ipAddress = completion_data_device.get('ipAddress')
         self.uhi = completion_data_device.get('uhi')
 
 
+_NOT_PARSED = object()
+
+
+def parse_issue_date(value: str) -> datetime:
+    """Parse ``bankIdIssueDate`` (``%Y-%m-%d%z``) with a fast path for the usual ``YYYY-MM-DDZ``."""
+    if len(value) == 11 and value[10] == 'Z' and value[4] == '-' and value[7] == '-':
+        try:
+            return datetime(int(value[:4]), int(value[5:7]), int(value[8:10]), tzinfo=timezone.utc)
+        except ValueError:
+            pass
+    return datetime.strptime(value, '%Y-%m-%d%z')
+
+
 class BankIdCompletionData():
+    """Completion data of a complete order.
+
+    Sub-objects, the issue date and the decoded signature and OCSP response are built on first
+    access and cached.
+    """
+
+    __slots__ = (
+        'json', '_user', '_device', '_bankIdIssueDate', '_signature_bytes', '_signed_data',
+        '_ocsp_response_bytes', '_ocsp'
+    )
+
     def __init__(self, completion_data) -> None:
         self.json = completion_data
+        self._user = self._device = self._bankIdIssueDate = _NOT_PARSED
+        self._signature_bytes = self._signed_data = _NOT_PARSED
+        self._ocsp_response_bytes = self._ocsp = _NOT_PARSED
 
-        if completion_data.get('user'):
-            self.user = BankIdCompletionUserData(completion_data['user'])
-        else:
-            self.user = None
-        
-        if completion_data.get('device'):
-            self.device = BankIdCompletionDeviceData(completion_data['device'])
-        else:
-            self.device = None
-        
-        if completion_data.get('bankIdIssueDate'):
-            self.bankIdIssueDate = datetime.strptime(completion_data['bankIdIssueDate'], '%Y-%m-%d%z')
-        else:
-            self.bankIdIssueDate = None 
-        self.stepUp = completion_data.get('stepUp')
-        self.signature = completion_data.get('signature')
-        self.ocspResponse = completion_data.get('ocspResponse')
+    @property
+    def user(self) -> BankIdCompletionUserData:
+        if self._user is _NOT_PARSED:
+            user = self.json.get('user')
+            self._user = BankIdCompletionUserData(user) if user else None
+        return self._user
+
+    @property
+    def device(self) -> BankIdCompletionDeviceData:
+        if self._device is _NOT_PARSED:
+            device = self.json.get('device')
+            self._device = BankIdCompletionDeviceData(device) if device else None
+        return self._device
+
+    @property
+    def bankIdIssueDate(self) -> datetime:
+        if self._bankIdIssueDate is _NOT_PARSED:
+            issue_date = self.json.get('bankIdIssueDate')
+            self._bankIdIssueDate = parse_issue_date(issue_date) if issue_date else None
+        return self._bankIdIssueDate
+
+    @property
+    def stepUp(self):
+        return self.json.get('stepUp')
+
+    @property
+    def signature(self) -> str:
+        return self.json.get('signature')
+
+    @property
+    def ocspResponse(self) -> str:
+        return self.json.get('ocspResponse')
+
+    @property
+    def signature_bytes(self) -> memoryview:
+        """The signature XML decoded from base64."""
+        if self._signature_bytes is _NOT_PARSED:
+            self._signature_bytes = decode_base64(self.signature) if self.signature else None
+        return self._signature_bytes
+
+    @property
+    def signed_data(self) -> BankIdSignedData:
+        if self._signed_data is _NOT_PARSED:
+            signature = self.signature_bytes
+            self._signed_data = parse_signed_data(signature) if signature is not None else None
+        return self._signed_data
+
+    @property
+    def ocsp_response_bytes(self) -> memoryview:
+        """The DER encoded OCSP response decoded from base64."""
+        if self._ocsp_response_bytes is _NOT_PARSED:
+            ocsp = self.ocspResponse
+            self._ocsp_response_bytes = decode_base64(ocsp) if ocsp else None
+        return self._ocsp_response_bytes
+
+    @property
+    def ocsp(self) -> BankIdOcspResponse:
+        if self._ocsp is _NOT_PARSED:
+            ocsp = self.ocsp_response_bytes
+            self._ocsp = parse_ocsp_response(ocsp) if ocsp is not None else None
+        return self._ocsp
 
 
 class BankIdCollectResponse(BankIdBaseResponse):
-    def __init__(self, response, qr_args=[], messages=Messages, is_mobile=True):
+    __slots__ = ('orderRef', 'status', 'hintCode', 'message', 'completionData', '_qr_args', '_qr_frames')
+
+    def __init__(self, response, qr_args=[], messages=Messages, is_mobile=True, qr_frames=None):
         super().__init__(response)
 
         self.orderRef = str(self.data['orderRef'])
-        self.status = str(self.data['status'])
+        # Interned so that cached responses share the few distinct status/hintCode strings
+        self.status = self.data['status'] = intern(str(self.data['status']))
         if self.status == CollectStatuses.complete:
             self.hintCode = None
             self.message = None
             self.completionData = BankIdCompletionData(self.data['completionData'])
         else:
-            self.hintCode = self.data['hintCode']
+            self.hintCode = self.data['hintCode'] = intern(str(self.data['hintCode']))
             self.message = get_bankid_collect_message(
                 self.status, self.hintCode, is_mobile, messages
             )
             self.completionData = None
         
         self._qr_args = qr_args
+        self._qr_frames = qr_frames
+
+    @property
+    def qr_frames(self) -> QrFrames:
+        if self._qr_frames is None and self._qr_args and all(self._qr_args):
+            self._qr_frames = QrFrames(*self._qr_args)
+        return self._qr_frames
 
     @property
     def qr_data(self):
-        if self._qr_args and all(self._qr_args):
-            return generate_qr_data(*self._qr_args)
+        if self.qr_frames is not None:
+            return self.qr_frames.current()
 
 
 class BankIdCancelResponse(BankIdBaseResponse):
+    __slots__ = ()
+
     def __init__(self, response):
         super().__init__(response)
@@ -0,0 +1,315 @@
+"""Load generator for a BankID RP API, normally the local ``bankid6.simulator``.
+
+Every simulated user runs ``auth`` or ``sign`` -> ``collect`` until the order completes,
+fails or is cancelled, then starts over. Load is ramped through the ``--users`` steps and
+each step reports requests per second and p50/p95/p99/max latency per endpoint::
+
+    python -m bankid6.loadtest --users 10,50,100 --step-duration 30 --output report.json
+    python -m bankid6.loadtest --simulator --users 20 --step-duration 5
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import threading
+import time
+from typing import Callable, Dict, List
+
+import requests
+
+from .client import BankIdClient
+from .exceptions import BankIdError
+from .listify import CollectStatuses
+
+
+class LatencyHistogram(object):
+    """HDR-style histogram of latencies in microseconds.
+
+    Values are kept in log-linear buckets with ``2 ** (sub_bucket_bits - 1)`` linear steps per
+    power of two, so every recorded value is accurate to better than ``1 / 2 ** (sub_bucket_bits - 1)``
+    (about 1.6% with the default) whatever its magnitude, in a few hundred counters.
+    """
+
+    __slots__ = ('sub_bucket_bits', 'counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self, sub_bucket_bits: int=7) -> None:
+        self.sub_bucket_bits = sub_bucket_bits
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value: int) -> int:
+        shift = value.bit_length() - self.sub_bucket_bits
+        if shift <= 0:
+            return value
+        half = 1 << (self.sub_bucket_bits - 1)
+        return (shift + 1) * half + (value >> shift) - half
+
+    def _highest_value(self, index: int) -> int:
+        sub_buckets = 1 << self.sub_bucket_bits
+        if index < sub_buckets:
+            return index
+        half = sub_buckets >> 1
+        shift = (index - sub_buckets) // half + 1
+        mantissa = (index - sub_buckets) % half + half
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, seconds: float) -> None:
+        value = int(seconds * 1e6)
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: 'LatencyHistogram') -> None:
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent: float) -> int:
+        """Latency in microseconds that ``percent`` of the values are at or below."""
+        if not self.count:
+            return 0
+
+        rank = max(1, int(percent / 100 * self.count + 0.5))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._highest_value(index), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        """Count and latencies in milliseconds."""
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count / 1000, 3) if self.count else 0,
+            'min_ms': (self.min or 0) / 1000,
+            'p50_ms': self.percentile(50) / 1000,
+            'p95_ms': self.percentile(95) / 1000,
+            'p99_ms': self.percentile(99) / 1000,
+            'max_ms': self.max / 1000,
+        }
+
+
+class _UserStats(object):
+    __slots__ = ('latencies', 'errors', 'orders')
+
+    def __init__(self) -> None:
+        self.latencies = {}
+        self.errors = {}
+        self.orders = {}
+
+
+class LoadTest(object):
+    """Runs simulated users against ``client``, one thread per user.
+
+    ``sign_ratio`` is the share of orders started with ``sign`` instead of ``auth``,
+    ``cancel_ratio`` the share cancelled after the first collect, and ``poll_interval`` the
+    seconds a user waits between collects.
+    """
+
+    def __init__(
+            self, client: BankIdClient, sign_ratio: float=0.5, cancel_ratio: float=0.0,
+            poll_interval: float=0.1, end_user_ip: str='127.0.0.1'
+        ) -> None:
+        self.client = client
+        self.sign_ratio = sign_ratio
+        self.cancel_ratio = cancel_ratio
+        self.poll_interval = poll_interval
+        self.end_user_ip = end_user_ip
+
+    def _call(self, stats: _UserStats, endpoint: str, func: Callable, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except BankIdError as e:
+            error = e.errorCode or str(e.response_status)
+            stats.errors[(endpoint, error)] = stats.errors.get((endpoint, error), 0) + 1
+        except requests.RequestException as e:
+            error = type(e).__name__
+            stats.errors[(endpoint, error)] = stats.errors.get((endpoint, error), 0) + 1
+        finally:
+            histogram = stats.latencies.get(endpoint)
+            if histogram is None:
+                histogram = stats.latencies[endpoint] = LatencyHistogram()
+            histogram.record(time.perf_counter() - started)
+
+    def _order(self, stats: _UserStats, rng: random.Random, stop: threading.Event) -> None:
+        if rng.random() < self.sign_ratio:
+            order = self._call(stats, 'sign', self.client.sign, self.end_user_ip, 'Load test')
+        else:
+            order = self._call(stats, 'auth', self.client.auth, self.end_user_ip)
+        if order is None:
+            return
+
+        cancel = rng.random() < self.cancel_ratio
+        outcome = 'error'
+        while not stop.is_set():
+            if self.poll_interval:
+                stop.wait(self.poll_interval)
+
+            result = self._call(stats, 'collect', self.client.collect, order=order)
+            if result is None:
+                break
+            if result.status != CollectStatuses.pending:
+                outcome = result.status
+                break
+            if cancel:
+                if self._call(stats, 'cancel', self.client.cancel, order=order) is not None:
+                    outcome = 'cancelled'
+                break
+        else:
+            outcome = 'unfinished'
+
+        stats.orders[outcome] = stats.orders.get(outcome, 0) + 1
+
+    def _user(self, stats: _UserStats, seed: int, stop: threading.Event) -> None:
+        rng = random.Random(seed)
+        while not stop.is_set():
+            self._order(stats, rng, stop)
+
+    def run_step(self, users: int, duration: float) -> dict:
+        """Run ``users`` concurrent users for ``duration`` seconds and return the step report."""
+        stop = threading.Event()
+        user_stats = [_UserStats() for _ in range(users)]
+        threads = [
+            threading.Thread(target=self._user, args=(stats, i, stop), daemon=True)
+            for i, stats in enumerate(user_stats)
+        ]
+
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        stop.wait(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        latencies = {}
+        errors = {}
+        orders = {}
+        for stats in user_stats:
+            for endpoint, histogram in stats.latencies.items():
+                latencies.setdefault(endpoint, LatencyHistogram()).merge(histogram)
+            for (endpoint, error), count in stats.errors.items():
+                errors.setdefault(endpoint, {})
+                errors[endpoint][error] = errors[endpoint].get(error, 0) + count
+            for outcome, count in stats.orders.items():
+                orders[outcome] = orders.get(outcome, 0) + count
+
+        total = LatencyHistogram()
+        endpoints = {}
+        for endpoint, histogram in sorted(latencies.items()):
+            total.merge(histogram)
+            endpoints[endpoint] = dict(
+                histogram.summary(), rps=round(histogram.count / elapsed, 1), errors=errors.get(endpoint, {})
+            )
+
+        return {
+            'users': users,
+            'duration_s': round(elapsed, 3),
+            'requests': total.count,
+            'rps': round(total.count / elapsed, 1),
+            'latency': total.summary(),
+            'orders': orders,
+            'endpoints': endpoints,
+        }
+
+    def run(self, steps: List[int], duration: float, on_step: Callable[[dict], None]=None) -> Dict:
+        report = {
+            'base_url': self.client.api_url,
+            'python': platform.python_version(),
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'config': {
+                'sign_ratio': self.sign_ratio, 'cancel_ratio': self.cancel_ratio,
+                'poll_interval': self.poll_interval, 'step_duration': duration,
+            },
+            'steps': [],
+        }
+        for users in steps:
+            step = self.run_step(users, duration)
+            report['steps'].append(step)
+            if on_step is not None:
+                on_step(step)
+
+        return report
+
+
+def format_step(step: dict) -> str:
+    lines = [
+        f"{step['users']:>5} users  {step['rps']:>9,.1f} req/s  p50 {step['latency']['p50_ms']:.1f} ms  "
+        f"p99 {step['latency']['p99_ms']:.1f} ms  orders {step['orders']}"
+    ]
+    for endpoint, stats in step['endpoints'].items():
+        lines.append(
+            f"      {endpoint:<8} {stats['rps']:>9,.1f} req/s  p50 {stats['p50_ms']:>8.1f}  p95 {stats['p95_ms']:>8.1f}  "
+            f"p99 {stats['p99_ms']:>8.1f}  max {stats['max_ms']:>8.1f} ms  errors {stats['errors'] or '-'}"
+        )
+    return '\n'.join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m bankid6.loadtest', description='Load test a BankID RP API')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8080/rp/v6.0/')
+    parser.add_argument('--simulator', action='store_true', help='start a local bankid6.simulator and test that')
+    parser.add_argument('--users', default='10', help='comma separated concurrent users per ramp step, e.g. 10,50,100')
+    parser.add_argument('--step-duration', type=float, default=10, help='seconds per step')
+    parser.add_argument('--poll-interval', type=float, default=0.1, help='seconds between collects of an order')
+    parser.add_argument('--sign-ratio', type=float, default=0.5, help='share of orders started with sign')
+    parser.add_argument('--cancel-ratio', type=float, default=0.0, help='share of orders cancelled after one collect')
+    parser.add_argument('--timeout', type=float, default=10, help='request timeout in seconds')
+    parser.add_argument('--cert', help='client certificate (defaults to the BankID test certificate)')
+    parser.add_argument('--key', help='private key of --cert')
+    parser.add_argument('--ca', help='CA certificate of the server')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    args = parser.parse_args(argv)
+
+    steps = [int(users) for users in args.users.split(',')]
+
+    server = None
+    base_url = args.base_url
+    if args.simulator:
+        from .simulator import SimulatorServer
+
+        server = SimulatorServer()
+        base_url = server.start_in_thread()
+
+    client = BankIdClient(
+        cert_pem=args.cert, key_pem=args.key, ca_pem=args.ca, request_timeout=args.timeout,
+        pool_maxsize=max(steps), base_url=base_url
+    )
+    load_test = LoadTest(
+        client, sign_ratio=args.sign_ratio, cancel_ratio=args.cancel_ratio, poll_interval=args.poll_interval
+    )
+    try:
+        report = load_test.run(steps, args.step_duration, on_step=lambda step: print(format_step(step), file=sys.stderr))
+    finally:
+        client.close()
+        if server is not None:
+            server.stop()
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(report, fp, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
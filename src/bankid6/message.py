@@ -1,12 +1,70 @@
+import weakref
+
 from .listify import CollectStatuses, UseTypes, Languages, HintCodesPending, HintCodesFailed
 
 
+_message_caches = []
+
+
+def message_cache() -> dict:
+    """Create a cache for tables compiled from a ``Messages`` class.
+
+    The cache maps ``id(messages)`` to ``(table, weakref)`` and is emptied whenever a message is
+    changed, so tables are rebuilt for redefined or modified messages. Entries go away with their
+    class, so classes created at runtime are not kept alive.
+    """
+    cache = {}
+    _message_caches.append(cache)
+    return cache
+
+
+def compile_for_messages(cache: dict, messages, builder):
+    key = id(messages)
+    try:
+        return cache[key][0]
+    except KeyError:
+        pass
+
+    table = builder(messages)
+    try:
+        ref = weakref.ref(messages, lambda _: cache.pop(key, None))
+    except TypeError:
+        return table
+    cache[key] = (table, ref)
+    return table
+
+
+def _invalidate_message_caches():
+    for cache in _message_caches:
+        cache.clear()
+
+
+class FrozenDict(dict):
+    """Read-only dict shared between all responses built from the same message."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Message payloads are shared and read-only. Use copy() to get a mutable dict")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+    __ior__ = _readonly
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
+
+
 class MesssageDetail():
     def __init__(self, swedish, english, help_text="") -> None:
         self.swedish = swedish
         self.english = english
         self.help_text = help_text
     
+    def __setattr__(self, name, value):
+        # Only changing a message can stale a compiled table, not setting it in __init__
+        changed = name in self.__dict__
+        super().__setattr__(name, value)
+        if changed:
+            _invalidate_message_caches()
+    
     def json(self):
         return {
             Languages.sv: self.swedish,
@@ -17,7 +75,17 @@ class MesssageDetail():
         return f"{self.english}. help: {self.help_text}"
 
 
-class Messages():
+class MessagesMeta(type):
+    def __setattr__(cls, name, value):
+        super().__setattr__(name, value)
+        _invalidate_message_caches()
+
+    def __delattr__(cls, name):
+        super().__delattr__(name)
+        _invalidate_message_caches()
+
+
+class Messages(metaclass=MessagesMeta):
     RFA1 = MesssageDetail(
         "Starta BankID-appen.", 
         "Start your BankID app.",
@@ -204,11 +272,23 @@ class DeviceTypeMessage():
         self.mobile = mobile
 
 
-def get_bankid_collect_message(
-        status: str, hint_code: str, is_mobile: bool=True, messages: Messages=Messages
-    ):
+def freeze_message(value):
+    if isinstance(value, dict):
+        return FrozenDict(value)
+    
+    if isinstance(value, MesssageDetail):
+        return FrozenDict(value.json())
+
+    try:
+        swedish, english = value[0], value[1]
+    except Exception:
+        swedish = english = str(value)
+    return FrozenDict({Languages.sv: swedish, Languages.en: english})
+
+
+def _collect_message_map(messages):
     BMS = messages
-    map = {
+    return {
         CollectStatuses.pending: {
             HintCodesPending.outstandingTransaction: UseTypeMessage(qrcode=BMS.RFA1, onfile=BMS.RFA13),
             HintCodesPending.noClient: BMS.RFA1,
@@ -227,15 +307,57 @@ def get_bankid_collect_message(
         },
     }
 
-    try: 
-        msg = map[status].get(hint_code, map[status]["default"])
-    except KeyError:
-        return None
-    
-    if isinstance(msg, DeviceTypeMessage):
-        msg = msg.mobile if is_mobile else msg.pc
+
+def _build_collect_message_table(messages):
+    frozen = {}
+
+    def freeze(value):
+        if id(value) not in frozen:
+            frozen[id(value)] = (value, freeze_message(value))
+        return frozen[id(value)][1]
+
+    table = {}
+    for status, hint_messages in _collect_message_map(messages).items():
+        for hint_code, msg in hint_messages.items():
+            key_hint_code = None if hint_code == 'default' else hint_code
+
+            for is_mobile in (True, False):
+                device_msg = msg
+                if isinstance(device_msg, DeviceTypeMessage):
+                    device_msg = device_msg.mobile if is_mobile else device_msg.pc
+                if not isinstance(device_msg, UseTypeMessage):
+                    device_msg = UseTypeMessage(device_msg)
+                
+                table[(status, key_hint_code, is_mobile)] = FrozenDict({
+                    UseTypes.qrcode: freeze(device_msg.qrcode),
+                    UseTypes.onfile: freeze(device_msg.onfile),
+                })
     
-    if not isinstance(msg, UseTypeMessage):
-        msg = UseTypeMessage(msg)
+    return table
+
+
+_collect_message_tables = message_cache()
+
+
+def compile_collect_messages(messages: Messages=Messages) -> dict:
+    """Collect messages of ``messages`` keyed by ``(status, hintCode, is_mobile)``.
+
+    Built once per messages class. ``hintCode`` ``None`` holds the default of a status.
+    """
+    return compile_for_messages(_collect_message_tables, messages, _build_collect_message_table)
+
+
+def get_bankid_collect_message(
+        status: str, hint_code: str, is_mobile: bool=True, messages: Messages=Messages
+    ):
+    try:
+        table = _collect_message_tables[id(messages)][0]
+    except KeyError:
+        table = compile_collect_messages(messages)
+    is_mobile = bool(is_mobile)
+
+    msg = table.get((status, hint_code, is_mobile))
+    if msg is None:
+        msg = table.get((status, None, is_mobile))
     
-    return msg.json()
+    return msg
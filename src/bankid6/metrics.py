@@ -0,0 +1,390 @@
+"""In-process metrics with Prometheus text exposition.
+
+Metrics are off unless a ``BankIdMetrics`` is given to the client::
+
+    metrics = BankIdMetrics()
+    bankid_client = BankIdClient(metrics=metrics)
+    ...
+    metrics.exposition()            # Prometheus text format, e.g. for a /metrics view
+    start_http_server(metrics.registry, 9100)
+"""
+import collections
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Callable, Sequence
+
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULT_ORDER_BUCKETS = (1.0, 2.5, 5.0, 10.0, 15.0, 20.0, 30.0, 45.0, 60.0, 90.0, 120.0, 180.0, 300.0)
+
+# Start times of orders never collected to the end are dropped after this many seconds
+ORDER_START_TTL = 600.0
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+class _CounterValue(object):
+    __slots__ = ('value', '_lock')
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float=1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeValue(_CounterValue):
+    __slots__ = ()
+
+    def dec(self, amount: float=1) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class _HistogramValue(object):
+    __slots__ = ('bounds', 'counts', 'sum', '_lock')
+
+    def __init__(self, bounds: Sequence[float]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Metric(object):
+    """A named metric with optional labels. Use ``labels(*values)`` to get the value to update."""
+
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str]=()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _new_value(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        value = self._values.get(values)
+        if value is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                value = self._values.setdefault(values, self._new_value())
+        return value
+
+    def _label_text(self, values: Sequence[str], extra: str='') -> str:
+        pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def _samples(self):
+        for values, value in list(self._values.items()):
+            yield self.name, self._label_text(values), value.value
+
+    def exposition(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for name, labels, value in self._samples():
+            lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def _new_value(self):
+        return _CounterValue()
+
+    def inc(self, amount: float=1) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    """Gauge set from code, or read from ``function`` at scrape time (unlabelled only)."""
+
+    type = 'gauge'
+
+    def __init__(
+            self, name: str, documentation: str, labelnames: Sequence[str]=(), function: Callable[[], float]=None
+        ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def _new_value(self):
+        return _GaugeValue()
+
+    def inc(self, amount: float=1) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float=1) -> None:
+        self.labels().dec(amount)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def _samples(self):
+        if self.function is not None:
+            yield self.name, '', self.function()
+        else:
+            yield from super()._samples()
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(
+            self, name: str, documentation: str, labelnames: Sequence[str]=(),
+            buckets: Sequence[float]=DEFAULT_LATENCY_BUCKETS
+        ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_value(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _samples(self):
+        for values, value in list(self._values.items()):
+            with value._lock:
+                counts = list(value.counts)
+                total = value.sum
+
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield f'{self.name}_bucket', self._label_text(values, f'le="{_format_value(float(bound))}"'), cumulative
+            yield f'{self.name}_sum', self._label_text(values), total
+            yield f'{self.name}_count', self._label_text(values), cumulative
+
+
+class MetricsRegistry(object):
+    def __init__(self) -> None:
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str]=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(
+            self, name: str, documentation: str, labelnames: Sequence[str]=(), function: Callable[[], float]=None
+        ) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(
+            self, name: str, documentation: str, labelnames: Sequence[str]=(),
+            buckets: Sequence[float]=DEFAULT_LATENCY_BUCKETS
+        ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name: str) -> Metric:
+        return self._metrics.get(name)
+
+    def exposition(self) -> str:
+        """All metrics in the Prometheus text format (version 0.0.4)."""
+        return ''.join(metric.exposition() + '\n' for metric in list(self._metrics.values()))
+
+
+class BankIdMetrics(object):
+    """Metrics recorded by ``BankIdClient`` and ``AsyncBankIdClient`` when given as ``metrics``.
+
+    - ``<namespace>_request_duration_seconds{endpoint}`` request latency; ``_count`` is the number of requests
+    - ``<namespace>_errors_total{status,errorCode}`` ``BankIdError`` responses
+    - ``<namespace>_collect_total{status,hintCode}`` collect results
+    - ``<namespace>_order_duration_seconds{status}`` seconds from order start to its final collect, for
+      orders started by the clients or registered with ``observe_start``, and for collects of handles,
+      stored orders and tokens carrying their start time
+    - ``<namespace>_pool_connections_in_use`` and ``<namespace>_pool_max_size``, read at scrape time;
+      their ratio is the connection pool saturation
+    - ``<namespace>_admission_live_orders`` and ``<namespace>_admission_queue_depth``, read at scrape
+      time, ``<namespace>_admission_wait_seconds`` and ``<namespace>_admission_rejected_total`` when
+      the clients use an ``AdmissionController``
+
+    One instance can be shared by several clients.
+    """
+
+    def __init__(
+            self, registry: MetricsRegistry=None, namespace: str='bankid',
+            latency_buckets: Sequence[float]=DEFAULT_LATENCY_BUCKETS,
+            order_buckets: Sequence[float]=DEFAULT_ORDER_BUCKETS
+        ) -> None:
+        self.registry = registry or MetricsRegistry()
+
+        self.request_duration = self.registry.histogram(
+            f'{namespace}_request_duration_seconds', 'BankID API request latency in seconds.',
+            ['endpoint'], latency_buckets
+        )
+        self.errors = self.registry.counter(
+            f'{namespace}_errors_total', 'BankID API error responses.', ['status', 'errorCode']
+        )
+        self.collects = self.registry.counter(
+            f'{namespace}_collect_total', 'BankID collect results.', ['status', 'hintCode']
+        )
+        self.order_duration = self.registry.histogram(
+            f'{namespace}_order_duration_seconds', 'Seconds from order start to its final collect.',
+            ['status'], order_buckets
+        )
+        self.connections_in_use = self.registry.gauge(
+            f'{namespace}_pool_connections_in_use', 'Connections to BankID currently used by a request.',
+            function=lambda: sum(in_use() for _, in_use in self._pools)
+        )
+        self.pool_size = self.registry.gauge(
+            f'{namespace}_pool_max_size', 'Connections the clients keep open to BankID.',
+            function=lambda: sum(size for size, _ in self._pools)
+        )
+        self.admission_live = self.registry.gauge(
+            f'{namespace}_admission_live_orders', 'BankID orders holding an admission slot.',
+            function=lambda: sum(admission.live for admission in self._admissions)
+        )
+        self.admission_queue_depth = self.registry.gauge(
+            f'{namespace}_admission_queue_depth', 'Calls waiting for an admission slot for a new order.',
+            function=lambda: sum(admission.queued for admission in self._admissions)
+        )
+        self.admission_wait = self.registry.histogram(
+            f'{namespace}_admission_wait_seconds', 'Seconds new orders waited for an admission slot.',
+            buckets=latency_buckets
+        )
+        self.admission_rejected = self.registry.counter(
+            f'{namespace}_admission_rejected_total', 'New orders rejected by admission control.'
+        )
+
+        self._pools = []
+        self._admissions = []
+        self._endpoints = {}
+        self._collect_values = {}
+        self._duration_values = {}
+        self._started = collections.OrderedDict()
+        self._started_lock = threading.Lock()
+
+    def add_pool(self, size: int, in_use: Callable[[], int]) -> None:
+        """Report a client connection pool of ``size`` connections, ``in_use()`` of them busy."""
+        self._pools.append((size, in_use))
+
+    def add_admission(self, admission) -> None:
+        """Report the live orders and queue depth of an ``AdmissionController``."""
+        if admission not in self._admissions:
+            self._admissions.append(admission)
+
+    def observe_admission(self, waited: float=None) -> None:
+        """Record a new order admitted after ``waited`` seconds, or rejected when ``None``."""
+        if waited is None:
+            self.admission_rejected.inc()
+        else:
+            self.admission_wait.observe(waited)
+
+    def observe_request(self, endpoint: str, seconds: float) -> None:
+        value = self._endpoints.get(endpoint)
+        if value is None:
+            value = self._endpoints[endpoint] = self.request_duration.labels(endpoint)
+        value.observe(seconds)
+
+    def observe_error(self, error) -> None:
+        self.errors.labels(str(error.response_status), error.errorCode or '').inc()
+
+    def observe_start(self, orderRef: str, started: float=None) -> None:
+        """Remember when ``orderRef`` started (``time.time()``) for its order duration.
+
+        Without ``started`` the order starts now, unless its start is already known.
+        """
+        now = time.time()
+        with self._started_lock:
+            if started or orderRef not in self._started:
+                self._started[orderRef] = started or now
+            while self._started:
+                order_ref, oldest = next(iter(self._started.items()))
+                if now - oldest < ORDER_START_TTL:
+                    break
+                self._started.pop(order_ref, None)
+
+    def forget(self, orderRef: str) -> None:
+        """Drop the start time of an order that ends without a final collect."""
+        self._started.pop(orderRef, None)
+
+    def observe_collect(self, collect_response, started: float=None) -> None:
+        status = collect_response.status
+        hint_code = collect_response.hintCode
+        values = self._collect_values.get(status)
+        value = values.get(hint_code) if values is not None else None
+        if value is None:
+            value = self._collect_value(status, hint_code)
+        value.inc()
+
+        if status == 'pending':
+            return
+        # A single pop is atomic, only pruning in observe_start needs the lock
+        started = self._started.pop(collect_response.orderRef, None) or started
+        if started:
+            duration = self._duration_values.get(status)
+            if duration is None:
+                duration = self._duration_values[status] = self.order_duration.labels(status)
+            duration.observe(max(0.0, time.time() - started))
+
+    def _collect_value(self, status, hint_code):
+        value = self.collects.labels(status, hint_code or '')
+        self._collect_values.setdefault(status, {})[hint_code] = value
+        return value
+
+    def exposition(self) -> str:
+        return self.registry.exposition()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = None
+
+    def do_GET(self):
+        content = self.registry.exposition().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def start_http_server(registry: MetricsRegistry, port: int, host: str='') -> HTTPServer:
+    """Serve ``registry`` for Prometheus scraping from a daemon thread. Stop it with ``shutdown()``."""
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    server = _ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name='bankid-metrics', daemon=True).start()
+    return server
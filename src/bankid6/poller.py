@@ -0,0 +1,336 @@
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from requests import RequestException
+
+from .listify import CollectStatuses, HintCodesPending
+from .exceptions import BankIdError, BankIdCircuitOpenError, BankIdRateLimitError
+
+
+logger = logging.getLogger(__name__)
+
+# Failures after which an order is collected again; any other error ends its polling
+TRANSIENT_ERRORS = (RequestException, BankIdCircuitOpenError, BankIdRateLimitError)
+# BankID errors its documentation says to try again after: requestTimeout, internalError, maintenance
+RETRYABLE_STATUSES = frozenset([408, 500, 503])
+
+
+_FAILED = object()
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Whether an order whose collect raised ``exc`` should be collected again."""
+    if isinstance(exc, BankIdError):
+        return exc.response_status in RETRYABLE_STATUSES
+    return isinstance(exc, TRANSIENT_ERRORS)
+
+
+class PollingPolicy():
+    """Collects every order at a fixed ``interval``."""
+
+    def __init__(self, interval: float=2.0):
+        self.interval = interval
+
+    def next_interval(self, result, repeats: int=0, phone: bool=False) -> float:
+        """Seconds until the next collect of an order after ``result``.
+
+        ``result`` is the last ``BankIdCollectResponse`` or the exception it raised,
+        ``repeats`` how many collects before it had the same hintCode, and ``phone`` whether
+        it is a phone order.
+        """
+        return self.interval
+
+
+class AdaptivePollingPolicy(PollingPolicy):
+    """Picks the collect interval from the hintCode of the last collect.
+
+    Orders waiting for the user to open BankID (``outstandingTransaction``, ``noClient``)
+    start at ``intervals[hintCode]`` and back off by ``backoff`` per unchanged collect up to
+    ``max_interval``. Orders close to completion (``userSign``) are collected every second,
+    the fastest BankID allows, so completion is noticed sooner. Phone orders use
+    ``phone_intervals`` first, which gives ``userCallConfirm`` its own schedule.
+
+    After a transient failure, e.g. a connection error or ``503 maintenance``, the order is
+    collected again after ``error_interval``, growing by ``backoff`` per consecutive failure
+    up to ``max_error_interval``, and never sooner than the error's ``retry_after``.
+    """
+
+    INTERVALS = {
+        HintCodesPending.outstandingTransaction: 2.0,
+        HintCodesPending.noClient: 2.0,
+        HintCodesPending.started: 2.0,
+        HintCodesPending.userMrtd: 2.0,
+        HintCodesPending.userSign: 1.0,
+    }
+    PHONE_INTERVALS = {
+        HintCodesPending.outstandingTransaction: 2.0,
+        HintCodesPending.userCallConfirm: 1.0,
+    }
+    BACKOFF_HINTS = frozenset([HintCodesPending.outstandingTransaction, HintCodesPending.noClient])
+
+    def __init__(
+            self, intervals: dict=None, phone_intervals: dict=None, default: float=2.0,
+            backoff: float=1.5, max_interval: float=6.0, error_interval: float=2.0,
+            max_error_interval: float=30.0
+        ):
+        super().__init__(default)
+        self.intervals = dict(self.INTERVALS, **(intervals or {}))
+        self.phone_intervals = dict(self.PHONE_INTERVALS, **(phone_intervals or {}))
+        self.backoff = backoff
+        self.max_interval = max_interval
+        self.error_interval = error_interval
+        self.max_error_interval = max_error_interval
+
+    def next_interval(self, result, repeats: int=0, phone: bool=False) -> float:
+        hint_code = getattr(result, 'hintCode', None)
+        if hint_code is None and isinstance(result, Exception):
+            interval = min(self.error_interval * self.backoff ** repeats, max(self.max_error_interval, self.error_interval))
+            return max(interval, getattr(result, 'retry_after', 0))
+
+        interval = None
+        if phone:
+            interval = self.phone_intervals.get(hint_code)
+        if interval is None:
+            interval = self.intervals.get(hint_code, self.interval)
+        
+        if repeats and hint_code in self.BACKOFF_HINTS:
+            interval = min(interval * self.backoff ** repeats, max(self.max_interval, interval))
+        return interval
+
+
+class _PolledOrder():
+    __slots__ = ('orderRef', 'qr_args', 'callback', 'phone', 'hintCode', 'repeats', 'seq', 'due')
+
+    def __init__(self, orderRef, qr_args, callback, phone=False):
+        self.orderRef = orderRef
+        self.qr_args = qr_args
+        self.callback = callback
+        self.phone = phone
+        self.hintCode = None
+        self.repeats = 0
+        self.seq = 0
+        self.due = 0.0
+
+
+class CollectPoller():
+    """Collects many orders from one scheduler thread and a bounded pool of workers.
+
+    Active orders live in a heap ordered by due time. The scheduler hands due orders to at
+    most ``max_workers`` concurrent ``collect`` calls, so the number of threads and pooled
+    connections stays fixed however many orders are pending. Orders are dropped once they
+    reach ``complete``/``failed`` or raise a terminal error, such as ``invalidParameters`` or
+    a malformed response. Connection errors, an open circuit breaker, rate limiting and the
+    BankID errors of ``RETRYABLE_STATUSES`` (``requestTimeout``, ``internalError``,
+    ``maintenance``) are transient: the order is collected again after the policy's interval.
+
+    Every result, a ``BankIdCollectResponse`` or an exception, is passed to the order's
+    callback, to ``on_result`` or, when neither is given, put on the ``results`` queue as an
+    ``(orderRef, result)`` pair.
+
+    The time to the next collect of an order comes from ``policy``, by default a fixed
+    ``interval``; see ``AdaptivePollingPolicy``. ``max_calls_per_second`` caps the collect
+    rate of the whole poller; when it is reached, due orders wait in due-time order.
+    """
+
+    def __init__(
+            self, client, interval: float=2.0, max_workers: int=8, on_result=None,
+            policy: PollingPolicy=None, max_calls_per_second: float=None
+        ):
+        self.client = client
+        self.interval = interval
+        self.max_workers = max_workers
+        self.on_result = on_result
+        self.policy = policy or PollingPolicy(interval)
+        self.max_calls_per_second = max_calls_per_second
+        self.results = queue.Queue()
+
+        self._orders = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._executor = None
+        self._thread = None
+        self._running = False
+
+        self._tokens = max_calls_per_second or 0.0
+        self._refilled = time.monotonic()
+
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.throttled = 0
+    
+    def __len__(self):
+        return len(self._orders)
+
+    def __contains__(self, orderRef):
+        return orderRef in self._orders
+
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def lag(self):
+        """Seconds the most overdue pending collect is behind schedule."""
+        with self._cond:
+            if not self._heap:
+                return 0.0
+            return max(0.0, time.monotonic() - self._heap[0][0])
+
+    def stats(self):
+        return {
+            'orders': len(self._orders),
+            'lag': self.lag,
+            'last_lag': self.last_lag,
+            'max_lag': self.max_lag,
+            'throttled': self.throttled,
+        }
+
+    def add(
+            self, orderRef: str, qrStartToken: str=None, qrStartSecret: str=None, order_time: int=None,
+            callback=None, delay: float=0.0, phone: bool=False
+        ):
+        order = _PolledOrder(orderRef, (qrStartToken, qrStartSecret, order_time), callback, phone)
+        with self._cond:
+            self._orders[orderRef] = order
+            self._schedule(order, time.monotonic() + delay)
+        
+        return order
+
+    def remove(self, orderRef: str):
+        with self._cond:
+            return self._orders.pop(orderRef, None) is not None
+
+    def start(self):
+        if self._running:
+            return
+        
+        self._running = True
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._thread = threading.Thread(target=self._run, name='bankid6-collect-poller', daemon=True)
+        self._thread.start()
+    
+    def stop(self, wait: bool=True):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def _schedule(self, order, due):
+        order.seq = next(self._seq)
+        order.due = due
+        heapq.heappush(self._heap, (due, order.seq, order.orderRef))
+        self._cond.notify()
+
+    def _next_due(self):
+        with self._cond:
+            while self._running:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+
+                due, seq, order_ref = self._heap[0]
+                order = self._orders.get(order_ref)
+                if order is None or order.seq != seq:
+                    heapq.heappop(self._heap)
+                    continue
+
+                now = time.monotonic()
+                if due > now:
+                    self._cond.wait(due - now)
+                    continue
+
+                wait = self._take_budget(now)
+                if wait:
+                    self.throttled += 1
+                    self._cond.wait(wait)
+                    continue
+                
+                heapq.heappop(self._heap)
+                self.last_lag = now - due
+                self.max_lag = max(self.max_lag, self.last_lag)
+                return order
+
+    def _take_budget(self, now):
+        """Take one call from the per-second budget; return the seconds to wait if there is none."""
+        rate = self.max_calls_per_second
+        if not rate:
+            return 0.0
+
+        self._tokens = min(rate, self._tokens + (now - self._refilled) * rate)
+        self._refilled = now
+        if self._tokens < 1:
+            return (1 - self._tokens) / rate
+        
+        self._tokens -= 1
+        return 0.0
+
+    def _run(self):
+        while True:
+            self._slots.acquire()
+            order = self._next_due()
+            if order is None:
+                self._slots.release()
+                return
+            self._executor.submit(self._collect, order)
+
+    def _collect(self, order):
+        try:
+            qrStartToken, qrStartSecret, order_time = order.qr_args
+            try:
+                result = self.client.collect(
+                    orderRef=order.orderRef, qrStartToken=qrStartToken,
+                    qrStartSecret=qrStartSecret, order_time=order_time
+                )
+                finished = result.status in (CollectStatuses.complete, CollectStatuses.failed)
+            except Exception as exc:
+                result, finished = exc, not is_transient(exc)
+            
+            with self._cond:
+                if self._orders.get(order.orderRef) is order:
+                    if finished:
+                        del self._orders[order.orderRef]
+                    else:
+                        self._schedule(order, time.monotonic() + self._next_interval(order, result))
+            
+            try:
+                self._deliver(order, result)
+            except Exception:
+                logger.exception("Collect result callback of order %s failed", order.orderRef)
+        finally:
+            self._slots.release()
+
+    def _next_interval(self, order, result):
+        hint_code = getattr(result, 'hintCode', None)
+        if hint_code is None and isinstance(result, Exception):
+            # Consecutive failures count as repeats, so policies can back off from a failing BankID
+            hint_code = _FAILED
+        if hint_code is not None and hint_code == order.hintCode:
+            order.repeats += 1
+        else:
+            order.hintCode = hint_code
+            order.repeats = 0
+        
+        return self.policy.next_interval(result, order.repeats, order.phone)
+
+    def _deliver(self, order, result):
+        callback = order.callback or self.on_result
+        if callback is None:
+            self.results.put((order.orderRef, result))
+        else:
+            callback(order.orderRef, result)
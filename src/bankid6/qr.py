@@ -0,0 +1,192 @@
+import hashlib
+import hmac
+import itertools
+import threading
+import time
+from types import MappingProxyType
+
+
+class QrFrames():
+    """Animated QR code data of one order.
+
+    The HMAC is keyed with ``qrStartSecret`` once and every frame is computed from a copy of
+    the keyed state. Frame ``t`` is ``bankid.<qrStartToken>.<t>.<code>`` where ``t`` is the
+    number of whole seconds since ``order_time``, the same data ``generate_qr_data`` returns.
+    """
+
+    __slots__ = ('order_time', 'qrStartToken', '_mac', '_prefix', '_frames')
+
+    def __init__(self, order_time: int, qr_start_token: str, qr_start_secret: str) -> None:
+        self.order_time = int(order_time)
+        self.qrStartToken = qr_start_token
+        self._mac = hmac.new(qr_start_secret.encode(), digestmod=hashlib.sha256)
+        self._prefix = f"bankid.{qr_start_token}."
+        self._frames = {}
+
+    def elapsed(self, now: float=None) -> int:
+        if now is None:
+            now = time.time()
+        return int(now - self.order_time)
+    
+    def frame(self, qr_time: int) -> str:
+        frame = self._frames.get(qr_time)
+        if frame is None:
+            qr_time = str(qr_time)
+            mac = self._mac.copy()
+            mac.update(qr_time.encode())
+            frame = f"{self._prefix}{qr_time}.{mac.hexdigest()}"
+        return frame
+    
+    def current(self, now: float=None) -> str:
+        return self.frame(self.elapsed(now))
+    
+    def seconds_until_next_frame(self, now: float=None) -> float:
+        if now is None:
+            now = time.time()
+        return 1.0 - (now - self.order_time) % 1.0
+    
+    def precompute(self, count: int, now: float=None) -> list:
+        """Compute the current frame and the ``count - 1`` following ones in one go.
+
+        They are kept until the next ``precompute`` call and used by ``frame``/``current``.
+        """
+        start = self.elapsed(now)
+        self._frames = {}
+        frames = {qr_time: self.frame(qr_time) for qr_time in range(start, start + count)}
+        self._frames = frames
+        return list(frames.values())
+    
+    def frames(self, now: float=None):
+        """Yield the frame of the current second followed by the frames of the next seconds."""
+        qr_time = self.elapsed(now)
+        while True:
+            yield self.frame(qr_time)
+            qr_time += 1
+    
+    def __iter__(self):
+        return self.frames()
+
+
+class QrTicker():
+    """Computes the QR data of all registered orders once per second.
+
+    Every tick computes the codes of all live orders in one pass and publishes them as a new
+    read-only mapping in ``codes``, so serving a QR code is a dict lookup. Orders added
+    between ticks are served by ``get`` from a small side table until the next tick publishes
+    them. Subscribers are called with the mapping after each tick. Orders older than
+    ``max_age`` seconds are dropped.
+    """
+
+    def __init__(self, max_age: float=300) -> None:
+        self.max_age = max_age
+        self._codes = {}
+        self.codes = MappingProxyType(self._codes)
+
+        self._orders = {}
+        # orderRef -> (seq, code) of orders added since the last tick
+        self._added = {}
+        # Orders removed while a tick computes, which it must not publish
+        self._removed = set()
+        self._seq = itertools.count(1)
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def __len__(self):
+        return len(self._orders)
+
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def add(self, orderRef: str, order_time: int, qr_start_token: str, qr_start_secret: str):
+        self.add_frames(orderRef, QrFrames(order_time, qr_start_token, qr_start_secret))
+    
+    def add_order(self, order):
+        """Register an order handle returned by ``auth`` or ``sign``."""
+        self.add_frames(order.orderRef, order.qr_frames)
+
+    def add_frames(self, orderRef: str, frames: QrFrames):
+        code = frames.current()
+        with self._lock:
+            self._orders[orderRef] = frames
+            self._added[orderRef] = (next(self._seq), code)
+    
+    def remove(self, orderRef: str):
+        with self._lock:
+            self._added.pop(orderRef, None)
+            self._codes.pop(orderRef, None)
+            self._removed.add(orderRef)
+            return self._orders.pop(orderRef, None) is not None
+    
+    def get(self, orderRef: str) -> str:
+        added = self._added.get(orderRef)
+        if added is not None:
+            return added[1]
+        return self.codes.get(orderRef)
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+    
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def tick(self, now: float=None):
+        if now is None:
+            now = time.time()
+        
+        with self._lock:
+            if self.max_age is not None:
+                oldest = now - self.max_age
+                for order_ref in [ref for ref, frames in self._orders.items() if frames.order_time < oldest]:
+                    del self._orders[order_ref]
+            orders = list(self._orders.items())
+            snapshot = next(self._seq)
+            self._removed = set()
+
+        codes = {}
+        qr_times = {}
+        for order_ref, frames in orders:
+            qr_time = qr_times.get(frames.order_time)
+            if qr_time is None:
+                qr_time = qr_times[frames.order_time] = int(now - frames.order_time)
+            codes[order_ref] = frames.frame(qr_time)
+        
+        with self._lock:
+            for order_ref in self._removed:
+                codes.pop(order_ref, None)
+            # Orders added while computing are not in the snapshot; publish the code they were added with
+            for order_ref, (seq, code) in self._added.items():
+                if seq > snapshot:
+                    codes[order_ref] = code
+            self._added = {}
+            self._codes = codes
+            self.codes = MappingProxyType(codes)
+        for callback in list(self._subscribers):
+            callback(self.codes)
+        
+        return self.codes
+
+    def start(self):
+        if self._thread is not None:
+            return
+        
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='bankid6-qr-ticker', daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.tick()
+            # order_time is a whole second, so all frames change on the wall clock second
+            self._stop.wait(1.0 - time.time() % 1.0 + 0.001)
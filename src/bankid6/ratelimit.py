@@ -0,0 +1,157 @@
+"""Client-side rate limiting of outgoing BankID calls.
+
+A ``RateLimiter`` given to a client as ``rate_limiter`` is checked before every request::
+
+    limiter = RateLimiter(rate=50, burst=100, rates={'auth': 10, 'sign': 10}, timeout=2.0)
+    bankid_client = BankIdClient(rate_limiter=limiter)
+
+One limiter can be shared by several clients, threads and coroutines.
+"""
+import asyncio
+import threading
+import time
+from typing import Dict, Tuple, Union
+
+from .exceptions import BankIdRateLimitError
+
+
+PRIORITY_ENDPOINTS = frozenset(['collect', 'cancel'])
+
+
+class TokenBucket():
+    """``rate`` tokens per second, up to ``capacity`` saved up. Not thread safe on its own."""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float, now: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def time_until(self, tokens: float) -> float:
+        """Seconds until ``tokens`` tokens are available, 0 if they are now."""
+        missing = tokens - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+
+class RateLimiter():
+    """Token-bucket limits on the calls of one or more clients.
+
+    ``rate`` calls per second with bursts of ``burst`` limit all endpoints together, ``rates``
+    limits single endpoints (``'auth'``, ``'phone/sign'``, ...) with either a rate or a
+    ``(rate, burst)`` pair. A call over the limit waits for up to ``timeout`` seconds (forever
+    when ``None``) or, with ``block=False``, raises ``BankIdRateLimitError`` at once. The error
+    is also raised as soon as it is clear that the wait would exceed ``timeout``.
+
+    ``collect`` and ``cancel`` come first so that orders in progress finish before new ones
+    start: other endpoints leave ``reserve`` of the shared burst to them and wait while a
+    ``collect`` or ``cancel`` is waiting.
+    """
+
+    def __init__(
+            self, rate: float=None, burst: float=None, rates: Dict[str, Union[float, Tuple[float, float]]]=None,
+            timeout: float=None, block: bool=True, reserve: float=0.2, clock=time.monotonic
+        ) -> None:
+        self.timeout = timeout
+        self.block = block
+        self.clock = clock
+
+        now = clock()
+        self.bucket = TokenBucket(rate, burst or max(1.0, rate), now) if rate else None
+        self.reserved = 0.0
+        if self.bucket is not None:
+            self.reserved = max(0.0, min(reserve * self.bucket.capacity, self.bucket.capacity - 1))
+        self.buckets = {}
+        for endpoint, limit in (rates or {}).items():
+            endpoint_rate, endpoint_burst = limit if isinstance(limit, tuple) else (limit, None)
+            self.buckets[endpoint] = TokenBucket(endpoint_rate, endpoint_burst or max(1.0, endpoint_rate), now)
+
+        self.waited = 0
+        self.rejected = 0
+        self._priority_waiting = 0
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, endpoint: str, priority: bool, now: float) -> float:
+        """Take a token for ``endpoint`` and return 0, or return the seconds to wait for one."""
+        with self._lock:
+            wait = 0.0
+            bucket = self.buckets.get(endpoint)
+            if bucket is not None:
+                bucket.refill(now)
+                wait = bucket.time_until(1)
+
+            if self.bucket is not None:
+                self.bucket.refill(now)
+                if priority:
+                    wait = max(wait, self.bucket.time_until(1))
+                else:
+                    wait = max(wait, self.bucket.time_until(1 + self.reserved))
+                    if self._priority_waiting:
+                        wait = max(wait, 1 / self.bucket.rate)
+
+            if wait == 0.0:
+                if bucket is not None:
+                    bucket.tokens -= 1
+                if self.bucket is not None:
+                    self.bucket.tokens -= 1
+            return wait
+
+    def _reject(self, endpoint, wait):
+        with self._lock:
+            self.rejected += 1
+        return BankIdRateLimitError(endpoint, wait)
+
+    def _waiting(self, priority, delta):
+        with self._lock:
+            if delta > 0:
+                self.waited += 1
+            if priority:
+                self._priority_waiting += delta
+
+    def _next_wait(self, endpoint, wait, deadline):
+        """Seconds to sleep before trying again, or raise when the deadline cannot be met."""
+        if not self.block:
+            raise self._reject(endpoint, wait)
+        if deadline is not None:
+            remaining = deadline - self.clock()
+            if wait > remaining:
+                raise self._reject(endpoint, wait)
+        return wait
+
+    def acquire(self, endpoint: str) -> None:
+        """Wait for a call to ``endpoint`` to be allowed, or raise ``BankIdRateLimitError``."""
+        priority = endpoint in PRIORITY_ENDPOINTS
+        wait = self._try_acquire(endpoint, priority, self.clock())
+        if wait == 0.0:
+            return
+
+        deadline = self.clock() + self.timeout if self.timeout is not None else None
+        self._waiting(priority, 1)
+        try:
+            while wait:
+                time.sleep(self._next_wait(endpoint, wait, deadline))
+                wait = self._try_acquire(endpoint, priority, self.clock())
+        finally:
+            self._waiting(priority, -1)
+
+    async def acquire_async(self, endpoint: str) -> None:
+        """``acquire`` for coroutines, waiting with ``asyncio.sleep``."""
+        priority = endpoint in PRIORITY_ENDPOINTS
+        wait = self._try_acquire(endpoint, priority, self.clock())
+        if wait == 0.0:
+            return
+
+        deadline = self.clock() + self.timeout if self.timeout is not None else None
+        self._waiting(priority, 1)
+        try:
+            while wait:
+                await asyncio.sleep(self._next_wait(endpoint, wait, deadline))
+                wait = self._try_acquire(endpoint, priority, self.clock())
+        finally:
+            self._waiting(priority, -1)
@@ -0,0 +1,190 @@
+"""Retries and a circuit breaker for BankID calls.
+
+Both are off by default and enabled per client::
+
+    bankid_client = BankIdClient(retry=RetryPolicy(), circuit_breaker=CircuitBreaker())
+"""
+import asyncio
+import collections
+import random
+import threading
+import time
+
+import requests
+
+from .exceptions import BankIdError, BankIdCircuitOpenError
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+
+CONNECTION_ERRORS = (requests.ConnectionError, requests.Timeout)
+if aiohttp is not None:
+    CONNECTION_ERRORS += (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+
+# Certificate problems are connection errors too, but retrying them cannot help.
+PERMANENT_ERRORS = (requests.exceptions.SSLError,)
+if aiohttp is not None:
+    PERMANENT_ERRORS += (aiohttp.ClientSSLError,)
+
+IDEMPOTENT_ENDPOINTS = frozenset(['collect', 'cancel'])
+
+
+def is_connection_error(exc: BaseException) -> bool:
+    return isinstance(exc, CONNECTION_ERRORS) and not isinstance(exc, PERMANENT_ERRORS)
+
+
+class RetryPolicy():
+    """Retries the calls that are safe to repeat, with jittered exponential backoff.
+
+    Retried are ``503 maintenance`` on every endpoint, since BankID did not process the
+    request, and connection errors and timeouts on ``collect`` and ``cancel``, which are
+    idempotent. A call is tried at most ``max_attempts`` times and no retry starts later than
+    ``deadline`` seconds after the first attempt. The n-th retry waits a random time between
+    0 and ``min(max_delay, base_delay * 2 ** n)`` ("full jitter"), so clients that failed
+    together do not come back together.
+    """
+
+    def __init__(
+            self, max_attempts: int=3, base_delay: float=0.5, max_delay: float=5.0, deadline: float=10.0,
+            retry_connection_errors: bool=True, rng: random.Random=None
+        ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.retry_connection_errors = retry_connection_errors
+        self.rng = rng or random.Random()
+
+    def is_retryable(self, endpoint: str, exc: BaseException) -> bool:
+        if isinstance(exc, BankIdError):
+            return exc.response_status == 503 and exc.errorCode == 'maintenance'
+        return self.retry_connection_errors and endpoint in IDEMPOTENT_ENDPOINTS and is_connection_error(exc)
+
+    def backoff(self, attempt: int) -> float:
+        return self.rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def next_delay(self, endpoint: str, exc: BaseException, attempt: int, elapsed: float):
+        """Seconds to wait before retrying after attempt number ``attempt`` (0-based) failed, or ``None``."""
+        if attempt + 1 >= self.max_attempts or not self.is_retryable(endpoint, exc):
+            return None
+
+        delay = self.backoff(attempt)
+        if elapsed + delay > self.deadline:
+            return None
+        return delay
+
+
+class CircuitBreaker():
+    """Fails calls fast while BankID is failing.
+
+    Over a rolling ``window`` of seconds the breaker counts calls and failures, i.e. 5xx
+    responses and connection errors; other errors such as 4xx mean BankID is up. Once at least
+    ``min_calls`` were made and ``failure_rate`` of them failed, the breaker opens and every
+    call raises ``BankIdCircuitOpenError`` without touching the network. After
+    ``reset_timeout`` seconds ``half_open_calls`` trial calls are let through: a success
+    closes the breaker, a failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(
+            self, failure_rate: float=0.5, min_calls: int=20, window: float=10.0, reset_timeout: float=30.0,
+            half_open_calls: int=1, clock=time.monotonic
+        ):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.clock = clock
+
+        self.state = self.CLOSED
+        self.opened = 0
+        self._opened_at = 0.0
+        self._trials = 0
+        self._bucket_width = window / 10
+        self._buckets = collections.deque()
+        self._calls = 0
+        self._failures = 0
+        self._lock = threading.Lock()
+
+    def is_failure(self, exc: BaseException) -> bool:
+        if isinstance(exc, BankIdError):
+            return exc.response_status is not None and exc.response_status >= 500
+        return isinstance(exc, CONNECTION_ERRORS)
+
+    def before_call(self) -> None:
+        """Raise ``BankIdCircuitOpenError`` if the call must not be made."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+
+            now = self.clock()
+            if self.state == self.OPEN:
+                remaining = self._opened_at + self.reset_timeout - now
+                if remaining > 0:
+                    raise BankIdCircuitOpenError(remaining)
+                self.state = self.HALF_OPEN
+                self._trials = 0
+
+            if self._trials >= self.half_open_calls:
+                raise BankIdCircuitOpenError(self._bucket_width)
+            self._trials += 1
+
+    def record(self, exc: BaseException=None) -> None:
+        """Record the outcome of a call made after ``before_call``; ``exc`` is what it raised, if anything."""
+        failed = exc is not None and self.is_failure(exc)
+        with self._lock:
+            now = self.clock()
+            if self.state == self.HALF_OPEN:
+                if failed:
+                    self._open(now)
+                else:
+                    self._close()
+                return
+            if self.state == self.OPEN:
+                return
+
+            self._count(now, failed)
+            if (
+                failed and self._calls >= self.min_calls
+                and self._failures >= self.failure_rate * self._calls
+            ):
+                self._open(now)
+
+    def cancel(self) -> None:
+        """Give back the trial of a call made after ``before_call`` that ended without an outcome, e.g. cancelled."""
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._trials > 0:
+                self._trials -= 1
+
+    def _count(self, now, failed):
+        start = now - now % self._bucket_width
+        if not self._buckets or self._buckets[-1][0] != start:
+            self._buckets.append([start, 0, 0])
+        bucket = self._buckets[-1]
+        bucket[1] += 1
+        bucket[2] += failed
+        self._calls += 1
+        self._failures += failed
+
+        while self._buckets[0][0] <= now - self.window:
+            _, calls, failures = self._buckets.popleft()
+            self._calls -= calls
+            self._failures -= failures
+
+    def _open(self, now):
+        self.state = self.OPEN
+        self.opened += 1
+        self._opened_at = now
+
+    def _close(self):
+        self.state = self.CLOSED
+        self._buckets.clear()
+        self._calls = 0
+        self._failures = 0
@@ -0,0 +1,138 @@
+import base64
+import binascii
+from datetime import datetime, timezone
+from xml.etree import ElementTree
+
+
+class BankIdSignedData():
+    """Signed-data fields of the XML signature in ``completionData.signature``.
+
+    ``usrVisibleData`` and ``usrNonVisibleData`` are decoded from base64 to text. ``srvInfo``
+    and ``clientInfo`` map the names of their child elements to the element texts.
+    """
+
+    __slots__ = ('usrVisibleData', 'usrNonVisibleData', 'srvInfo', 'clientInfo')
+
+    def __init__(self, usrVisibleData=None, usrNonVisibleData=None, srvInfo=None, clientInfo=None):
+        self.usrVisibleData = usrVisibleData
+        self.usrNonVisibleData = usrNonVisibleData
+        self.srvInfo = srvInfo or {}
+        self.clientInfo = clientInfo or {}
+
+
+class BankIdOcspResponse():
+    """Fields of the DER encoded OCSP response in ``completionData.ocspResponse``.
+
+    ``responseStatus`` is 0 when the response is successful. ``certStatus`` is 'good',
+    'revoked' or 'unknown' for the first certificate in the response.
+    """
+
+    __slots__ = ('responseStatus', 'producedAt', 'certStatus')
+
+    def __init__(self, responseStatus, producedAt=None, certStatus=None):
+        self.responseStatus = responseStatus
+        self.producedAt = producedAt
+        self.certStatus = certStatus
+
+
+def decode_base64(value: str) -> memoryview:
+    try:
+        return memoryview(base64.b64decode(value, validate=True))
+    except (binascii.Error, ValueError) as exc:
+        raise ValueError("Value is not valid base64") from exc
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _decode_text(value):
+    if value is None:
+        return None
+    
+    try:
+        return base64.b64decode(value, validate=True).decode('utf-8')
+    except (binascii.Error, ValueError):
+        return value
+
+
+def parse_signed_data(signature: memoryview) -> BankIdSignedData:
+    root = ElementTree.fromstring(bytes(signature))
+    signed_data = next((el for el in root.iter() if _local_name(el.tag) == 'bankIdSignedData'), None)
+    if signed_data is None:
+        return BankIdSignedData()
+    
+    fields = {}
+    for child in signed_data:
+        name = _local_name(child.tag)
+        if len(child):
+            fields[name] = {_local_name(el.tag): el.text for el in child}
+        else:
+            fields[name] = child.text
+    
+    return BankIdSignedData(
+        usrVisibleData=_decode_text(fields.get('usrVisibleData')),
+        usrNonVisibleData=_decode_text(fields.get('usrNonVisibleData')),
+        srvInfo=fields.get('srvInfo'),
+        clientInfo=fields.get('clientInfo'),
+    )
+
+
+def _der_read(data, offset):
+    """Return tag, content start and content end of the DER element at ``offset``."""
+    tag = data[offset]
+    length = data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        size = length & 0x7f
+        length = int.from_bytes(data[offset:offset + size], 'big')
+        offset += size
+    
+    if offset + length > len(data):
+        raise ValueError("Truncated DER element")
+    return tag, offset, offset + length
+
+
+def _der_children(data, start, end):
+    while start < end:
+        tag, content_start, content_end = _der_read(data, start)
+        yield tag, content_start, content_end
+        start = content_end
+
+
+def _generalized_time(value):
+    value = bytes(value).decode('ascii')
+    return datetime.strptime(value[:14], '%Y%m%d%H%M%S').replace(tzinfo=timezone.utc)
+
+
+_CERT_STATUSES = {0x80: 'good', 0xa1: 'revoked', 0x82: 'unknown'}
+
+
+def parse_ocsp_response(ocsp: memoryview) -> BankIdOcspResponse:
+    tag, start, end = _der_read(ocsp, 0)
+    elements = list(_der_children(ocsp, start, end))
+    response_status = int.from_bytes(ocsp[elements[0][1]:elements[0][2]], 'big')
+    if len(elements) < 2:
+        return BankIdOcspResponse(response_status)
+
+    # responseBytes [0] EXPLICIT SEQUENCE { responseType OID, response OCTET STRING }
+    _, start, end = _der_read(ocsp, elements[1][1])
+    _, start, end = list(_der_children(ocsp, start, end))[1]
+
+    # The octet string holds BasicOCSPResponse SEQUENCE { tbsResponseData SEQUENCE {...}, ... }
+    _, start, end = _der_read(ocsp, start)
+    _, start, end = _der_read(ocsp, start)
+
+    produced_at = cert_status = None
+    for tag, content_start, content_end in _der_children(ocsp, start, end):
+        if tag == 0x18 and produced_at is None:
+            produced_at = _generalized_time(ocsp[content_start:content_end])
+        elif tag == 0x30 and produced_at is not None:
+            # responses SEQUENCE OF SingleResponse { certID, certStatus, thisUpdate, ... }
+            _, single_start, single_end = _der_read(ocsp, content_start)
+            single = list(_der_children(ocsp, single_start, single_end))
+            if len(single) > 1:
+                cert_status = _CERT_STATUSES.get(single[1][0])
+            break
+    
+    return BankIdOcspResponse(response_status, produced_at, cert_status)
@@ -0,0 +1,483 @@
+"""Local simulator of the BankID RP API v6.0 for offline and load testing.
+
+``BankIdSimulator`` holds the order state machine and answers ``handler(endpoint, data)``
+calls, so it can be plugged into ``StubAdapter`` for in-process tests. ``SimulatorServer``
+serves it over HTTP(S) with asyncio; point a client at it with ``base_url``::
+
+    python -m bankid6.simulator --port 8080 --latency lognormal:0.05:0.5
+
+    client = BankIdClient(base_url='http://127.0.0.1:8080/rp/v6.0/')
+"""
+import argparse
+import asyncio
+import base64
+import collections
+import math
+import random
+import ssl
+import threading
+import time
+import uuid
+from http.client import responses
+from typing import Callable, Sequence, Tuple
+
+from .codec import JsonCodec, default_codec
+from .compat import get_running_loop
+from .listify import CollectStatuses, HintCodes
+
+
+API_PREFIX = '/rp/v6.0/'
+
+DEFAULT_SCRIPT = (
+    (CollectStatuses.pending, HintCodes.outstandingTransaction),
+    (CollectStatuses.pending, HintCodes.started),
+    (CollectStatuses.pending, HintCodes.userSign),
+    (CollectStatuses.complete, None),
+)
+
+SIMULATED_SIGNATURE = base64.b64encode(
+    b'<?xml version="1.0" encoding="UTF-8"?><Signature xmlns="http://www.w3.org/2000/09/xmldsig#">'
+    b'<SignedInfo/><SignatureValue>c2ltdWxhdG9y</SignatureValue></Signature>'
+).decode('ascii')
+
+SIMULATED_OCSP_RESPONSE = base64.b64encode(b'\x30\x03\x0a\x01\x00').decode('ascii')
+
+
+def fixed_latency(seconds: float) -> Callable[[], float]:
+    return lambda: seconds
+
+
+def uniform_latency(low: float, high: float) -> Callable[[], float]:
+    return lambda: random.uniform(low, high)
+
+
+def lognormal_latency(median: float, sigma: float) -> Callable[[], float]:
+    mu = math.log(median)
+    return lambda: random.lognormvariate(mu, sigma)
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """Latency distribution from ``'0.05'``, ``'uniform:0.02:0.2'`` or ``'lognormal:0.05:0.5'``."""
+    kind, _, args = spec.partition(':')
+    try:
+        if not args:
+            return fixed_latency(float(kind))
+
+        values = [float(value) for value in args.split(':')]
+        if kind == 'fixed':
+            return fixed_latency(*values)
+        if kind == 'uniform':
+            return uniform_latency(*values)
+        if kind == 'lognormal':
+            return lognormal_latency(*values)
+    except (TypeError, ValueError):
+        pass
+
+    raise ValueError(f"Invalid latency '{spec}'. Use SECONDS, uniform:LOW:HIGH or lognormal:MEDIAN:SIGMA")
+
+
+class SimulatedOrder(object):
+    __slots__ = ('orderRef', 'endpoint', 'personalNumber', 'endUserIp', 'created', 'script', 'step', 'collects')
+
+    def __init__(self, endpoint: str, personalNumber: str, endUserIp: str, created: float, script: Sequence) -> None:
+        self.orderRef = str(uuid.uuid4())
+        self.endpoint = endpoint
+        self.personalNumber = personalNumber
+        self.endUserIp = endUserIp
+        self.created = created
+        self.script = script
+        self.step = 0
+        self.collects = 0
+
+
+class BankIdSimulator(object):
+    """In-memory BankID order state machine.
+
+    Every order walks through ``script``, a sequence of ``(status, hintCode)`` steps, moving
+    one step forward every ``collects_per_step`` collects; ``script`` may also be a callable
+    ``(endpoint, data) -> steps`` to script orders individually. Orders that have not
+    finished within ``order_ttl`` seconds fail with ``startFailed``/``expiredTransaction``.
+    Finished and cancelled orders are forgotten, so collecting them again gives
+    ``invalidParameters`` just like the real service. A second order for a personal number
+    with an order in progress cancels both and gives ``alreadyInProgress``.
+
+    ``maintenance_rate`` is the share of calls answered with ``503 maintenance``.
+    """
+
+    def __init__(
+            self, script=DEFAULT_SCRIPT, collects_per_step: int=1, order_ttl: float=30,
+            maintenance_rate: float=0.0, clock: Callable[[], float]=time.monotonic,
+            rng: random.Random=None
+        ) -> None:
+        self.script = script
+        self.collects_per_step = collects_per_step
+        self.order_ttl = order_ttl
+        self.maintenance_rate = maintenance_rate
+        self.clock = clock
+        self.rng = rng or random.Random()
+
+        self.orders = collections.OrderedDict()
+        self.in_progress = {}
+        self.requests = collections.Counter()
+        self.lock = threading.Lock()
+
+        self._routes = {
+            'auth': self._start,
+            'sign': self._start,
+            'phone/auth': self._start,
+            'phone/sign': self._start,
+            'collect': self._collect,
+            'cancel': self._cancel,
+        }
+
+    def __call__(self, endpoint: str, data: dict) -> Tuple[int, dict]:
+        return self.handle(endpoint, data)
+
+    def handle(self, endpoint: str, data: dict) -> Tuple[int, dict]:
+        """Answer one API call with ``(status_code, response_data)``."""
+        route = self._routes.get(endpoint)
+        if route is None:
+            return 404, self._error('notFound', f"No endpoint '{endpoint}'")
+
+        self.requests[endpoint] += 1
+        if self.maintenance_rate and self.rng.random() < self.maintenance_rate:
+            return 503, self._error('maintenance', 'The service is temporarily unavailable')
+
+        if not isinstance(data, dict):
+            return 400, self._error('invalidParameters', 'Request body must be a JSON object')
+
+        with self.lock:
+            return route(endpoint, data)
+
+    def _error(self, error_code: str, details: str) -> dict:
+        return {'errorCode': error_code, 'details': details}
+
+    def _missing(self, data: dict, keys: Sequence[str]):
+        for key in keys:
+            if not data.get(key):
+                return 400, self._error('invalidParameters', f"Missing {key}")
+
+    def _start(self, endpoint: str, data: dict) -> Tuple[int, dict]:
+        phone = endpoint.startswith('phone/')
+        required = ['personalNumber', 'callInitiator'] if phone else ['endUserIp']
+        if endpoint.endswith('sign'):
+            required.append('userVisibleData')
+
+        error = self._missing(data, required)
+        if error:
+            return error
+
+        if phone:
+            personal_number = data['personalNumber']
+        else:
+            personal_number = (data.get('requirement') or {}).get('personalNumber')
+
+        now = self.clock()
+        self._expire(now)
+
+        if personal_number:
+            existing = self.in_progress.pop(personal_number, None)
+            if existing is not None:
+                self.orders.pop(existing, None)
+                return 400, self._error('alreadyInProgress', 'Order already in progress for pno')
+
+        script = self.script(endpoint, data) if callable(self.script) else self.script
+        order = SimulatedOrder(endpoint, personal_number, data.get('endUserIp'), now, script)
+        self.orders[order.orderRef] = order
+        if personal_number:
+            self.in_progress[personal_number] = order.orderRef
+
+        if phone:
+            return 200, {'orderRef': order.orderRef}
+
+        return 200, {
+            'orderRef': order.orderRef,
+            'autoStartToken': str(uuid.uuid4()),
+            'qrStartToken': str(uuid.uuid4()),
+            'qrStartSecret': str(uuid.uuid4()),
+        }
+
+    def _collect(self, endpoint: str, data: dict) -> Tuple[int, dict]:
+        error = self._missing(data, ['orderRef'])
+        if error:
+            return error
+
+        order = self.orders.get(data['orderRef'])
+        if order is None:
+            return 400, self._error('invalidParameters', 'No such order')
+
+        status, hint_code = order.script[order.step]
+        if status == CollectStatuses.pending and self.clock() - order.created > self.order_ttl:
+            if hint_code == HintCodes.outstandingTransaction:
+                status, hint_code = CollectStatuses.failed, HintCodes.startFailed
+            else:
+                status, hint_code = CollectStatuses.failed, HintCodes.expiredTransaction
+
+        if status != CollectStatuses.pending:
+            self._forget(order)
+        else:
+            order.collects += 1
+            if order.collects % self.collects_per_step == 0 and order.step < len(order.script) - 1:
+                order.step += 1
+
+        result = {'orderRef': order.orderRef, 'status': status}
+        if hint_code is not None:
+            result['hintCode'] = hint_code
+        if status == CollectStatuses.complete:
+            result['completionData'] = self._completion_data(order)
+
+        return 200, result
+
+    def _cancel(self, endpoint: str, data: dict) -> Tuple[int, dict]:
+        error = self._missing(data, ['orderRef'])
+        if error:
+            return error
+
+        order = self.orders.get(data['orderRef'])
+        if order is None:
+            return 400, self._error('invalidParameters', 'No such order')
+
+        self._forget(order)
+        return 200, {}
+
+    def _forget(self, order: SimulatedOrder) -> None:
+        self.orders.pop(order.orderRef, None)
+        if order.personalNumber and self.in_progress.get(order.personalNumber) == order.orderRef:
+            del self.in_progress[order.personalNumber]
+
+    def _expire(self, now: float) -> None:
+        # Orders are kept in creation order, so everything expired sits at the front.
+        # Expired orders are dropped after one more order_ttl to leave time for a final collect.
+        deadline = now - 2 * self.order_ttl
+        while self.orders:
+            order = next(iter(self.orders.values()))
+            if order.created >= deadline:
+                break
+            self._forget(order)
+
+    def _completion_data(self, order: SimulatedOrder) -> dict:
+        personal_number = order.personalNumber or '197311108711'
+        return {
+            'user': {
+                'personalNumber': personal_number,
+                'name': 'Test Testsson',
+                'givenName': 'Test',
+                'surname': 'Testsson',
+            },
+            'device': {
+                'ipAddress': order.endUserIp or '127.0.0.1',
+                'uhi': 'OZlzxkAs3b1ju9Q1wZ8q7TzYxUS8',
+            },
+            'stepUp': {'mrtd': False},
+            'bankIdIssueDate': '2024-02-12Z',
+            'signature': SIMULATED_SIGNATURE,
+            'ocspResponse': SIMULATED_OCSP_RESPONSE,
+        }
+
+
+class _SimulatorProtocol(asyncio.Protocol):
+    """Minimal HTTP/1.1 with keep-alive. Requests on a connection are answered in order."""
+
+    def __init__(self, server: 'SimulatorServer') -> None:
+        self.server = server
+        self.transport = None
+        self.buffer = b''
+        self.busy = False
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def connection_lost(self, exc) -> None:
+        self.transport = None
+
+    def data_received(self, data: bytes) -> None:
+        self.buffer += data
+        if not self.busy:
+            self._process()
+
+    def _process(self) -> None:
+        head_end = self.buffer.find(b'\r\n\r\n')
+        if head_end < 0:
+            return
+
+        lines = self.buffer[:head_end].decode('latin-1').split('\r\n')
+        method, _, rest = lines[0].partition(' ')
+        path = rest.rpartition(' ')[0].split('?', 1)[0]
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # Without a valid length the body cannot be framed, so the connection is closed after the answer
+            self.buffer = b''
+            self._respond(400, {'errorCode': 'invalidParameters', 'details': 'Invalid Content-Length'}, False)
+            return
+
+        body_end = head_end + 4 + length
+        if len(self.buffer) < body_end:
+            return
+
+        body = self.buffer[head_end + 4:body_end]
+        self.buffer = self.buffer[body_end:]
+        keep_alive = headers.get('connection', '').lower() != 'close'
+
+        if method != 'POST':
+            status_code, data = 405, {'errorCode': 'methodNotAllowed', 'details': 'Use POST'}
+        else:
+            status_code, data = self.server.dispatch(path, body)
+
+        self.busy = True
+        delay = self.server.latency() if self.server.latency else 0
+        if delay > 0:
+            self.server.loop.call_later(delay, self._respond, status_code, data, keep_alive)
+        else:
+            self._respond(status_code, data, keep_alive)
+
+    def _respond(self, status_code: int, data: dict, keep_alive: bool) -> None:
+        self.busy = False
+        if self.transport is None:
+            return
+
+        content = self.server.codec.dumps(data)
+        connection = '' if keep_alive else 'Connection: close\r\n'
+        head = (
+            f"HTTP/1.1 {status_code} {responses.get(status_code, 'Unknown')}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(content)}\r\n{connection}\r\n"
+        )
+        self.transport.write(head.encode('latin-1') + content)
+        if not keep_alive:
+            self.transport.close()
+        elif self.buffer:
+            self._process()
+
+
+class SimulatorServer(object):
+    """Serves a ``BankIdSimulator`` over HTTP, or HTTPS when ``ssl_context`` is given.
+
+    ``latency`` is a callable giving the delay in seconds of every response, see
+    ``fixed_latency``, ``uniform_latency`` and ``lognormal_latency``. Use ``await start()`` in
+    a running event loop, or ``start_in_thread()`` to run the server next to sync code.
+    """
+
+    def __init__(
+            self, simulator: BankIdSimulator=None, host: str='127.0.0.1', port: int=0,
+            latency: Callable[[], float]=None, ssl_context: ssl.SSLContext=None, codec: JsonCodec=None
+        ) -> None:
+        self.simulator = simulator or BankIdSimulator()
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.ssl_context = ssl_context
+        self.codec = codec or default_codec()
+
+        self.loop = None
+        self.server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        scheme = 'https' if self.ssl_context else 'http'
+        return f"{scheme}://{self.host}:{self.port}{API_PREFIX}"
+
+    def dispatch(self, path: str, body: bytes) -> Tuple[int, dict]:
+        endpoint = path[len(API_PREFIX):] if path.startswith(API_PREFIX) else path.lstrip('/')
+        try:
+            data = self.codec.loads(body) if body else {}
+        except ValueError:
+            return 400, {'errorCode': 'invalidParameters', 'details': 'Invalid JSON'}
+
+        return self.simulator.handle(endpoint, data)
+
+    async def start(self) -> str:
+        self.loop = get_running_loop()
+        self.server = await self.loop.create_server(
+            lambda: _SimulatorProtocol(self), self.host, self.port, ssl=self.ssl_context
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.url
+
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    def start_in_thread(self) -> str:
+        """Run the server on its own event loop in a daemon thread and return its URL."""
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.start())
+            started.set()
+            loop.run_forever()
+            loop.run_until_complete(self.close())
+            loop.close()
+
+        self._thread = threading.Thread(target=run, name='bankid-simulator', daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.url
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        self.start_in_thread()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m bankid6.simulator', description='Local BankID RP API v6.0 simulator')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=parse_latency, help='SECONDS, uniform:LOW:HIGH or lognormal:MEDIAN:SIGMA')
+    parser.add_argument('--collects-per-step', type=int, default=1, help='collects before the hintCode moves on')
+    parser.add_argument('--order-ttl', type=float, default=30, help='seconds before a pending order expires')
+    parser.add_argument('--maintenance-rate', type=float, default=0.0, help='share of calls answered with 503 maintenance')
+    parser.add_argument('--certfile', help='serve HTTPS with this certificate')
+    parser.add_argument('--keyfile', help='private key of --certfile')
+    args = parser.parse_args(argv)
+
+    ssl_context = None
+    if args.certfile:
+        ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ssl_context.load_cert_chain(args.certfile, args.keyfile)
+
+    simulator = BankIdSimulator(
+        collects_per_step=args.collects_per_step, order_ttl=args.order_ttl,
+        maintenance_rate=args.maintenance_rate
+    )
+    server = SimulatorServer(simulator, args.host, args.port, latency=args.latency, ssl_context=ssl_context)
+
+    async def serve():
+        print(f"BankID simulator listening on {await server.start()}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.close()
+
+    try:
+        if hasattr(asyncio, 'run'):
+            asyncio.run(serve())
+        else:
+            # Python 3.6
+            asyncio.get_event_loop().run_until_complete(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,330 @@
+"""Order state shared between workers.
+
+A client given a ``store`` records every order it starts there, so any worker using the same
+store can collect the order or render its QR code knowing only the ``orderRef``::
+
+    store = SQLiteOrderStore('/var/run/myapp/bankid-orders.db')
+    bankid_client = BankIdClient(store=store)
+
+    order = bankid_client.auth('192.168.0.1')       # worker A
+    bankid_client.qr_data(orderRef)                 # worker B
+    bankid_client.collect(orderRef)                 # worker C
+
+Entries live as long as BankID lets an order be collected: ``PENDING_TTL`` after the start,
+then ``COMPLETE_TTL`` or ``FAILED_TTL`` after the final collect.
+"""
+import collections
+import logging
+import sqlite3
+import threading
+import time
+
+from .qr import QrFrames
+
+
+logger = logging.getLogger(__name__)
+
+# Orders never picked up can be collected for 3 minutes and 10 seconds, completed orders for
+# 3 minutes and failed orders for 5 minutes.
+PENDING_TTL = 190.0
+COMPLETE_TTL = 180.0
+FAILED_TTL = 300.0
+
+
+class OrderState():
+    """What is needed to follow up on an order from another worker."""
+
+    __slots__ = (
+        'orderRef', 'order_time', 'qrStartToken', 'qrStartSecret', 'started', 'is_mobile', 'last_collect',
+        '_qr_frames'
+    )
+
+    def __init__(
+            self, orderRef: str, order_time: int=None, qrStartToken: str=None, qrStartSecret: str=None,
+            started: float=None
+        ) -> None:
+        self.orderRef = orderRef
+        self.order_time = order_time
+        self.qrStartToken = qrStartToken
+        self.qrStartSecret = qrStartSecret
+        # When the order started, phone orders included; feeds the order duration metric
+        self.started = started
+        self.is_mobile = None
+        self.last_collect = None
+        self._qr_frames = None
+
+    @classmethod
+    def from_order(cls, order) -> 'OrderState':
+        """State of a start response returned by ``auth``, ``sign`` or ``phone_*``."""
+        state = cls(
+            order.orderRef, getattr(order, 'order_time', None), getattr(order, 'qrStartToken', None),
+            getattr(order, 'qrStartSecret', None), getattr(order, 'started', None) or time.time()
+        )
+        state.is_mobile = getattr(order, '_is_mobile', getattr(order, 'is_mobile', None))
+        return state
+
+    @property
+    def qr_frames(self) -> QrFrames:
+        if self._qr_frames is None and self.qrStartSecret is not None:
+            self._qr_frames = QrFrames(self.order_time, self.qrStartToken, self.qrStartSecret)
+        return self._qr_frames
+
+    @property
+    def qr_data(self) -> str:
+        if self.qr_frames is not None:
+            return self.qr_frames.current()
+
+    def __repr__(self) -> str:
+        return f'<OrderState {self.orderRef}>'
+
+
+class OrderStore():
+    """Interface of the order stores. All methods must be safe to call from several threads.
+
+    ``AsyncBankIdClient`` runs ``get`` of a ``blocking`` store in the loop's default executor.
+    """
+
+    blocking = True
+
+    def put(self, state: OrderState, ttl: float=PENDING_TTL) -> None:
+        raise NotImplementedError
+
+    def get(self, orderRef: str) -> OrderState:
+        """The state of ``orderRef``, or ``None`` if it is unknown or expired."""
+        raise NotImplementedError
+
+    def set_ttl(self, orderRef: str, ttl: float) -> None:
+        """Let ``orderRef`` expire ``ttl`` seconds from now."""
+        raise NotImplementedError
+
+    def delete(self, orderRef: str) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class MemoryOrderStore(OrderStore):
+    """Store for the threads of one process, keeping at most ``maxsize`` orders (least recently used go first)."""
+
+    blocking = False
+
+    def __init__(self, maxsize: int=10000, clock=time.time) -> None:
+        self.maxsize = maxsize
+        self.clock = clock
+        self._orders = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._orders)
+
+    def put(self, state: OrderState, ttl: float=PENDING_TTL) -> None:
+        with self._lock:
+            self._orders[state.orderRef] = (state, self.clock() + ttl)
+            self._orders.move_to_end(state.orderRef)
+            while len(self._orders) > self.maxsize:
+                self._orders.popitem(last=False)
+
+    def get(self, orderRef: str) -> OrderState:
+        with self._lock:
+            entry = self._orders.get(orderRef)
+            if entry is None:
+                return None
+            if entry[1] <= self.clock():
+                del self._orders[orderRef]
+                return None
+            self._orders.move_to_end(orderRef)
+            return entry[0]
+
+    def set_ttl(self, orderRef: str, ttl: float) -> None:
+        with self._lock:
+            entry = self._orders.get(orderRef)
+            if entry is not None:
+                self._orders[orderRef] = (entry[0], self.clock() + ttl)
+
+    def delete(self, orderRef: str) -> None:
+        with self._lock:
+            self._orders.pop(orderRef, None)
+
+
+class SQLiteOrderStore(OrderStore):
+    """Store in an SQLite database file in WAL mode, shared by all processes on one host.
+
+    Writes are buffered and committed in batches by a background thread every
+    ``flush_interval`` seconds, or at once when ``max_batch`` are waiting, so starting orders
+    does not wait for the disk. Reads in this process see buffered writes immediately, other
+    processes once they are flushed. Expired orders are deleted every ``vacuum_interval`` seconds.
+    """
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS bankid_orders ('
+        'orderRef TEXT PRIMARY KEY, order_time INTEGER, qrStartToken TEXT, qrStartSecret TEXT, '
+        'started REAL, is_mobile INTEGER, expires REAL NOT NULL)'
+    )
+
+    def __init__(
+            self, path: str, flush_interval: float=0.05, max_batch: int=500, vacuum_interval: float=60.0,
+            clock=time.time
+        ) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.vacuum_interval = vacuum_interval
+        self.clock = clock
+
+        self._writer = self._connect()
+        self._writer.execute('PRAGMA journal_mode=WAL')
+        self._writer.execute(self.SCHEMA)
+        self._writer.commit()
+        self._vacuumed = self.clock()
+
+        # orderRef -> (state, expires) to upsert, (None, expires) to update the expiry, or None to delete
+        self._pending = {}
+        self._flushing = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='bankid6-order-store', daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False)
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def _reader(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    def _queue(self, orderRef, entry):
+        with self._lock:
+            self._pending[orderRef] = entry
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._flush_logged()
+
+    def put(self, state: OrderState, ttl: float=PENDING_TTL) -> None:
+        self._queue(state.orderRef, (state, self.clock() + ttl))
+
+    def set_ttl(self, orderRef: str, ttl: float) -> None:
+        expires = self.clock() + ttl
+        with self._lock:
+            entry = self._pending.get(orderRef, (None, None))
+            if entry is None:
+                return
+            self._pending[orderRef] = (entry[0], expires)
+
+    def delete(self, orderRef: str) -> None:
+        self._queue(orderRef, None)
+
+    def get(self, orderRef: str) -> OrderState:
+        now = self.clock()
+        with self._lock:
+            entry = self._pending.get(orderRef, False)
+            if entry is False:
+                entry = self._flushing.get(orderRef, False)
+        if entry is None:
+            return None
+        if entry is not False and entry[0] is not None:
+            return entry[0] if entry[1] > now else None
+
+        row = self._reader().execute(
+            'SELECT order_time, qrStartToken, qrStartSecret, started, is_mobile, expires FROM bankid_orders WHERE orderRef = ?',
+            (orderRef,)
+        ).fetchone()
+        if row is None:
+            return None
+        expires = entry[1] if entry is not False else row[5]
+        if expires <= now:
+            return None
+        state = OrderState(orderRef, *row[:4])
+        state.is_mobile = None if row[4] is None else bool(row[4])
+        return state
+
+    def flush(self) -> None:
+        """Commit the buffered writes; if that fails they are queued again and the error is raised."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._flushing = pending
+
+            upserts, updates, deletes = [], [], []
+            for order_ref, entry in pending.items():
+                if entry is None:
+                    deletes.append((order_ref,))
+                elif entry[0] is None:
+                    updates.append((entry[1], order_ref))
+                else:
+                    state = entry[0]
+                    upserts.append(
+                        (
+                            order_ref, state.order_time, state.qrStartToken, state.qrStartSecret, state.started,
+                            state.is_mobile, entry[1]
+                        )
+                    )
+
+            now = self.clock()
+            vacuum = now - self._vacuumed >= self.vacuum_interval
+            if not (upserts or updates or deletes or vacuum):
+                return
+
+            try:
+                self._write(upserts, updates, deletes, now if vacuum else None)
+            except BaseException:
+                with self._lock:
+                    self._requeue(pending)
+                raise
+            finally:
+                with self._lock:
+                    self._flushing = {}
+
+    def _requeue(self, failed):
+        """Put a batch that could not be written back in front of the writes queued since."""
+        for order_ref, entry in failed.items():
+            newer = self._pending.get(order_ref, False)
+            if newer is False:
+                self._pending[order_ref] = entry
+            elif newer is not None and newer[0] is None and entry is not None and entry[0] is not None:
+                # Only the expiry changed since; keep the state the failed batch was to write
+                self._pending[order_ref] = (entry[0], newer[1])
+
+    def _flush_logged(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Writing orders to %s failed, retrying with the next flush", self.path)
+
+    def _write(self, upserts, updates, deletes, vacuum_before):
+        with self._writer:
+            if upserts:
+                self._writer.executemany('INSERT OR REPLACE INTO bankid_orders VALUES (?, ?, ?, ?, ?, ?, ?)', upserts)
+            if updates:
+                self._writer.executemany('UPDATE bankid_orders SET expires = ? WHERE orderRef = ?', updates)
+            if deletes:
+                self._writer.executemany('DELETE FROM bankid_orders WHERE orderRef = ?', deletes)
+            if vacuum_before is not None:
+                self._writer.execute('DELETE FROM bankid_orders WHERE expires <= ?', (vacuum_before,))
+                self._vacuumed = vacuum_before
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self._flush_logged()
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+        self._writer.close()
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
@@ -0,0 +1,133 @@
+"""Per-request phase timings for diagnosing slow BankID calls.
+
+With ``BankIdClient(timings=True)`` every response object and every ``BankIdError`` has a
+``timings`` attribute holding a ``RequestTimings``. All values are in seconds:
+
+- ``connect`` DNS lookup and TCP connect, ``None`` when the connection was reused
+- ``tls`` TLS handshake with the client certificate, ``None`` when the connection was reused.
+  ``AsyncBankIdClient`` cannot separate it from ``connect`` and includes it there
+- ``reused`` whether an open pooled connection was used
+- ``ttfb`` from sending the request until the response headers arrived, i.e. BankID's server time plus one round trip
+- ``read`` reading the response body
+- ``decode`` decoding the JSON body
+- ``total`` the whole HTTP exchange including all of the above
+"""
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class RequestTimings(object):
+    __slots__ = ('connect', 'tls', 'reused', 'ttfb', 'read', 'decode', 'total')
+
+    def __init__(self) -> None:
+        self.connect = None
+        self.tls = None
+        self.reused = True
+        self.ttfb = None
+        self.read = None
+        self.decode = None
+        self.total = None
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        phases = ', '.join(
+            f'{name}={value * 1000:.1f}ms' for name, value in self.to_dict().items()
+            if isinstance(value, float)
+        )
+        return f'<RequestTimings reused={self.reused} {phases}>'
+
+
+# The timings of the request currently sent by this thread, filled in by the connection classes.
+_local = threading.local()
+
+
+class _TimingConnectionMixin(object):
+    def _new_conn(self):
+        started = time.perf_counter()
+        sock = super()._new_conn()
+        timings = getattr(_local, 'timings', None)
+        if timings is not None:
+            timings.connect = time.perf_counter() - started
+        return sock
+
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        timings = getattr(_local, 'timings', None)
+        if timings is not None:
+            timings.reused = False
+            if isinstance(self, HTTPSConnection):
+                timings.tls = time.perf_counter() - started - (timings.connect or 0)
+
+
+class TimingHTTPConnection(_TimingConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimingHTTPSConnection(_TimingConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimingHTTPConnection
+
+
+class TimingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimingHTTPSConnection
+
+
+class TimingHTTPAdapter(HTTPAdapter):
+    """``HTTPAdapter`` setting ``timings`` (connect, TLS, reuse, time to first byte) on every response."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimingHTTPConnectionPool,
+            'https': TimingHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):
+        timings = RequestTimings()
+        _local.timings = timings
+        started = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+        finally:
+            _local.timings = None
+
+        timings.ttfb = time.perf_counter() - started - (timings.connect or 0) - (timings.tls or 0)
+        response.timings = timings
+        return response
+
+
+def aiohttp_trace_config():
+    """``aiohttp.TraceConfig`` filling in the ``RequestTimings`` given as ``trace_request_ctx``."""
+    import aiohttp
+
+    async def on_request_start(session, context, params):
+        context.started = time.perf_counter()
+
+    async def on_connection_create_start(session, context, params):
+        context.connect_started = time.perf_counter()
+
+    async def on_connection_create_end(session, context, params):
+        timings = context.trace_request_ctx
+        timings.reused = False
+        timings.connect = time.perf_counter() - context.connect_started
+
+    async def on_request_end(session, context, params):
+        timings = context.trace_request_ctx
+        timings.ttfb = time.perf_counter() - context.started - (timings.connect or 0)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_request_end.append(on_request_end)
+    return trace_config
@@ -0,0 +1,200 @@
+"""Compact encrypted order tokens for a stateless web tier.
+
+A token carries the ``orderRef``, ``qrStartToken``, ``qrStartSecret``, ``order_time`` and
+``is_mobile`` of an order, so the browser or a cookie can hold the order state instead of a
+shared store::
+
+    tokens = OrderTokens(settings.BANKID_TOKEN_KEY)
+    token = tokens.encode(bankid_client.auth('192.168.0.1'))     # give to the browser
+    ...
+    generate_qr_data(token=token, key=settings.BANKID_TOKEN_KEY)  # on every QR poll
+    bankid_client.collect(token=token)                            # with BankIdClient(token_key=...)
+
+Tokens are encrypted and authenticated with keys derived from the server key, using only
+``hashlib``: BLAKE2b in counter mode as the keystream and a keyed BLAKE2b tag over the whole
+token (encrypt-then-MAC). The layout is ``version | nonce (12) | ciphertext | tag (16)``,
+base64url encoded without padding; about 110 characters for the UUIDs BankID returns.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import struct
+import time
+import uuid
+from functools import lru_cache
+from typing import Iterable, Union
+
+from .exceptions import BankIdTokenError
+from .store import OrderState
+
+
+VERSION = 1
+NONCE_SIZE = 12
+TAG_SIZE = 16
+
+_HEADER = bytes([VERSION])
+_TIME = struct.Struct('>BI')
+_COUNTER = struct.Struct('>I')
+
+FLAG_MOBILE = 1
+FLAG_UUID = 2
+# The time field is when the token was made, for orders without an order_time (phone orders)
+FLAG_ISSUED = 4
+
+
+def _derive(key: bytes, purpose: bytes) -> bytes:
+    return hashlib.blake2b(purpose, key=hashlib.blake2b(key).digest(), digest_size=32).digest()
+
+
+def _is_uuid(value: str) -> bool:
+    try:
+        return str(uuid.UUID(value)) == value
+    except (TypeError, ValueError):
+        return False
+
+
+def _uuid_str(raw: bytes) -> str:
+    h = raw.hex()
+    return f'{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}'
+
+
+class _TokenKey():
+    """Keyed BLAKE2b states of one server key; every token hashes a copy of them."""
+
+    __slots__ = ('_enc', '_mac')
+
+    def __init__(self, key: Union[str, bytes]) -> None:
+        if isinstance(key, str):
+            key = key.encode()
+        if len(key) < 16:
+            raise ValueError("The order token key must be at least 16 bytes")
+        self._enc = hashlib.blake2b(key=_derive(key, b'bankid6 order token encryption'))
+        self._mac = hashlib.blake2b(key=_derive(key, b'bankid6 order token authentication'), digest_size=TAG_SIZE)
+
+    def keystream(self, nonce: bytes, size: int) -> bytes:
+        blocks = []
+        for counter in range((size + 63) // 64):
+            block = self._enc.copy()
+            block.update(nonce + _COUNTER.pack(counter))
+            blocks.append(block.digest())
+        return b''.join(blocks)[:size]
+
+    def tag(self, data: bytes) -> bytes:
+        mac = self._mac.copy()
+        mac.update(data)
+        return mac.digest()
+
+
+def _xor(data: bytes, keystream: bytes) -> bytes:
+    size = len(data)
+    return (int.from_bytes(data, 'big') ^ int.from_bytes(keystream, 'big')).to_bytes(size, 'big')
+
+
+class OrderTokens():
+    """Encodes orders into tokens and back with ``key``.
+
+    Tokens made with any of ``old_keys`` are still accepted, to rotate the key without
+    logging users out. Tokens are rejected ``max_age`` seconds after the order started, or for
+    phone orders, which have no ``order_time``, after the token was made.
+    """
+
+    def __init__(self, key: Union[str, bytes], old_keys: Iterable[Union[str, bytes]]=(), max_age: float=600.0) -> None:
+        self._key = _TokenKey(key)
+        self._keys = [self._key] + [_TokenKey(old_key) for old_key in old_keys]
+        self.max_age = max_age
+
+    def _pack(self, order_ref, order_time, qr_start_token, qr_start_secret, is_mobile):
+        flags = FLAG_MOBILE if is_mobile else 0
+        fields = (order_ref, qr_start_token or '', qr_start_secret or '')
+        if all(_is_uuid(field) for field in fields):
+            body = b''.join(uuid.UUID(field).bytes for field in fields)
+            flags |= FLAG_UUID
+        else:
+            parts = []
+            for field in fields:
+                encoded = field.encode()
+                if len(encoded) > 255:
+                    raise BankIdTokenError("Order fields longer than 255 bytes cannot be put in a token")
+                parts.append(bytes([len(encoded)]) + encoded)
+            body = b''.join(parts)
+        if not order_time:
+            flags |= FLAG_ISSUED
+            order_time = time.time()
+        return _TIME.pack(flags, int(order_time)) + body
+
+    def _unpack(self, plaintext):
+        flags, timestamp = _TIME.unpack_from(plaintext)
+        body = plaintext[_TIME.size:]
+        if flags & FLAG_UUID:
+            if len(body) != 48:
+                raise BankIdTokenError("Malformed order token")
+            fields = [_uuid_str(body[i:i + 16]) for i in (0, 16, 32)]
+        else:
+            fields = []
+            offset = 0
+            for _ in range(3):
+                if offset >= len(body):
+                    raise BankIdTokenError("Malformed order token")
+                size = body[offset]
+                fields.append(body[offset + 1:offset + 1 + size].decode())
+                offset += 1 + size
+
+        order_time = None if flags & FLAG_ISSUED else timestamp
+        state = OrderState(fields[0], order_time, fields[1] or None, fields[2] or None, timestamp)
+        state.is_mobile = bool(flags & FLAG_MOBILE)
+        return timestamp, state
+
+    def encode(self, order, is_mobile: bool=None) -> str:
+        """Token of a start response, an ``OrderState`` or any object with the same attributes."""
+        if is_mobile is None:
+            is_mobile = getattr(order, '_is_mobile', getattr(order, 'is_mobile', False))
+        plaintext = self._pack(
+            order.orderRef, getattr(order, 'order_time', None), getattr(order, 'qrStartToken', None),
+            getattr(order, 'qrStartSecret', None), is_mobile
+        )
+
+        nonce = os.urandom(NONCE_SIZE)
+        data = _HEADER + nonce + _xor(plaintext, self._key.keystream(nonce, len(plaintext)))
+        return base64.urlsafe_b64encode(data + self._key.tag(data)).rstrip(b'=').decode()
+
+    def decode(self, token: str, now: float=None) -> OrderState:
+        """The order state in ``token``; raises ``BankIdTokenError`` if it is forged, corrupted or expired."""
+        try:
+            raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        except (TypeError, ValueError):
+            raise BankIdTokenError("Malformed order token")
+        if len(raw) < 1 + NONCE_SIZE + _TIME.size + TAG_SIZE or raw[0] != VERSION:
+            raise BankIdTokenError("Malformed order token")
+
+        data, tag = raw[:-TAG_SIZE], raw[-TAG_SIZE:]
+        for key in self._keys:
+            if hmac.compare_digest(key.tag(data), tag):
+                break
+        else:
+            raise BankIdTokenError("Invalid order token")
+
+        nonce, ciphertext = data[1:1 + NONCE_SIZE], data[1 + NONCE_SIZE:]
+        try:
+            timestamp, state = self._unpack(_xor(ciphertext, key.keystream(nonce, len(ciphertext))))
+        except (struct.error, ValueError):
+            raise BankIdTokenError("Malformed order token")
+
+        if self.max_age is not None and (time.time() if now is None else now) - timestamp > self.max_age:
+            raise BankIdTokenError("Order token has expired")
+        return state
+
+
+@lru_cache(maxsize=16)
+def _order_tokens(key):
+    return OrderTokens(key)
+
+
+def encode_order_token(order, key: Union[str, bytes]) -> str:
+    """Token of ``order`` made with ``key``; see ``OrderTokens.encode``."""
+    return _order_tokens(key).encode(order)
+
+
+def decode_order_token(token: str, key: Union[str, bytes]) -> OrderState:
+    """Order state in ``token`` made with ``key``; see ``OrderTokens.decode``."""
+    return _order_tokens(key).decode(token)
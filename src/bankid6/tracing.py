@@ -0,0 +1,169 @@
+"""Tracing hooks around every BankID call.
+
+Each client call is a ``bankid.<endpoint>`` span with ``bankid.validate`` (``RequestParams.clean``),
+``bankid.http`` (the HTTP post), ``bankid.check_error`` (``check_bankid_error``) and
+``bankid.response`` (response construction) child spans. Spans carry ``endpoint``, ``orderRef``,
+``http.status_code``, ``status`` and ``hintCode`` attributes when known.
+
+Tracing is off by default (``NoopTracer``). Record spans with::
+
+    exporter = InMemoryExporter(maxlen=1000)
+    bankid_client = BankIdClient(tracer=RecordingTracer(exporter))
+    ...
+    exporter.spans()
+
+To forward spans to another tracing backend, give ``RecordingTracer`` an exporter with an
+``export(span)`` method, or implement ``Tracer.start_span`` on top of the backend's own API.
+"""
+import collections
+import random
+import time
+from typing import List
+
+from .compat import context_var
+
+
+_current_span = context_var('bankid_current_span')
+
+
+def current_span():
+    """The span active in the current thread or task, if any."""
+    return _current_span.get()
+
+
+class Span(object):
+    __slots__ = (
+        'name', 'trace_id', 'span_id', 'parent_id', 'attributes', 'start_time', 'duration', 'error',
+        '_tracer', '_started', '_token'
+    )
+
+    def __init__(self, tracer: 'RecordingTracer', name: str, attributes: dict=None, parent: 'Span'=None) -> None:
+        self.name = name
+        self.span_id = random.getrandbits(64)
+        if parent is not None:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+        else:
+            self.trace_id = random.getrandbits(64)
+            self.parent_id = None
+        self.attributes = dict(attributes) if attributes else {}
+        self.start_time = time.time()
+        self.duration = None
+        self.error = None
+
+        self._tracer = tracer
+        self._started = time.perf_counter()
+        self._token = None
+
+    def set_attribute(self, key: str, value) -> None:
+        if value is not None:
+            self.attributes[key] = value
+
+    def record_exception(self, exc: BaseException) -> None:
+        self.error = f'{type(exc).__name__}: {exc}'
+
+    def end(self) -> None:
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._started
+            self._tracer.exporter.export(self)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.record_exception(exc)
+        _current_span.reset(self._token)
+        self.end()
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'trace_id': f'{self.trace_id:016x}',
+            'span_id': f'{self.span_id:016x}',
+            'parent_id': f'{self.parent_id:016x}' if self.parent_id is not None else None,
+            'start_time': self.start_time,
+            'duration': self.duration,
+            'attributes': dict(self.attributes),
+            'error': self.error,
+        }
+
+    def __repr__(self) -> str:
+        return f'<Span {self.name} {self.attributes}>'
+
+
+class _NoopSpan(object):
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value) -> None:
+        pass
+
+    def record_exception(self, exc: BaseException) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer(object):
+    """Creates the spans of the client. ``start_span`` returns a context manager that is the span."""
+
+    def start_span(self, name: str, attributes: dict=None):
+        raise NotImplementedError
+
+
+class NoopTracer(Tracer):
+    def start_span(self, name: str, attributes: dict=None):
+        return NOOP_SPAN
+
+
+NOOP_TRACER = NoopTracer()
+
+
+class RecordingTracer(Tracer):
+    """Records ``Span`` objects, nested under the current span, and hands finished ones to ``exporter``."""
+
+    def __init__(self, exporter) -> None:
+        self.exporter = exporter
+
+    def start_span(self, name: str, attributes: dict=None) -> Span:
+        return Span(self, name, attributes, parent=_current_span.get())
+
+
+class InMemoryExporter(object):
+    """Keeps the last ``maxlen`` finished spans, for tests and debug endpoints."""
+
+    def __init__(self, maxlen: int=1000) -> None:
+        self._spans = collections.deque(maxlen=maxlen)
+
+    def export(self, span: Span) -> None:
+        self._spans.append(span)
+
+    def spans(self, name: str=None) -> List[Span]:
+        spans = list(self._spans)
+        if name is not None:
+            spans = [span for span in spans if span.name == name]
+        return spans
+
+    def traces(self) -> dict:
+        """Finished spans grouped by trace id, each trace in the order its spans ended."""
+        traces = collections.OrderedDict()
+        for span in list(self._spans):
+            traces.setdefault(f'{span.trace_id:016x}', []).append(span)
+        return traces
+
+    def to_dicts(self) -> List[dict]:
+        return [span.to_dict() for span in list(self._spans)]
+
+    def clear(self) -> None:
+        self._spans.clear()
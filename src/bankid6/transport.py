@@ -0,0 +1,83 @@
+from http.client import responses
+from urllib.parse import urlsplit
+
+from requests import Response
+from requests.adapters import BaseAdapter
+
+from .codec import JsonCodec
+
+
+_json_codec = JsonCodec()
+
+
+class BankIdHttpResponse():
+    """Already-read HTTP response exposing the subset of ``requests.Response`` used by handlers.
+
+    The body is decoded once with ``codec`` and the result is reused by every later
+    ``json()`` call. Other attributes are looked up on the wrapped ``raw`` response, if any.
+    """
+
+    def __init__(
+            self, status_code: int, content: bytes, url: str, headers: dict=None, codec=None, raw=None
+        ):
+        self.status_code = status_code
+        self.content = content
+        self.url = url
+        self.headers = headers if headers is not None else {}
+        self.codec = codec or _json_codec
+        self.raw = raw
+        self.timings = None
+        self._data = None
+    
+    def __getattr__(self, name):
+        raw = self.__dict__.get('raw')
+        if raw is None:
+            raise AttributeError(name)
+        return getattr(raw, name)
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+    
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+    
+    def json(self):
+        if self._data is None:
+            self._data = self.codec.loads(self.content)
+        return self._data
+
+
+class StubAdapter(BaseAdapter):
+    """In-process ``requests`` transport that answers BankID calls without any network.
+
+    ``handler(endpoint, data)`` is called with the endpoint relative to the API root
+    (``'auth'``, ``'phone/sign'``, ``'collect'``, ...) and the decoded request body, and returns
+    ``(status_code, response_data)``. Mount it on a client's session::
+
+        bankid_client.client.mount(bankid_client.api_url, StubAdapter(handler))
+    """
+
+    def __init__(self, handler, codec=None) -> None:
+        super().__init__()
+        self.handler = handler
+        self.codec = codec or _json_codec
+
+    def send(self, request, **kwargs):
+        endpoint = urlsplit(request.url).path.split('/rp/v6.0/', 1)[-1]
+        data = self.codec.loads(request.body) if request.body else {}
+        status_code, response_data = self.handler(endpoint, data)
+
+        response = Response()
+        response.status_code = status_code
+        response.reason = responses.get(status_code, '')
+        response._content = self.codec.dumps(response_data)
+        response.headers['Content-Type'] = 'application/json'
+        response.url = request.url
+        response.request = request
+        response.encoding = 'utf-8'
+        return response
+    
+    def close(self):
+        pass
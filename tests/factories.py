@@ -1,5 +1,9 @@
 from unittest.mock import MagicMock
 
+from bankid6 import BankIdClient
+from bankid6.simulator import BankIdSimulator
+from bankid6.transport import StubAdapter
+
 
 def response_factory(status, data, text="test", url="test", ok=True):
     # Create a mock response object
@@ -14,6 +18,23 @@ def response_factory(status, data, text="test", url="test", ok=True):
 
     return response_mock
 
+
+class FakeClock():
+    """Clock for the ``clock`` parameters that only moves when ``now`` is changed."""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def stub_client(handler=None, **kwargs):
+    """``BankIdClient`` answered in process by ``handler(endpoint, data)``, a new ``BankIdSimulator`` by default."""
+    client = BankIdClient(**kwargs)
+    client.client.mount(client.api_url, StubAdapter(handler if handler is not None else BankIdSimulator()))
+    return client
+
 TEST_START_RESPONSE_DATA = {
     'orderRef': '894c311b-0bcb-4d65-bb5b-7580c300f098',
     'autoStartToken': '79439e65-1862-4b27-aefb-dacdb9e62cba',
@@ -0,0 +1,111 @@
+import asyncio
+import threading
+
+import pytest
+
+from bankid6 import BankIdError, BankIdOverloadError
+from bankid6.admission import AdmissionController
+from bankid6.metrics import BankIdMetrics
+from bankid6.simulator import BankIdSimulator
+
+from .factories import stub_client
+
+
+def test_admission_caps_and_frees_slots():
+    admission = AdmissionController(max_orders=2, max_queue=0)
+
+    assert admission.admit() == 0.0
+    admission.started('a')
+    admission.admit()
+    admission.release()
+    admission.admit()
+    admission.started('b')
+    assert admission.live == 2 and 'a' in admission
+
+    with pytest.raises(BankIdOverloadError) as exc:
+        admission.admit()
+    assert exc.value.retry_after >= 1.0
+    assert exc.value.live_orders == 2
+
+    admission.finish('a')
+    admission.finish('a')
+    admission.admit()
+    assert admission.live == 2
+    assert admission.stats()['rejected'] == 1
+
+
+def test_queue_waits_for_a_slot_and_times_out():
+    admission = AdmissionController(max_orders=1, max_queue=1, queue_timeout=1.0)
+    admission.admit()
+    admission.started('a')
+
+    threading.Timer(0.05, admission.finish, args=('a',)).start()
+    assert 0.03 <= admission.admit() < 0.9
+    admission.started('b')
+
+    admission.queue_timeout = 0.05
+    with pytest.raises(BankIdOverloadError):
+        admission.admit()
+    assert admission.queued == 0
+    assert admission.stats()['max_wait'] >= 0.03
+
+
+def test_orders_expire_after_ttl():
+    now = [0.0]
+    admission = AdmissionController(max_orders=1, max_queue=0, order_ttl=10.0, clock=lambda: now[0])
+    admission.admit()
+    admission.started('a')
+
+    now[0] = 10.0
+    admission.admit()
+    assert 'a' not in admission
+    assert admission.expired == 1
+
+
+def test_async_admit():
+    admission = AdmissionController(max_orders=1, queue_timeout=1.0)
+
+    async def main():
+        await admission.admit_async()
+        admission.started('a')
+        asyncio.get_event_loop().call_later(0.03, admission.finish, 'a')
+        return await admission.admit_async()
+
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(main()) >= 0.02
+    finally:
+        loop.close()
+
+
+def test_client_admission():
+    metrics = BankIdMetrics()
+    admission = AdmissionController(max_orders=1, max_queue=0)
+    bc = stub_client(BankIdSimulator(collects_per_step=1), admission=admission, metrics=metrics)
+
+    order = bc.auth('127.0.0.1')
+    assert order.orderRef in admission
+    with pytest.raises(BankIdOverloadError):
+        bc.sign('127.0.0.1', 'Sign this')
+
+    while order.collect().status == 'pending':
+        pass
+    assert admission.live == 0
+
+    order = bc.auth('127.0.0.1')
+    order.cancel()
+    assert admission.live == 0
+
+    exposition = metrics.exposition()
+    assert 'bankid_admission_live_orders 0' in exposition
+    assert 'bankid_admission_rejected_total 1' in exposition
+    assert 'bankid_admission_wait_seconds_count 2' in exposition
+
+
+def test_client_releases_slot_when_start_fails():
+    admission = AdmissionController(max_orders=1, max_queue=0)
+    bc = stub_client(lambda endpoint, data: (503, {'errorCode': 'maintenance'}), admission=admission)
+
+    with pytest.raises(BankIdError):
+        bc.auth('127.0.0.1')
+    assert admission.live == 0
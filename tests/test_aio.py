@@ -0,0 +1,147 @@
+import asyncio
+from unittest.mock import patch, AsyncMock
+import pytest
+
+aiohttp = pytest.importorskip('aiohttp')
+from aiohttp import web
+
+from bankid6 import AsyncBankIdClient, BankIdError, BankIdValidationError
+from bankid6.handlers import (
+    BankIdStartResponse, BankIdPhoneStartResponse, BankIdCollectResponse, BankIdCancelResponse
+)
+
+from .factories import (
+    TEST_START_RESPONSE, TEST_START_RESPONSE_DATA, TEST_PHONE_START_RESPONSE, TEST_COLLECT_RESPONSE,
+    TEST_COLLECT_DATA, TEST_CANCEL_RESPONSE, response_factory
+)
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def test_start_and_collect():
+    async def scenario():
+        bc = AsyncBankIdClient()
+
+        with patch('bankid6.AsyncBankIdClient._post', new=AsyncMock(return_value=TEST_START_RESPONSE)):
+            sr = await bc.auth('192.168.0.1')
+            assert isinstance(sr, BankIdStartResponse)
+            assert bc._orderRef == TEST_START_RESPONSE_DATA['orderRef']
+
+            sr = await bc.sign('192.168.0.1', userVisibleData='TEST')
+            assert isinstance(sr, BankIdStartResponse)
+
+        with patch('bankid6.AsyncBankIdClient._post', new=AsyncMock(return_value=TEST_PHONE_START_RESPONSE)):
+            assert isinstance(await bc.phone_auth('199002113166', 'rp'), BankIdPhoneStartResponse)
+            assert isinstance(await bc.phone_sign('199002113166', 'rp', 'TEST'), BankIdPhoneStartResponse)
+
+        with patch('bankid6.AsyncBankIdClient._post', new=AsyncMock(return_value=TEST_COLLECT_RESPONSE)):
+            assert isinstance(await bc.collect(), BankIdCollectResponse)
+
+        with patch('bankid6.AsyncBankIdClient._post', new=AsyncMock(return_value=TEST_CANCEL_RESPONSE)):
+            assert isinstance(await bc.cancel(), BankIdCancelResponse)
+
+        with pytest.raises(BankIdValidationError):
+            await AsyncBankIdClient().collect()
+
+    run(scenario())
+
+
+def test_last_order_is_per_task():
+    async def start(bc, response):
+        with patch('bankid6.AsyncBankIdClient._post', new=AsyncMock(return_value=response)):
+            await bc.auth('192.168.0.1')
+        await asyncio.sleep(0)
+        return bc._orderRef
+
+    async def scenario():
+        bc = AsyncBankIdClient()
+        other = response_factory(200, dict(TEST_START_RESPONSE_DATA, orderRef='another-order'))
+        refs = await asyncio.gather(start(bc, TEST_START_RESPONSE), start(bc, other))
+        assert refs == [TEST_START_RESPONSE_DATA['orderRef'], 'another-order']
+        assert bc._orderRef is None
+
+    run(scenario())
+
+
+def test_cancelled_half_open_trial_releases_breaker():
+    from bankid6.retry import CircuitBreaker
+
+    async def scenario():
+        now = [0.0]
+        breaker = CircuitBreaker(min_calls=1, reset_timeout=5.0, clock=lambda: now[0])
+        bc = AsyncBankIdClient(circuit_breaker=breaker)
+        breaker.record(aiohttp.ClientConnectionError())
+        now[0] = 5.0
+
+        with patch('bankid6.AsyncBankIdClient._attempt', new=AsyncMock(side_effect=asyncio.CancelledError())):
+            with pytest.raises(asyncio.CancelledError):
+                await bc.collect(orderRef='order')
+
+        with patch('bankid6.AsyncBankIdClient._attempt', new=AsyncMock(return_value=TEST_COLLECT_RESPONSE)):
+            assert isinstance(await bc.collect(orderRef='order'), BankIdCollectResponse)
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    run(scenario())
+
+
+def test_blocking_store_is_read_off_the_loop():
+    import threading
+    from bankid6.store import MemoryOrderStore, OrderState
+
+    class BlockingStore(MemoryOrderStore):
+        blocking = True
+
+        def get(self, orderRef):
+            self.thread = threading.current_thread()
+            return super().get(orderRef)
+
+    async def scenario():
+        store = BlockingStore()
+        store.put(OrderState(TEST_START_RESPONSE_DATA['orderRef'], 1000, 'token', 'secret'))
+        bc = AsyncBankIdClient(store=store)
+        with patch('bankid6.AsyncBankIdClient._post', new=AsyncMock(return_value=TEST_COLLECT_RESPONSE)):
+            collect_response = await bc.collect(TEST_START_RESPONSE_DATA['orderRef'])
+        assert store.thread is not threading.current_thread()
+        assert collect_response.qr_frames.qrStartToken == 'token'
+
+    run(scenario())
+
+
+def test_shared_session_roundtrip():
+    async def handle_collect(request):
+        data = await request.json()
+        return web.json_response(dict(TEST_COLLECT_DATA, orderRef=data['orderRef']))
+
+    async def handle_cancel(request):
+        return web.json_response({'errorCode': 'invalidParameters'}, status=400)
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_post('/rp/v6.0/collect', handle_collect)
+        app.router.add_post('/rp/v6.0/cancel', handle_cancel)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = runner.addresses[0][1]
+
+        async with AsyncBankIdClient() as bc:
+            bc.api_url = f'http://127.0.0.1:{port}/rp/v6.0/'
+            results = await asyncio.gather(*[bc.collect(orderRef=str(i)) for i in range(20)])
+            assert [cr.orderRef for cr in results] == [str(i) for i in range(20)]
+            assert bc.client is not None
+
+            with pytest.raises(BankIdError) as exc_info:
+                await bc.cancel('1')
+            assert exc_info.value.errorCode == 'invalidParameters'
+
+        assert bc.client is None
+        await runner.cleanup()
+
+    run(scenario())
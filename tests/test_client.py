@@ -1,14 +1,21 @@
+import json
+import threading
 from unittest.mock import patch
 import pytest
+import requests
 
-from bankid6 import BankIdClient, BankIdValidationError, Messages, UseTypes, Languages
+from bankid6 import BankIdClient, BankIdError, BankIdValidationError, Messages, UseTypes, Languages
+from bankid6.exceptions import check_bankid_error
+from bankid6.transport import BankIdHttpResponse
+from bankid6.store import OrderState
+from bankid6.codec import JsonCodec, OrjsonCodec, default_codec, orjson
 from bankid6.handlers import (
     BankIdStartResponse, BankIdPhoneStartResponse, BankIdCollectResponse, BankIdCancelResponse
 )
 
 from .factories import (
     TEST_START_RESPONSE, TEST_START_RESPONSE_DATA, TEST_PHONE_START_RESPONSE, TEST_PHONE_START_RESPONSE_DATA,
-    TEST_COLLECT_RESPONSE, TEST_CANCEL_RESPONSE
+    TEST_COLLECT_RESPONSE, TEST_COLLECT_DATA, TEST_CANCEL_RESPONSE, response_factory
 )
 
 
@@ -121,3 +128,207 @@ def test_cancel():
     with pytest.raises(BankIdValidationError):
         BankIdClient().collect()
 
+
+
+def test_order_handle():
+    bc = BankIdClient()
+
+    with patch('bankid6.BankIdClient._post') as mocked:
+        mocked.return_value = TEST_START_RESPONSE
+        order = bc.auth('192.168.0.1')
+    
+    with patch('bankid6.BankIdClient._post') as mocked:
+        mocked.return_value = TEST_COLLECT_RESPONSE
+        cr = order.collect()
+        assert mocked.call_args[0][1] == {'orderRef': TEST_START_RESPONSE_DATA['orderRef']}
+        assert order.last_collect is cr
+        assert order.status == cr.status
+        assert cr.qr_data
+    
+    with patch('bankid6.BankIdClient._post') as mocked:
+        mocked.return_value = TEST_CANCEL_RESPONSE
+        assert isinstance(order.cancel(), BankIdCancelResponse)
+
+    with pytest.raises(BankIdValidationError):
+        BankIdStartResponse(TEST_START_RESPONSE).collect()
+
+
+def test_last_order_is_per_thread():
+    bc = BankIdClient()
+    seen = []
+
+    def start():
+        with patch('bankid6.BankIdClient._post') as mocked:
+            mocked.return_value = TEST_START_RESPONSE
+            bc.auth('192.168.0.1')
+        seen.append(bc._orderRef)
+
+    thread = threading.Thread(target=start)
+    thread.start()
+    thread.join()
+
+    assert seen == [TEST_START_RESPONSE_DATA['orderRef']]
+    assert bc._orderRef is None
+    with pytest.raises(BankIdValidationError):
+        bc.collect()
+
+
+def test_collect_other_order_does_not_reuse_last_qr_values():
+    bc = BankIdClient()
+
+    with patch('bankid6.BankIdClient._post') as mocked:
+        mocked.return_value = TEST_START_RESPONSE
+        bc.auth('192.168.0.1')
+
+    with patch('bankid6.BankIdClient._post') as mocked:
+        mocked.return_value = TEST_COLLECT_RESPONSE
+        assert bc.collect('another-order').qr_data is None
+        assert bc.collect(TEST_START_RESPONSE_DATA['orderRef']).qr_frames.qrStartToken == (
+            TEST_START_RESPONSE_DATA['qrStartToken']
+        )
+
+
+def test_collect_many_and_cancel_many():
+    bc = BankIdClient(pool_maxsize=4)
+
+    def collect_post(uri, data):
+        if data['orderRef'] == 'bad':
+            check_bankid_error(response_factory(400, {'errorCode': 'invalidParameters'}, ok=False))
+        if data['orderRef'] == 'html':
+            return BankIdHttpResponse(200, b'<html>Gateway</html>', uri)
+        return response_factory(200, dict(TEST_COLLECT_DATA, orderRef=data['orderRef']))
+
+    with patch('bankid6.BankIdClient._post') as mocked:
+        mocked.return_value = TEST_START_RESPONSE
+        order = bc.auth('192.168.0.1')
+
+    with patch('bankid6.BankIdClient._post', side_effect=collect_post):
+        results = bc.collect_many(['a', 'bad', 'html', 'c', order])
+
+    assert list(results) == ['a', 'bad', 'html', 'c', order.orderRef]
+    assert results['a'].orderRef == 'a'
+    assert isinstance(results['bad'], BankIdError)
+    assert isinstance(results['html'], ValueError)
+    assert results[order.orderRef].qr_data
+    assert order.last_collect is results[order.orderRef]
+
+    with patch('bankid6.BankIdClient._post', side_effect=collect_post):
+        stored = OrderState.from_order(order)
+        assert bc.collect_many([stored])[order.orderRef].orderRef == order.orderRef
+        with pytest.raises(BankIdValidationError):
+            bc.collect_many(['a', order, order.orderRef])
+
+    with patch('bankid6.BankIdClient._post') as mocked:
+        mocked.return_value = TEST_CANCEL_RESPONSE
+        results = bc.cancel_many(['a', 'b'])
+    
+    assert all(isinstance(cr, BankIdCancelResponse) for cr in results.values())
+    bc.close()
+
+
+class CountingCodec(JsonCodec):
+    def __init__(self):
+        self.loads_calls = 0
+        self.dumped = []
+
+    def dumps(self, data):
+        self.dumped.append(data)
+        return super().dumps(data)
+
+    def loads(self, content):
+        self.loads_calls += 1
+        return super().loads(content)
+
+
+def requests_response(status, data, url='https://test/collect'):
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps(data).encode('utf-8')
+    response.url = url
+    return response
+
+
+def test_single_decode_with_codec():
+    codec = CountingCodec()
+    bc = BankIdClient(codec=codec)
+
+    with patch.object(bc.client, 'post', return_value=requests_response(200, TEST_START_RESPONSE_DATA)) as post:
+        sr = bc.auth('192.168.0.1')
+        assert post.call_args[1]['data'] == b'{"endUserIp":"192.168.0.1"}'
+
+    assert codec.loads_calls == 1
+    assert codec.dumped == [{'endUserIp': '192.168.0.1'}]
+    assert sr.orderRef == TEST_START_RESPONSE_DATA['orderRef']
+    assert sr.response.raw.status_code == 200
+    assert sr.response.reason is None   # proxied to requests.Response
+
+    with patch.object(bc.client, 'post', return_value=requests_response(400, {'errorCode': 'invalidParameters'})):
+        with pytest.raises(BankIdError) as exc_info:
+            bc.collect('order')
+    
+    assert codec.loads_calls == 2
+    assert exc_info.value.response_data == {'errorCode': 'invalidParameters'}
+
+
+def test_default_codec():
+    assert isinstance(BankIdClient().codec, JsonCodec)
+    if orjson is not None:
+        assert isinstance(default_codec(), OrjsonCodec)
+    
+    for codec in [JsonCodec()] + ([OrjsonCodec()] if orjson is not None else []):
+        data = {'orderRef': 'å', 'n': 1}
+        assert codec.loads(codec.dumps(data)) == data
+
+
+def test_order_handle_shares_qr_frames():
+    bc = BankIdClient()
+
+    with patch('bankid6.BankIdClient._post') as mocked:
+        mocked.return_value = TEST_START_RESPONSE
+        order = bc.auth('192.168.0.1')
+
+    with patch('bankid6.BankIdClient._post') as mocked:
+        mocked.return_value = TEST_COLLECT_RESPONSE
+        cr = order.collect()
+    
+    assert cr.qr_frames is order.qr_frames
+    assert cr.qr_data == order.qr_data
+
+
+def test_keep_response():
+    bc = BankIdClient(keep_response=False)
+
+    with patch.object(bc.client, 'post', return_value=requests_response(200, TEST_START_RESPONSE_DATA)):
+        sr = bc.auth('192.168.0.1')
+    assert sr.response is None
+    assert sr.data == TEST_START_RESPONSE_DATA
+
+    with patch.object(bc.client, 'post', return_value=requests_response(503, {'errorCode': 'maintenance'})):
+        with pytest.raises(BankIdError) as exc_info:
+            sr.collect()
+    assert exc_info.value.response is None
+    assert exc_info.value.response_status == 503
+
+
+def test_stub_adapter():
+    from bankid6.transport import StubAdapter
+
+    calls = []
+    def handler(endpoint, data):
+        calls.append((endpoint, data))
+        if endpoint == 'cancel':
+            return 400, {'errorCode': 'invalidParameters', 'details': 'No such order'}
+        return 200, TEST_START_RESPONSE_DATA
+
+    bc = BankIdClient(key_pem='test')
+    bc.client.mount(bc.api_url, StubAdapter(handler))
+
+    response = bc.auth('127.0.0.1')
+    assert response.orderRef == TEST_START_RESPONSE_DATA['orderRef']
+    assert calls[0] == ('auth', {'endUserIp': '127.0.0.1'})
+
+    with pytest.raises(BankIdError) as exc:
+        bc.cancel(orderRef='missing')
+    assert exc.value.response_status == 400
+    assert exc.value.errorCode == 'invalidParameters'
+    assert calls[1] == ('cancel', {'orderRef': 'missing'})
@@ -0,0 +1,155 @@
+import sys
+import threading
+import time
+
+import pytest
+
+from bankid6 import BankIdError, BankIdValidationError
+from bankid6.coordinator import PollCoordinator, CoordinatorClient, main
+from bankid6.simulator import BankIdSimulator
+
+from .factories import stub_client
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out")
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    return str(tmp_path / 'bankid.sock')
+
+
+def test_workers_read_results_without_collecting(socket_path):
+    simulator = BankIdSimulator(collects_per_step=2)
+    collects = []
+    bc = stub_client(lambda endpoint, data: collects.append(endpoint) or simulator(endpoint, data))
+
+    with PollCoordinator(bc, socket_path, interval=0.05) as coordinator:
+        order = bc.auth('127.0.0.1')
+        collects.clear()
+        workers = [CoordinatorClient(socket_path) for _ in range(3)]
+        assert workers[0].add(order) is True
+        assert workers[1].add(order) is False
+
+        results = []
+
+        def read():
+            for _ in range(50):
+                for worker in workers:
+                    result = worker.collect(order=order)
+                    if result is not None:
+                        results.append(result)
+                time.sleep(0.002)
+
+        threads = [threading.Thread(target=read) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        wait_for(lambda: workers[0].collect(order.orderRef).status == 'complete')
+        result = workers[2].collect(order=order)
+        assert result.orderRef == order.orderRef
+        assert result.completionData.user.personalNumber
+        assert results[0].qr_frames.qrStartToken == order.qrStartToken
+
+        # Only the coordinator collects: once per simulator step, however many reads
+        assert collects.count('collect') == coordinator.collects == 3 * simulator.collects_per_step + 1
+        assert coordinator.reads > coordinator.collects
+        assert workers[1].stats()['results'] == 1
+
+        assert workers[0].remove(order.orderRef) is False
+        with pytest.raises(BankIdValidationError):
+            workers[0].collect(order.orderRef)
+        for worker in workers:
+            worker.close()
+
+
+def test_errors_and_pending_results(socket_path):
+    simulator = BankIdSimulator()
+    bc = stub_client(simulator)
+
+    with PollCoordinator(bc, socket_path, interval=60) as coordinator:
+        worker = CoordinatorClient(socket_path)
+        coordinator.poller.stop()
+        order = bc.auth('127.0.0.1')
+        worker.add(order)
+        assert worker.collect(order.orderRef) is None
+
+        worker.add(orderRef='00000000-0000-0000-0000-000000000000')
+        coordinator.poller.start()
+        wait_for(lambda: coordinator.collects >= 2)
+        assert worker.collect(order.orderRef).status == 'pending'
+        with pytest.raises(BankIdError) as exc_info:
+            worker.collect('00000000-0000-0000-0000-000000000000')
+        assert exc_info.value.response_status == 400
+
+        with pytest.raises(BankIdValidationError):
+            worker.collect()
+
+
+def test_unexpected_collect_failure_is_served(socket_path):
+    simulator = BankIdSimulator()
+
+    def handler(endpoint, data):
+        if endpoint == 'collect':
+            return 200, {'orderRef': data['orderRef'], 'status': 'pending'}
+        return simulator(endpoint, data)
+
+    bc = stub_client(handler)
+    with PollCoordinator(bc, socket_path, interval=0.01) as coordinator:
+        worker = CoordinatorClient(socket_path)
+        worker.add(bc.auth('127.0.0.1'))
+        wait_for(lambda: coordinator.collects)
+
+        with pytest.raises(BankIdError) as exc_info:
+            worker.collect(bc._orderRef)
+        assert exc_info.value.response_status == 502
+        assert exc_info.value.response_data['details'].startswith('KeyError')
+        assert len(coordinator.poller) == 0
+
+
+def test_single_coordinator_per_socket(socket_path):
+    bc = stub_client(BankIdSimulator())
+    with PollCoordinator(bc, socket_path):
+        with pytest.raises(RuntimeError):
+            PollCoordinator(bc, socket_path).start()
+
+    # The socket file of a dead coordinator is replaced, and workers reconnect to the new one
+    worker = CoordinatorClient(socket_path)
+    open(socket_path, 'w').close()
+    with PollCoordinator(bc, socket_path):
+        assert worker.stats()['orders'] == 0
+    with PollCoordinator(bc, socket_path):
+        assert worker.stats()['results'] == 0
+
+
+def test_main_arguments():
+    with pytest.raises(SystemExit):
+        main([])
+
+
+def test_reads_are_counted_from_all_threads(socket_path):
+    coordinator = PollCoordinator(stub_client(BankIdSimulator()), socket_path)
+
+    def read():
+        for _ in range(20000):
+            coordinator.get('unknown')
+
+    # Switch threads as often as possible, so an unlocked += loses increments
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=read) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert coordinator.reads == 80000
@@ -1,4 +1,5 @@
-from bankid6.exceptions import check_bankid_error, BankIdError
+from bankid6 import Messages, Languages
+from bankid6.exceptions import check_bankid_error, compile_error_descriptions, BankIdError
 from .factories import response_factory
 
 
@@ -15,3 +16,53 @@ def test_check_bankid_error():
         assert isinstance(exc.response_data, dict)
     else:
         assert False
+
+
+def _raise(status, data, messages=Messages):
+    try:
+        check_bankid_error(response_factory(status, data, ok=False), messages)
+    except BankIdError as exc:
+        return exc
+    assert False
+
+
+def test_error_descriptions_are_shared():
+    first = _raise(503, {'errorCode': 'maintenance'})
+    second = _raise(503, {'errorCode': 'maintenance'})
+    assert first.message is second.message
+    assert first.message is compile_error_descriptions(Messages)[(503, 'maintenance')].message
+    assert first.message == Messages.RFA5.json()
+
+    exc = _raise(400, {'errorCode': 'somethingNew'})
+    assert exc.errorCode == 'unknownError'
+    assert exc.message == Messages.RFA22.json()
+
+    exc = _raise(418, {})
+    assert exc.reason is None
+    assert exc.message is None
+
+
+def test_error_descriptions_custom_messages():
+    class MyMessages(Messages):
+        RFA5 = ('sv', 'en')
+
+    exc = _raise(500, {'errorCode': 'internalError'}, MyMessages)
+    assert exc.message == {Languages.sv: 'sv', Languages.en: 'en'}
+
+    MyMessages.RFA5 = {'custom': True}
+    exc = _raise(500, {'errorCode': 'internalError'}, MyMessages)
+    assert exc.message == {'custom': True}
+
+
+def test_error_table_survives_collect_table_builds():
+    from bankid6.message import compile_collect_messages
+
+    class MyMessages(Messages):
+        RFA5 = ('sv', 'en')
+        RFA21 = ('sv', 'default')
+
+    errors = compile_error_descriptions(MyMessages)
+    collects = compile_collect_messages(MyMessages)
+    assert compile_error_descriptions(MyMessages) is errors
+    assert _raise(500, {'errorCode': 'internalError'}, MyMessages).message is errors[(500, 'internalError')].message
+    assert compile_collect_messages(MyMessages) is collects
@@ -1,12 +1,18 @@
+import json
 import pytest
 import base64
+import gc
+import weakref
+import tracemalloc
 from datetime import datetime
 
+import requests
+
 from bankid6.handlers import (
-    RequestParams, BankIdBaseResponse, BankIdStartResponse, BankIdPhoneStartResponse, BankIdCompletionUserData,
+    RequestParams, compile_request_params, BankIdBaseResponse, BankIdStartResponse, BankIdPhoneStartResponse, BankIdCompletionUserData,
     BankIdCompletionDeviceData, BankIdCompletionData, BankIdCollectResponse, BankIdCancelResponse
 )
-from bankid6 import BankIdValidationError, generate_qr_data
+from bankid6 import BankIdClient, BankIdValidationError, generate_qr_data
 from bankid6.message import get_bankid_collect_message
 
 from .factories import response_factory
@@ -73,6 +79,55 @@ class TestRequestParams():
         assert RequestParams(qrStartToken='1234').clean()['qrStartToken'] == '1234'
         assert RequestParams(userNonVisibleData='1234').clean().get('userNonVisibleData')
 
+    def test_validation_messages(self):
+        with pytest.raises(BankIdValidationError) as exc_info:
+            RequestParams(endUserIp='192.168e.0.1').clean()
+        assert str(exc_info.value) == (
+            "Error: Invalid Parameter endUserIp: Must be IPV4/IPV6 ip address.\nCurrent value: 192.168e.0.1"
+        )
+
+        with pytest.raises(BankIdValidationError) as exc_info:
+            RequestParams(requirement={'wrong': 'value'}).clean()
+        assert str(exc_info.value) == (
+            "Error: Invalid Parameter requirement: Invalid key. valid keys: "
+            "['pinCode', 'mrtd', 'cardReader', 'certificatePolicies', 'personalNumber'].\nCurrent value: wrong"
+        )
+
+    def test_compiled_validators(self):
+        compiled = compile_request_params(RequestParams)
+        assert compile_request_params(RequestParams) is compiled
+        assert RequestParams(orderRef='1')._compiled is compiled
+        assert set(compiled.validators) >= {'endUserIp', 'requirement', 'orderRef'}
+
+        for _ in range(3):
+            RequestParams(endUserIp='10.0.0.1').clean()
+        assert compiled.is_ip_address.cache_info().hits >= 2
+
+        class MyParams(RequestParams):
+            ip_cache_size = 0
+
+            def clean_endUserIp(self, value):
+                return super().clean_endUserIp(value).upper()
+
+            def clean_custom(self, value):
+                return value * 2
+
+        assert MyParams(endUserIp='fe80::1', custom=2).clean() == {'endUserIp': 'FE80::1', 'custom': 4}
+        assert not hasattr(compile_request_params(MyParams).is_ip_address, 'cache_info')
+
+    def test_compiled_validators_do_not_keep_classes_alive(self):
+        class MyParams(RequestParams):
+            def clean_endUserIp(self, value):
+                return super().clean_endUserIp(value)
+
+        MyParams(endUserIp='10.0.0.1').clean()
+        assert compile_request_params(MyParams) is not compile_request_params(RequestParams)
+
+        ref = weakref.ref(MyParams)
+        del MyParams
+        gc.collect()
+        assert ref() is None
+
     def test_clean(self):
         cldt = RequestParams(qrStartSecret='1234', order_time='1234', endUserIp='192.168.0.1').clean()
         assert type(cldt) == dict
@@ -180,3 +235,49 @@ class TestResponses():
     def test_BankIdCancelResponse(self):
         obj = BankIdCancelResponse(response=response_factory(200, {}))
         assert isinstance(obj, BankIdBaseResponse)
+
+
+def _cached_collect_results(count, keep_response):
+    bc = BankIdClient(keep_response=keep_response)
+    url = bc._uri('collect')
+
+    def post(uri, data=None, timeout=None):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps(
+            {'orderRef': json.loads(data)['orderRef'], 'status': 'pending', 'hintCode': 'outstandingTransaction'}
+        ).encode()
+        response.url = url
+        return response
+
+    bc.client.post = post
+    return [bc.collect('%08d-0bcb-4d65-bb5b-7580c300f098' % i) for i in range(count)]
+
+
+def _bytes_per_object(count, keep_response):
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        results = _cached_collect_results(count, keep_response)
+        used = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    
+    assert len(results) == count
+    return used / count
+
+
+def test_compact_collect_response_memory():
+    # Collected through the client from real requests.Response objects. Tracing every allocation
+    # is slow, so the per-object size is measured on a sample and scaled to 100k cached results.
+    compact = _bytes_per_object(2000, keep_response=False)
+    full = _bytes_per_object(2000, keep_response=True)
+
+    assert compact * 100000 < 70 * 1024 * 1024
+    assert compact < full * 0.5
+
+    obj = _cached_collect_results(1, keep_response=False)[0]
+    assert obj.response is None
+    assert obj.orderRef == '00000000-0bcb-4d65-bb5b-7580c300f098'
+    obj.note = 'callers may still set their own attributes'
+    assert obj.__dict__ == {'note': 'callers may still set their own attributes'}
@@ -0,0 +1,57 @@
+import json
+
+from bankid6.loadtest import LatencyHistogram, LoadTest, main
+
+from .factories import stub_client
+
+
+def test_histogram_percentiles():
+    histogram = LatencyHistogram()
+    for ms in range(1, 1001):
+        histogram.record(ms / 1000)
+
+    assert histogram.count == 1000
+    assert histogram.max == 1000000
+    for percent, expected in [(50, 500000), (95, 950000), (99, 990000)]:
+        assert abs(histogram.percentile(percent) - expected) / expected < 0.02
+    assert histogram.percentile(100) == histogram.max
+
+    other = LatencyHistogram()
+    other.record(5)
+    histogram.merge(other)
+    assert histogram.count == 1001
+    assert histogram.summary()['max_ms'] == 5000
+
+
+def test_histogram_small_values_are_exact():
+    histogram = LatencyHistogram()
+    for value in [3, 3, 50, 100]:
+        histogram.record(value / 1e6)
+
+    assert histogram.percentile(50) == 3
+    assert histogram.percentile(75) == 50
+    assert histogram.min == 3
+
+
+def test_run_step():
+    client = stub_client()
+    load_test = LoadTest(client, cancel_ratio=0.5, poll_interval=0)
+
+    report = load_test.run([1, 2], 0.2)
+    assert [step['users'] for step in report['steps']] == [1, 2]
+
+    step = report['steps'][0]
+    assert step['requests'] == sum(stats['count'] for stats in step['endpoints'].values())
+    assert step['endpoints']['collect']['p99_ms'] >= step['endpoints']['collect']['p50_ms']
+    assert step['orders'].get('complete') or step['orders'].get('cancelled')
+    assert not any(stats['errors'] for stats in step['endpoints'].values())
+    json.dumps(report)
+
+
+def test_main_with_simulator(tmp_path, capsys):
+    output = tmp_path / 'report.json'
+    main(['--simulator', '--users', '2', '--step-duration', '0.3', '--poll-interval', '0', '--output', str(output)])
+
+    report = json.loads(output.read_text())
+    assert report['steps'][0]['rps'] > 0
+    assert 'req/s' in capsys.readouterr().err
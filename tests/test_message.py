@@ -1,4 +1,10 @@
-from bankid6.message import MesssageDetail, get_bankid_collect_message, Messages
+import gc
+import json
+import pickle
+import pytest
+import weakref
+
+from bankid6.message import MesssageDetail, get_bankid_collect_message, compile_collect_messages, Messages
 from bankid6 import Languages, HintCodes, CollectStatuses, UseTypes
 
 
@@ -47,3 +53,90 @@ def test_get_bankid_collect_message():
     msg = get_bankid_collect_message(CollectStatuses.pending, HintCodes.userCallConfirm, is_mobile=False)
     assert msg[UseTypes.qrcode] == Messages.RFA21.json()
     assert msg[UseTypes.onfile] == Messages.RFA21.json()
+
+
+def test_compiled_collect_messages():
+    table = compile_collect_messages(Messages)
+    assert compile_collect_messages(Messages) is table
+    assert table[(CollectStatuses.pending, HintCodes.started, True)][UseTypes.qrcode] == Messages.RFA15B.json()
+    assert table[(CollectStatuses.failed, None, False)][UseTypes.onfile] == Messages.RFA22.json()
+
+    msg = get_bankid_collect_message(CollectStatuses.pending, HintCodes.noClient)
+    assert msg is get_bankid_collect_message(CollectStatuses.pending, HintCodes.noClient)
+    assert msg[UseTypes.qrcode] is msg[UseTypes.onfile]
+    assert json.loads(json.dumps(msg)) == msg
+    assert pickle.loads(pickle.dumps(msg)) == msg
+    with pytest.raises(TypeError):
+        msg[UseTypes.qrcode] = {}
+    with pytest.raises(TypeError):
+        msg[UseTypes.qrcode][Languages.en] = 'changed'
+    
+    assert get_bankid_collect_message('unknown', HintCodes.noClient) is None
+
+
+def test_compiled_collect_messages_invalidation():
+    class MyMessages(Messages):
+        RFA21 = ('sv', 'en')
+
+    msg = get_bankid_collect_message(CollectStatuses.pending, 'unknownHint', messages=MyMessages)
+    assert msg[UseTypes.qrcode][Languages.en] == 'en'
+
+    MyMessages.RFA21 = ('sv', 'changed')
+    msg = get_bankid_collect_message(CollectStatuses.pending, 'unknownHint', messages=MyMessages)
+    assert msg[UseTypes.qrcode][Languages.en] == 'changed'
+
+    class MyMessages(Messages):
+        RFA21 = ('sv', 'redefined')
+
+    msg = get_bankid_collect_message(CollectStatuses.pending, 'unknownHint', messages=MyMessages)
+    assert msg[UseTypes.qrcode][Languages.en] == 'redefined'
+
+    detail = MesssageDetail('sv', 'detail')
+
+    class MyMessages(Messages):
+        RFA21 = detail
+
+    get_bankid_collect_message(CollectStatuses.pending, 'unknownHint', messages=MyMessages)
+    detail.english = 'mutated'
+    msg = get_bankid_collect_message(CollectStatuses.pending, 'unknownHint', messages=MyMessages)
+    assert msg[UseTypes.qrcode][Languages.en] == 'mutated'
+
+
+def test_compiled_tables_are_not_rebuilt_by_other_lookups(monkeypatch):
+    from bankid6 import message, exceptions
+    from bankid6.exceptions import get_error_description
+
+    class MyMessages(Messages):
+        RFA4 = ('sv', 'en')
+        RFA13 = ('swetext', 'entext')
+
+    builds = []
+    for module, name in [(message, '_build_collect_message_table'), (exceptions, '_build_error_description_table')]:
+        builder = getattr(module, name)
+        monkeypatch.setattr(module, name, lambda messages, builder=builder, name=name: builds.append(name) or builder(messages))
+
+    for _ in range(5):
+        assert get_bankid_collect_message(CollectStatuses.pending, 'unknownHint', messages=MyMessages)
+        get_error_description(400, 'alreadyInProgress', MyMessages)
+        MesssageDetail('sv', 'en')
+
+    assert sorted(builds) == ['_build_collect_message_table', '_build_error_description_table']
+
+
+def test_compiled_tables_do_not_keep_classes_alive():
+    from bankid6.message import _collect_message_tables
+    from bankid6.exceptions import get_error_description, _error_description_tables
+
+    class MyMessages(Messages):
+        RFA21 = ('sv', 'en')
+
+    get_bankid_collect_message(CollectStatuses.pending, 'unknownHint', messages=MyMessages)
+    get_error_description(400, 'alreadyInProgress', MyMessages)
+    key = id(MyMessages)
+    assert key in _collect_message_tables and key in _error_description_tables
+
+    ref = weakref.ref(MyMessages)
+    del MyMessages
+    gc.collect()
+    assert ref() is None
+    assert key not in _collect_message_tables and key not in _error_description_tables
@@ -0,0 +1,96 @@
+import pytest
+
+from bankid6 import BankIdError
+from bankid6.metrics import BankIdMetrics, MetricsRegistry, start_http_server
+from bankid6.simulator import BankIdSimulator
+from bankid6.store import OrderState
+
+from .factories import stub_client
+
+
+def test_exposition_format():
+    registry = MetricsRegistry()
+    requests_total = registry.counter('requests_total', 'Requests.', ['endpoint'])
+    latency = registry.histogram('latency_seconds', 'Latency.', buckets=[0.1, 1])
+    registry.gauge('answer', 'Answer.', function=lambda: 42)
+
+    requests_total.labels('collect').inc()
+    requests_total.labels('collect').inc(2)
+    requests_total.labels('a"b').inc()
+    for value in [0.05, 0.5, 5]:
+        latency.observe(value)
+
+    text = registry.exposition()
+    assert '# TYPE requests_total counter\n' in text
+    assert 'requests_total{endpoint="collect"} 3.0\n' in text
+    assert 'requests_total{endpoint="a\\"b"} 1.0\n' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1\n' in text
+    assert 'latency_seconds_bucket{le="1.0"} 2\n' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3\n' in text
+    assert 'latency_seconds_sum 5.55\n' in text
+    assert 'latency_seconds_count 3\n' in text
+    assert 'answer 42\n' in text
+
+    with pytest.raises(ValueError):
+        registry.counter('requests_total', 'Again.')
+    with pytest.raises(ValueError):
+        requests_total.labels('a', 'b')
+
+
+def test_client_metrics():
+    metrics = BankIdMetrics()
+    client = stub_client(metrics=metrics, pool_maxsize=4)
+
+    order = client.auth('127.0.0.1')
+    while order.collect().status == 'pending':
+        pass
+    with pytest.raises(BankIdError):
+        order.cancel()
+
+    text = metrics.exposition()
+    assert 'bankid_request_duration_seconds_count{endpoint="auth"} 1\n' in text
+    assert 'bankid_request_duration_seconds_count{endpoint="collect"} 4\n' in text
+    assert 'bankid_request_duration_seconds_count{endpoint="cancel"} 1\n' in text
+    assert 'bankid_errors_total{status="400",errorCode="invalidParameters"} 1.0\n' in text
+    assert 'bankid_collect_total{status="pending",hintCode="userSign"} 1.0\n' in text
+    assert 'bankid_collect_total{status="complete",hintCode=""} 1.0\n' in text
+    assert 'bankid_order_duration_seconds_count{status="complete"} 1\n' in text
+    assert 'bankid_pool_max_size 4\n' in text
+    assert 'bankid_pool_connections_in_use 0\n' in text
+
+
+def test_http_server():
+    import requests
+
+    metrics = BankIdMetrics()
+    metrics.observe_request('auth', 0.01)
+    server = start_http_server(metrics.registry, 0, '127.0.0.1')
+    try:
+        response = requests.get(f'http://127.0.0.1:{server.server_address[1]}/metrics')
+        assert response.headers['Content-Type'].startswith('text/plain')
+        assert 'bankid_request_duration_seconds_count{endpoint="auth"} 1' in response.text
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_order_duration_without_order_time():
+    metrics = BankIdMetrics()
+    simulator = BankIdSimulator()
+    client = stub_client(simulator, metrics=metrics)
+
+    # Phone orders have no order_time, and orderRef-only collects pass no handle
+    order = client.phone_auth('190001019876', 'RP')
+    while client.collect(order.orderRef).status == 'pending':
+        pass
+    assert 'bankid_order_duration_seconds_count{status="complete"} 1\n' in metrics.exposition()
+    assert order.orderRef not in metrics._started
+
+    # Orders started by another process carry their start on the stored state
+    other = stub_client(simulator)
+    state = OrderState.from_order(other.phone_auth('190001019876', 'RP'))
+    state.started -= 42
+    while client.collect(order=state).status == 'pending':
+        pass
+    assert 'bankid_order_duration_seconds_bucket{status="complete",le="30.0"} 1\n' in metrics.exposition()
+    assert 'bankid_order_duration_seconds_bucket{status="complete",le="45.0"} 2\n' in metrics.exposition()
@@ -0,0 +1,206 @@
+import threading
+import time
+
+import pytest
+from requests import ConnectionError
+
+from bankid6 import CollectPoller, BankIdError, CollectStatuses
+from bankid6.poller import PollingPolicy, AdaptivePollingPolicy, is_transient
+from bankid6.simulator import BankIdSimulator
+from bankid6.handlers import BankIdCollectResponse
+from bankid6.exceptions import check_bankid_error
+
+from .factories import response_factory, stub_client
+
+
+class FakeClient():
+    """Answers pending for ``pending_rounds`` collects per order, then complete."""
+
+    def __init__(self, pending_rounds=2):
+        self.pending_rounds = pending_rounds
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def collect(self, orderRef=None, qrStartToken=None, qrStartSecret=None, order_time=None):
+        with self.lock:
+            self.calls[orderRef] = self.calls.get(orderRef, 0) + 1
+            count = self.calls[orderRef]
+        
+        if orderRef == 'bad':
+            check_bankid_error(response_factory(400, {'errorCode': 'invalidParameters'}, ok=False))
+        if orderRef == 'malformed':
+            raise ValueError("Expecting value: line 1 column 1 (char 0)")
+        if orderRef == 'offline' and count == 1:
+            raise ConnectionError()
+        if orderRef == 'maintenance' and count == 1:
+            check_bankid_error(response_factory(503, {'errorCode': 'maintenance'}, ok=False))
+        
+        if count <= self.pending_rounds:
+            data = {'orderRef': orderRef, 'status': 'pending', 'hintCode': 'started'}
+        else:
+            data = {'orderRef': orderRef, 'status': 'complete', 'completionData': {}}
+        return BankIdCollectResponse(response_factory(200, data), (order_time, qrStartToken, qrStartSecret))
+
+
+def test_poller_drives_orders_to_completion():
+    client = FakeClient(pending_rounds=2)
+    done = threading.Event()
+    finished = []
+
+    def on_result(order_ref, result):
+        if isinstance(result, BankIdError) or result.status == CollectStatuses.complete:
+            finished.append(order_ref)
+            if len(finished) == 51:
+                done.set()
+
+    with CollectPoller(client, interval=0.01, max_workers=4, on_result=on_result) as poller:
+        for i in range(50):
+            poller.add(f'order-{i}')
+        poller.add('bad')
+        assert done.wait(5)
+
+        assert len(poller) == 0
+        assert poller.lag == 0.0
+        assert poller.stats()['max_lag'] >= 0.0
+    
+    assert sorted(client.calls.values()) == [1] + [3] * 50
+
+
+def test_poller_results_queue_and_remove():
+    client = FakeClient(pending_rounds=1000)
+
+    with CollectPoller(client, interval=0.01, max_workers=1) as poller:
+        poller.add('order-1', 'token', 'secret', 1709667200)
+        order_ref, result = poller.results.get(timeout=5)
+        assert order_ref == 'order-1'
+        assert result.status == CollectStatuses.pending
+        assert result.qr_data
+
+        assert 'order-1' in poller
+        assert poller.remove('order-1')
+        assert not poller.remove('order-1')
+        assert len(poller) == 0
+
+
+def test_poller_delivers_unexpected_errors_and_survives_callbacks():
+    client = FakeClient(pending_rounds=0)
+    results = {}
+    done = threading.Event()
+
+    def on_result(order_ref, result):
+        results.setdefault(order_ref, []).append(result)
+        if (
+            len(results.get('offline', [])) == 2 and len(results.get('maintenance', [])) == 2
+            and 'malformed' in results and 'callback' in results
+        ):
+            done.set()
+        if order_ref == 'callback':
+            raise RuntimeError("broken callback")
+
+    with CollectPoller(client, interval=0.01, max_workers=2, on_result=on_result) as poller:
+        for order_ref in ['malformed', 'offline', 'maintenance', 'callback']:
+            poller.add(order_ref)
+        assert done.wait(5)
+        assert len(poller) == 0
+
+    assert isinstance(results['malformed'][0], ValueError)
+    assert isinstance(results['offline'][0], ConnectionError)
+    assert results['offline'][1].status == CollectStatuses.complete
+    assert results['maintenance'][0].response_status == 503
+    assert results['maintenance'][1].status == CollectStatuses.complete
+    assert client.calls['malformed'] == 1
+
+
+def collect_result(hint_code):
+    data = {'orderRef': 'order', 'status': 'pending', 'hintCode': hint_code}
+    return BankIdCollectResponse(response_factory(200, data))
+
+
+def test_adaptive_polling_policy():
+    policy = AdaptivePollingPolicy()
+    assert PollingPolicy(3.0).next_interval(collect_result('userSign')) == 3.0
+
+    assert policy.next_interval(collect_result('userSign')) == 1.0
+    assert policy.next_interval(collect_result('started')) == 2.0
+    assert policy.next_interval(collect_result('unknownHint')) == 2.0
+    assert [policy.next_interval(collect_result('outstandingTransaction'), n) for n in range(4)] == [2.0, 3.0, 4.5, 6.0]
+    assert policy.next_interval(collect_result('started'), repeats=5) == 2.0
+
+    assert policy.next_interval(collect_result('userCallConfirm'), phone=True) == 1.0
+    assert policy.next_interval(collect_result('userSign'), phone=True) == 1.0
+    assert policy.next_interval(ConnectionError()) == 2.0
+    assert [policy.next_interval(ConnectionError(), n) for n in (1, 2, 20)] == [3.0, 4.5, 30.0]
+
+    policy = AdaptivePollingPolicy(intervals={'started': 1.5}, phone_intervals={'userCallConfirm': 0.5})
+    assert policy.next_interval(collect_result('started')) == 1.5
+    assert policy.next_interval(collect_result('userCallConfirm'), phone=True) == 0.5
+
+
+def test_poller_uses_policy_and_repeats():
+    class RecordingPolicy(PollingPolicy):
+        def __init__(self):
+            super().__init__(0.01)
+            self.calls = []
+        
+        def next_interval(self, result, repeats=0, phone=False):
+            self.calls.append((result.hintCode, repeats, phone))
+            return 0.01
+
+    policy = RecordingPolicy()
+    client = FakeClient(pending_rounds=3)
+    with CollectPoller(client, policy=policy, on_result=lambda *args: None) as poller:
+        poller.add('order-1', phone=True)
+        deadline = time.monotonic() + 5
+        while len(poller) and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    assert policy.calls == [('started', 0, True), ('started', 1, True), ('started', 2, True)]
+
+
+def test_poller_call_budget():
+    client = FakeClient(pending_rounds=1000)
+    with CollectPoller(client, interval=0.0, max_workers=4, max_calls_per_second=50, on_result=lambda *args: None) as poller:
+        for i in range(20):
+            poller.add(f'order-{i}')
+        time.sleep(1.0)
+    
+    total = sum(client.calls.values())
+    assert 50 <= total <= 110
+    assert poller.stats()['throttled'] > 0
+
+
+def test_adaptive_policy_backs_off_through_maintenance_window():
+    simulator = BankIdSimulator()
+    now = [0.0]
+    collects = []
+
+    def handler(endpoint, data):
+        if endpoint == 'collect':
+            collects.append(now[0])
+            if now[0] < 1.0:
+                return 503, {'errorCode': 'maintenance', 'details': 'Down for maintenance'}
+        return simulator(endpoint, data)
+
+    bc = stub_client(handler)
+    order = bc.auth('127.0.0.1')
+
+    # Drive the poller's scheduling decisions with a simulated clock instead of sleeping
+    policy = AdaptivePollingPolicy(error_interval=0.1, backoff=2.0, max_error_interval=0.4, default=0.5)
+    poller = CollectPoller(bc, policy=policy)
+    polled = poller.add(order.orderRef)
+    results = []
+    while True:
+        try:
+            result = bc.collect(order.orderRef)
+            finished = result.status != CollectStatuses.pending
+        except BankIdError as exc:
+            assert is_transient(exc)
+            result, finished = exc, False
+        results.append(result)
+        if finished:
+            break
+        now[0] += poller._next_interval(polled, result)
+
+    assert collects[:5] == pytest.approx([0.0, 0.1, 0.3, 0.7, 1.1])
+    assert [getattr(result, 'response_status', 200) for result in results[:5]] == [503] * 4 + [200]
+    assert results[-1].status == CollectStatuses.complete
@@ -0,0 +1,111 @@
+import itertools
+import threading
+import time
+from unittest.mock import patch
+import pytest
+
+from bankid6 import generate_qr_data
+from bankid6.qr import QrFrames, QrTicker
+
+
+ORDER_TIME = 1709667200
+TOKEN = 'c56e2cd6-c4da-45f1-a104-e59e7cc6d2fa'
+SECRET = '3cd671e5-3389-4134-9565-decc8388bc8c'
+
+
+def qr_data_at(now):
+    with patch('time.time', return_value=now):
+        return generate_qr_data(ORDER_TIME, TOKEN, SECRET)
+
+
+def test_frames_match_generate_qr_data():
+    frames = QrFrames(ORDER_TIME, TOKEN, SECRET)
+
+    for offset in [0, 0.5, 1, 29.9, 30]:
+        assert frames.current(ORDER_TIME + offset) == qr_data_at(ORDER_TIME + offset)
+
+    assert frames.frame(0) == f'bankid.{TOKEN}.0.' + qr_data_at(ORDER_TIME).rsplit('.', 1)[1]
+    assert list(itertools.islice(frames.frames(ORDER_TIME + 3), 3)) == [
+        qr_data_at(ORDER_TIME + t) for t in (3, 4, 5)
+    ]
+    assert next(iter(frames)).startswith(f'bankid.{TOKEN}.')
+
+
+def test_precompute_and_next_frame():
+    frames = QrFrames(ORDER_TIME, TOKEN, SECRET)
+
+    precomputed = frames.precompute(5, now=ORDER_TIME + 10.2)
+    assert precomputed == [qr_data_at(ORDER_TIME + t) for t in range(10, 15)]
+    assert frames.current(ORDER_TIME + 12) is precomputed[2]
+    assert frames.current(ORDER_TIME + 20) == qr_data_at(ORDER_TIME + 20)
+
+    assert abs(frames.seconds_until_next_frame(ORDER_TIME + 10.25) - 0.75) < 1e-6
+    assert frames.seconds_until_next_frame(ORDER_TIME + 11) == 1.0
+
+
+def test_ticker_publishes_all_codes():
+    ticker = QrTicker(max_age=60)
+    ticker.add('a', ORDER_TIME, TOKEN, SECRET)
+    ticker.add_frames('b', QrFrames(ORDER_TIME - 5, 'other-token', SECRET))
+    assert ticker.get('a').startswith(f'bankid.{TOKEN}.')
+
+    published = []
+    ticker.subscribe(published.append)
+    codes = ticker.tick(now=ORDER_TIME + 7.5)
+
+    assert published == [codes]
+    assert codes['a'] == qr_data_at(ORDER_TIME + 7.5)
+    assert codes['b'].startswith('bankid.other-token.12.')
+    assert ticker.get('a') is codes['a']
+    with pytest.raises(TypeError):
+        codes['a'] = 'changed'
+    
+    assert ticker.remove('b')
+    assert ticker.get('b') is None and 'b' not in ticker.codes
+    assert list(ticker.tick(now=ORDER_TIME + 8)) == ['a']
+
+    ticker.tick(now=ORDER_TIME + 61)
+    assert len(ticker) == 0
+    assert ticker.get('a') is None
+
+
+def test_ticker_keeps_orders_added_during_a_tick():
+    ticker = QrTicker(max_age=None)
+
+    class AddingFrames(QrFrames):
+        __slots__ = ()
+
+        def frame(self, qr_time):
+            ticker.add('late', ORDER_TIME, TOKEN, SECRET)
+            return super().frame(qr_time)
+
+    ticker.add_frames('a', AddingFrames(ORDER_TIME, TOKEN, SECRET))
+    codes = ticker.tick(now=ORDER_TIME + 3)
+    assert set(codes) == {'a', 'late'}
+    assert ticker.get('late') == codes['late']
+
+    class RemovingFrames(QrFrames):
+        __slots__ = ()
+
+        def frame(self, qr_time):
+            ticker.remove('late')
+            return super().frame(qr_time)
+
+    # An order removed during a tick is not published by it
+    ticker.add_frames('a', RemovingFrames(ORDER_TIME, TOKEN, SECRET))
+    assert set(ticker.tick(now=ORDER_TIME + 3)) == {'a'}
+
+    for i in range(20000):
+        ticker.add(f'order-{i}', ORDER_TIME, TOKEN, SECRET)
+    assert ticker.get('order-19999') and len(ticker.tick(now=ORDER_TIME + 4)) == 20001
+
+
+def test_ticker_thread():
+    ticker = QrTicker()
+    ticker.add('a', int(time.time()), TOKEN, SECRET)
+    ticked = threading.Event()
+    ticker.subscribe(lambda codes: ticked.set())
+
+    with ticker:
+        assert ticked.wait(2)
+    assert ticker.get('a')
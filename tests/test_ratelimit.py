@@ -0,0 +1,155 @@
+import asyncio
+import threading
+import time
+
+import pytest
+import requests
+
+from bankid6 import BankIdRateLimitError, BankIdCircuitOpenError
+from bankid6.ratelimit import RateLimiter
+from bankid6.retry import RetryPolicy, CircuitBreaker
+
+from .factories import TEST_START_RESPONSE_DATA, TEST_COLLECT_DATA, FakeClock, stub_client
+
+
+def test_shared_and_endpoint_limits():
+    clock = FakeClock()
+    limiter = RateLimiter(rate=10, burst=5, rates={'auth': (1, 2)}, block=False, reserve=0, clock=clock)
+
+    limiter.acquire('auth')
+    limiter.acquire('auth')
+    with pytest.raises(BankIdRateLimitError) as exc:
+        limiter.acquire('auth')
+    assert exc.value.endpoint == 'auth'
+    assert exc.value.retry_after == pytest.approx(1.0)
+
+    for _ in range(3):
+        limiter.acquire('collect')
+    with pytest.raises(BankIdRateLimitError):
+        limiter.acquire('collect')
+    assert limiter.rejected == 2
+
+    clock.now = 0.1
+    limiter.acquire('collect')
+    clock.now = 1.0
+    limiter.acquire('auth')
+
+
+def test_reserve_keeps_tokens_for_collect():
+    clock = FakeClock()
+    limiter = RateLimiter(rate=10, burst=10, block=False, reserve=0.2, clock=clock)
+
+    for _ in range(8):
+        limiter.acquire('sign')
+    with pytest.raises(BankIdRateLimitError):
+        limiter.acquire('sign')
+    limiter.acquire('collect')
+    limiter.acquire('cancel')
+    with pytest.raises(BankIdRateLimitError):
+        limiter.acquire('collect')
+
+
+def test_blocking_waits_and_times_out():
+    limiter = RateLimiter(rate=20, burst=1, timeout=1.0)
+    limiter.acquire('auth')
+    started = time.monotonic()
+    limiter.acquire('auth')
+    assert 0.03 <= time.monotonic() - started < 0.5
+    assert limiter.waited == 1
+
+    limiter = RateLimiter(rate=1, burst=1, timeout=0.1)
+    limiter.acquire('auth')
+    started = time.monotonic()
+    with pytest.raises(BankIdRateLimitError):
+        limiter.acquire('auth')
+    assert time.monotonic() - started < 0.05
+
+
+def test_waiting_collect_goes_before_auth():
+    limiter = RateLimiter(rate=20, burst=1, timeout=2.0, reserve=0)
+    limiter.acquire('auth')
+    order = []
+
+    def call(endpoint):
+        limiter.acquire(endpoint)
+        order.append(endpoint)
+
+    collect = threading.Thread(target=call, args=('collect',))
+    collect.start()
+    time.sleep(0.01)
+    auth = threading.Thread(target=call, args=('auth',))
+    auth.start()
+    collect.join()
+    auth.join()
+    assert order == ['collect', 'auth']
+
+
+def test_async_acquire():
+    limiter = RateLimiter(rate=50, burst=1, timeout=1.0)
+
+    async def main():
+        started = time.monotonic()
+        await asyncio.gather(*[limiter.acquire_async('collect') for _ in range(3)])
+        return time.monotonic() - started
+
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(main()) >= 0.03
+    finally:
+        loop.close()
+
+
+def test_client_rate_limited():
+    calls = []
+
+    def handler(endpoint, data):
+        calls.append(endpoint)
+        return 200, TEST_START_RESPONSE_DATA
+
+    bc = stub_client(handler, rate_limiter=RateLimiter(rates={'auth': (0.1, 1)}, block=False))
+
+    bc.auth('127.0.0.1')
+    with pytest.raises(BankIdRateLimitError):
+        bc.auth('127.0.0.1')
+    assert calls == ['auth']
+
+
+def test_retries_take_tokens():
+    calls = []
+
+    def handler(endpoint, data):
+        calls.append(endpoint)
+        return 503, {'errorCode': 'maintenance', 'details': 'Down for maintenance'}
+
+    limiter = RateLimiter(rates={'collect': (0.1, 2)}, block=False)
+    retry = RetryPolicy(max_attempts=5, base_delay=0.001, max_delay=0.002)
+    bc = stub_client(handler, rate_limiter=limiter, retry=retry)
+
+    with pytest.raises(BankIdRateLimitError):
+        bc.collect(orderRef='order')
+    assert calls == ['collect'] * 2
+    assert limiter.rejected == 1
+
+
+def test_open_breaker_takes_no_tokens():
+    clock = FakeClock()
+    limiter = RateLimiter(rates={'collect': (0.1, 1)}, block=False, reserve=0, clock=clock)
+    breaker = CircuitBreaker(min_calls=1, reset_timeout=5.0, clock=clock)
+    bc = stub_client(
+        lambda endpoint, data: (200, TEST_COLLECT_DATA), rate_limiter=limiter, circuit_breaker=breaker
+    )
+
+    breaker.record(requests.ConnectionError())
+    for _ in range(3):
+        with pytest.raises(BankIdCircuitOpenError):
+            bc.collect(orderRef='order')
+    assert limiter.rejected == 0
+
+    # The half-open trial gets the token, and a trial refused a token is given back
+    clock.now += 5.0
+    assert bc.collect(orderRef='order').orderRef == TEST_COLLECT_DATA['orderRef']
+    breaker.record(requests.ConnectionError())
+    clock.now += 5.0
+    with pytest.raises(BankIdRateLimitError):
+        bc.collect(orderRef='order')
+    assert breaker.state == CircuitBreaker.HALF_OPEN and breaker._trials == 0
@@ -0,0 +1,155 @@
+import random
+
+import pytest
+import requests
+
+from bankid6 import BankIdError, BankIdCircuitOpenError
+from bankid6.retry import RetryPolicy, CircuitBreaker
+
+from .factories import TEST_START_RESPONSE_DATA, stub_client
+
+
+MAINTENANCE = (503, {'errorCode': 'maintenance', 'details': 'Down for maintenance'})
+COLLECT_DATA = {'orderRef': 'order', 'status': 'pending', 'hintCode': 'started'}
+
+
+def scripted_client(responses, **kwargs):
+    """Client answering from ``responses``, a list of ``(status, data)`` or exceptions, one per call."""
+    calls = []
+
+    def handler(endpoint, data):
+        calls.append(endpoint)
+        response = responses.pop(0) if len(responses) > 1 else responses[0]
+        if isinstance(response, BaseException):
+            raise response
+        return response
+
+    return stub_client(handler, **kwargs), calls
+
+
+def fast_retry(**kwargs):
+    return RetryPolicy(base_delay=0.001, max_delay=0.002, rng=random.Random(1), **kwargs)
+
+
+def test_retry_policy_decisions():
+    policy = RetryPolicy(max_attempts=3, base_delay=1.0, max_delay=3.0, deadline=10.0, rng=random.Random(1))
+    maintenance = BankIdError(None, None, None, 'maintenance', None, 503, {})
+    internal = BankIdError(None, None, None, 'internalError', None, 500, {})
+    connection = requests.ConnectionError()
+
+    assert policy.is_retryable('auth', maintenance)
+    assert not policy.is_retryable('auth', internal)
+    assert not policy.is_retryable('auth', connection)
+    assert policy.is_retryable('collect', connection)
+    assert policy.is_retryable('cancel', requests.Timeout())
+    assert not policy.is_retryable('collect', requests.exceptions.SSLError())
+
+    for attempt in range(2):
+        assert 0 <= policy.next_delay('collect', connection, attempt, 0) <= min(3.0, 2 ** attempt)
+    assert policy.next_delay('collect', connection, 2, 0) is None
+    assert policy.next_delay('collect', connection, 0, 9.9999) is None
+
+
+def test_client_retries_maintenance():
+    bc, calls = scripted_client([MAINTENANCE, MAINTENANCE, (200, TEST_START_RESPONSE_DATA)], retry=fast_retry())
+
+    assert bc.auth('127.0.0.1').orderRef == TEST_START_RESPONSE_DATA['orderRef']
+    assert calls == ['auth'] * 3
+
+    bc, calls = scripted_client([MAINTENANCE], retry=fast_retry(max_attempts=2))
+    with pytest.raises(BankIdError) as exc:
+        bc.auth('127.0.0.1')
+    assert exc.value.errorCode == 'maintenance'
+    assert calls == ['auth'] * 2
+
+
+def test_client_retries_connection_errors_only_when_idempotent():
+    bc, calls = scripted_client([requests.ConnectionError(), (200, COLLECT_DATA)], retry=fast_retry())
+    assert bc.collect(orderRef='order').hintCode == 'started'
+    assert calls == ['collect', 'collect']
+
+    bc, calls = scripted_client([requests.ConnectionError(), (200, TEST_START_RESPONSE_DATA)], retry=fast_retry())
+    with pytest.raises(requests.ConnectionError):
+        bc.auth('127.0.0.1')
+    assert calls == ['auth']
+
+    bc, calls = scripted_client([(400, {'errorCode': 'invalidParameters'})], retry=fast_retry())
+    with pytest.raises(BankIdError):
+        bc.collect(orderRef='order')
+    assert calls == ['collect']
+
+
+def test_circuit_breaker_states():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_rate=0.5, min_calls=4, window=10.0, reset_timeout=5.0, clock=lambda: now[0])
+    failure = BankIdError(None, None, None, 'internalError', None, 500, {})
+    client_error = BankIdError(None, None, None, 'invalidParameters', None, 400, {})
+
+    for exc in [None, client_error, failure]:
+        breaker.before_call()
+        breaker.record(exc)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.record(requests.ConnectionError())
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(BankIdCircuitOpenError) as exc:
+        breaker.before_call()
+    assert exc.value.retry_after == 5.0
+
+    now[0] = 5.0
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(BankIdCircuitOpenError):
+        breaker.before_call()
+    breaker.record(failure)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.opened == 2
+
+    now[0] = 10.0
+    breaker.before_call()
+    breaker.record(None)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    # Failures older than the window are forgotten
+    for _ in range(3):
+        breaker.record(failure)
+    now[0] = 25.0
+    breaker.record(failure)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_client_fails_fast_when_circuit_open():
+    breaker = CircuitBreaker(min_calls=2, reset_timeout=60.0)
+    bc, calls = scripted_client([MAINTENANCE], circuit_breaker=breaker)
+
+    for _ in range(2):
+        with pytest.raises(BankIdError):
+            bc.collect(orderRef='order')
+    assert breaker.state == CircuitBreaker.OPEN
+
+    results = bc.collect_many(['a', 'b'])
+    assert all(isinstance(result, BankIdCircuitOpenError) for result in results.values())
+    assert calls == ['collect'] * 2
+    bc.close()
+
+
+class Cancelled(BaseException):
+    pass
+
+
+def test_cancelled_trial_frees_half_open_slot():
+    now = [0.0]
+    breaker = CircuitBreaker(min_calls=1, reset_timeout=5.0, clock=lambda: now[0])
+    bc, calls = scripted_client([Cancelled(), (200, COLLECT_DATA)], circuit_breaker=breaker)
+    breaker.record(requests.ConnectionError())
+    assert breaker.state == CircuitBreaker.OPEN
+
+    now[0] = 5.0
+    with pytest.raises(Cancelled):
+        bc.collect(orderRef='order')
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    assert bc.collect(orderRef='order').status == 'pending'
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert calls == ['collect'] * 2
+    bc.close()
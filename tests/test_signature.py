@@ -0,0 +1,93 @@
+import base64
+from datetime import datetime, timezone
+
+import pytest
+
+from bankid6.handlers import BankIdCompletionData, parse_issue_date
+from bankid6.signature import decode_base64, parse_signed_data, parse_ocsp_response
+
+
+def b64(value: str) -> str:
+    return base64.b64encode(value.encode('utf-8')).decode('ascii')
+
+
+SIGNATURE_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="no"?>'
+    '<Signature xmlns="http://www.w3.org/2000/09/xmldsig#">'
+    '<SignedInfo/><SignatureValue>abc</SignatureValue>'
+    '<Object><bankIdSignedData xmlns="http://www.bankid.com/signature/v1.0.0/types" Id="bidSignedData">'
+    f'<usrVisibleData charset="UTF-8" visible="wysiwys">{b64("Sign the agreement")}</usrVisibleData>'
+    f'<usrNonVisibleData>{b64("ref-123")}</usrNonVisibleData>'
+    f'<srvInfo><name>{b64("Example AB")}</name><nonce>bm9uY2U=</nonce><displayName>RXhhbXBsZQ==</displayName></srvInfo>'
+    '<clientInfo><funcId>Signing</funcId><version>Ny4xMi4w</version><env><ai><type>QU5EUk9JRA==</type></ai></env></clientInfo>'
+    '</bankIdSignedData></Object></Signature>'
+)
+
+
+def der(tag: int, content: bytes) -> bytes:
+    length = len(content)
+    if length < 0x80:
+        return bytes([tag, length]) + content
+    size = (length.bit_length() + 7) // 8
+    return bytes([tag, 0x80 | size]) + length.to_bytes(size, 'big') + content
+
+
+def ocsp_response(cert_status_tag=0x80, produced_at=b'20240212101500Z'):
+    cert_id = der(0x30, der(0x30, der(0x06, b'\x2b\x0e\x03\x02\x1a')) + der(0x04, b'\x00' * 20))
+    single = der(0x30, cert_id + der(cert_status_tag, b'') + der(0x18, produced_at))
+    tbs = der(0x30, der(0xa2, der(0x04, b'\x01' * 20)) + der(0x18, produced_at) + der(0x30, single))
+    basic = der(0x30, tbs + der(0x30, der(0x06, b'\x2a\x86\x48')) + der(0x03, b'\x00' + b'\x11' * 200))
+    response_bytes = der(0x30, der(0x06, b'\x2b\x06\x01\x05\x05\x07\x30\x01\x01') + der(0x04, basic))
+    return der(0x30, der(0x0a, b'\x00') + der(0xa0, response_bytes))
+
+
+def test_parse_signed_data():
+    signed_data = parse_signed_data(decode_base64(b64(SIGNATURE_XML)))
+    assert signed_data.usrVisibleData == 'Sign the agreement'
+    assert signed_data.usrNonVisibleData == 'ref-123'
+    assert signed_data.srvInfo['name'] == b64('Example AB')
+    assert signed_data.clientInfo['funcId'] == 'Signing'
+
+
+def test_parse_ocsp_response():
+    ocsp = parse_ocsp_response(memoryview(ocsp_response()))
+    assert ocsp.responseStatus == 0
+    assert ocsp.producedAt == datetime(2024, 2, 12, 10, 15, tzinfo=timezone.utc)
+    assert ocsp.certStatus == 'good'
+
+    assert parse_ocsp_response(memoryview(ocsp_response(cert_status_tag=0xa1))).certStatus == 'revoked'
+    
+    unauthorized = der(0x30, der(0x0a, b'\x06'))
+    assert parse_ocsp_response(memoryview(unauthorized)).responseStatus == 6
+
+    with pytest.raises(ValueError):
+        decode_base64('not base64!')
+
+
+def test_issue_date():
+    assert parse_issue_date('2024-02-12Z') == datetime.strptime('2024-02-12Z', '%Y-%m-%d%z')
+    assert parse_issue_date('2024-02-12+01:00') == datetime.strptime('2024-02-12+0100', '%Y-%m-%d%z')
+
+
+def test_completion_data_is_lazy_and_cached():
+    ocsp = ocsp_response()
+    cd = BankIdCompletionData({
+        'user': {'personalNumber': '197311108711'},
+        'bankIdIssueDate': '2024-02-12Z',
+        'signature': b64(SIGNATURE_XML),
+        'ocspResponse': base64.b64encode(ocsp).decode('ascii'),
+    })
+
+    assert cd.user is cd.user
+    assert cd.device is None
+    assert cd.bankIdIssueDate is cd.bankIdIssueDate
+    assert isinstance(cd.signature_bytes, memoryview)
+    assert bytes(cd.signature_bytes) == SIGNATURE_XML.encode('utf-8')
+    assert cd.signed_data is cd.signed_data
+    assert cd.signed_data.usrVisibleData == 'Sign the agreement'
+    assert bytes(cd.ocsp_response_bytes) == ocsp
+    assert cd.ocsp.certStatus == 'good'
+
+    empty = BankIdCompletionData({})
+    assert empty.user is None and empty.bankIdIssueDate is None
+    assert empty.signed_data is None and empty.ocsp is None
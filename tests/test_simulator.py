@@ -0,0 +1,123 @@
+import socket
+
+import pytest
+
+from bankid6 import BankIdClient, BankIdError, CollectStatuses, HintCodes
+from bankid6.simulator import BankIdSimulator, SimulatorServer, parse_latency
+
+from .factories import FakeClock, stub_client
+
+
+def test_scripted_progression():
+    client = stub_client(BankIdSimulator())
+    order = client.auth('127.0.0.1')
+
+    hints = [order.collect().hintCode for _ in range(3)]
+    assert hints == [HintCodes.outstandingTransaction, HintCodes.started, HintCodes.userSign]
+
+    result = order.collect()
+    assert result.status == CollectStatuses.complete
+    assert result.completionData.user.personalNumber
+    assert result.completionData.signature_bytes
+
+    with pytest.raises(BankIdError) as exc:
+        order.collect()
+    assert exc.value.errorCode == 'invalidParameters'
+
+
+def test_custom_script_and_steps():
+    script = ((CollectStatuses.pending, HintCodes.outstandingTransaction), (CollectStatuses.failed, HintCodes.userCancel))
+    client = stub_client(BankIdSimulator(script=script, collects_per_step=2))
+    order = client.phone_sign('197311108711', 'user', 'data')
+
+    assert [order.collect().status for _ in range(3)] == ['pending', 'pending', 'failed']
+
+
+def test_already_in_progress_and_cancel():
+    simulator = BankIdSimulator()
+    client = stub_client(simulator)
+    client.phone_auth('197311108711', 'RP')
+
+    with pytest.raises(BankIdError) as exc:
+        client.phone_auth('197311108711', 'RP')
+    assert exc.value.errorCode == 'alreadyInProgress'
+    assert not simulator.orders
+
+    order = client.auth('127.0.0.1')
+    order.cancel()
+    with pytest.raises(BankIdError) as exc:
+        order.cancel()
+    assert exc.value.errorCode == 'invalidParameters'
+
+
+def test_expiry():
+    clock = FakeClock()
+    simulator = BankIdSimulator(order_ttl=30, clock=clock)
+    client = stub_client(simulator)
+
+    order = client.auth('127.0.0.1')
+    clock.now = 31
+    result = order.collect()
+    assert (result.status, result.hintCode) == (CollectStatuses.failed, HintCodes.startFailed)
+
+    client.auth('127.0.0.1')
+    clock.now = 100
+    client.auth('127.0.0.1')
+    assert len(simulator.orders) == 1
+
+
+def test_maintenance_and_invalid_parameters():
+    simulator = BankIdSimulator(maintenance_rate=1.0)
+    assert simulator.handle('auth', {'endUserIp': '127.0.0.1'})[0] == 503
+    assert simulator.handle('auth', {'endUserIp': '127.0.0.1'})[1]['errorCode'] == 'maintenance'
+
+    simulator = BankIdSimulator()
+    assert simulator.handle('sign', {'endUserIp': '127.0.0.1'}) == (
+        400, {'errorCode': 'invalidParameters', 'details': 'Missing userVisibleData'}
+    )
+    assert simulator.handle('unknown', {})[0] == 404
+
+
+def test_parse_latency():
+    assert parse_latency('0.05')() == 0.05
+    assert 0.1 <= parse_latency('uniform:0.1:0.2')() <= 0.2
+    assert parse_latency('lognormal:0.05:0.5')() > 0
+
+    with pytest.raises(ValueError):
+        parse_latency('gamma:1')
+
+
+def test_server_with_base_url():
+    with SimulatorServer(latency=parse_latency('0.001')) as server:
+        client = BankIdClient(base_url=server.url)
+        assert client.api_url == server.url
+
+        order = client.sign('127.0.0.1', 'data')
+        statuses = [order.collect().status for _ in range(4)]
+        assert statuses[-1] == CollectStatuses.complete
+
+        with pytest.raises(BankIdError) as exc:
+            client.cancel(orderRef=order.orderRef)
+        assert exc.value.response_status == 400
+    
+    client.close()
+
+
+def test_server_rejects_malformed_content_length():
+    with SimulatorServer() as server:
+        with socket.create_connection((server.host, server.port), timeout=2) as sock:
+            sock.sendall(b'POST /rp/v6.0/collect HTTP/1.1\r\nContent-Length: ten\r\n\r\n{}')
+            response = b''
+            while True:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                response += chunk
+
+        assert response.startswith(b'HTTP/1.1 400 ')
+        assert b'Invalid Content-Length' in response
+
+        # The server keeps serving other connections
+        client = BankIdClient(base_url=server.url)
+        assert client.auth('127.0.0.1').orderRef
+        client.close()
@@ -0,0 +1,135 @@
+import sqlite3
+
+import pytest
+
+from bankid6 import BankIdClient, BankIdValidationError, generate_qr_data
+from bankid6.simulator import BankIdSimulator
+from bankid6.store import OrderState, MemoryOrderStore, SQLiteOrderStore, COMPLETE_TTL
+
+from .factories import FakeClock, stub_client
+
+
+def test_memory_store_ttl_and_lru():
+    clock = FakeClock(1000.0)
+    store = MemoryOrderStore(maxsize=2, clock=clock)
+
+    store.put(OrderState('a', 1000, 'token-a', 'secret-a'))
+    store.put(OrderState('b'), ttl=10)
+    assert store.get('a').qrStartToken == 'token-a'
+    assert store.get('a') is store.get('a')
+
+    store.put(OrderState('c'))
+    assert store.get('b') is None
+    assert store.get('a') is not None and len(store) == 2
+
+    store.set_ttl('a', 5)
+    clock.now += 5
+    assert store.get('a') is None
+    store.delete('c')
+    assert store.get('c') is None
+
+
+def test_sqlite_store_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'orders.db')
+    clock = FakeClock(1000.0)
+    writer = SQLiteOrderStore(path, flush_interval=60, clock=clock)
+    reader = SQLiteOrderStore(path, flush_interval=60, clock=clock)
+    try:
+        writer.put(OrderState('a', 1000, 'token-a', 'secret-a'))
+        state = OrderState('b', 1000, 'token-b', 'secret-b', started=990.5)
+        state.is_mobile = True
+        writer.put(state)
+        writer.put(OrderState('c'))
+        assert writer.get('a').qrStartSecret == 'secret-a'
+        assert reader.get('a') is None
+
+        writer.flush()
+        state = reader.get('a')
+        assert (state.order_time, state.qrStartToken, state.qrStartSecret) == (1000, 'token-a', 'secret-a')
+        assert (reader.get('b').started, reader.get('b').is_mobile) == (990.5, True)
+        assert reader.get('c').is_mobile is None
+
+        writer.set_ttl('a', 5)
+        writer.delete('b')
+        assert writer.get('b') is None
+        writer.flush()
+        assert reader.get('b') is None
+
+        clock.now += 5
+        assert reader.get('a') is None
+        assert writer.get('missing') is None
+    finally:
+        writer.close()
+        reader.close()
+
+
+def test_sqlite_store_flushes_in_background(tmp_path):
+    path = str(tmp_path / 'orders.db')
+    with SQLiteOrderStore(path, flush_interval=0.01) as writer, SQLiteOrderStore(path) as reader:
+        writer.put(OrderState('a', 1000, 'token-a', 'secret-a'))
+        writer._stop.wait(0.1)
+        assert reader.get('a').qrStartToken == 'token-a'
+
+    with SQLiteOrderStore(path, max_batch=2, flush_interval=60) as writer:
+        writer.put(OrderState('x'))
+        writer.put(OrderState('y'))
+        assert not writer._pending
+
+
+def test_clients_share_orders_through_store():
+    simulator = BankIdSimulator(collects_per_step=1)
+    store = MemoryOrderStore()
+    starter, collector = [stub_client(simulator, store=store) for _ in range(2)]
+
+    order = starter.auth('127.0.0.1')
+    assert collector.qr_data(order.orderRef) == generate_qr_data(
+        order.order_time, order.qrStartToken, order.qrStartSecret
+    )
+    assert collector.qr_data('unknown') is None
+
+    result = collector.collect(order.orderRef)
+    assert result.qr_frames.qrStartToken == order.qrStartToken
+
+    while result.status == 'pending':
+        result = collector.collect(order.orderRef)
+    assert store._orders[order.orderRef][1] == pytest.approx(store.clock() + COMPLETE_TTL, abs=1)
+
+    other = starter.sign('127.0.0.1', 'Sign this')
+    collector.cancel(other.orderRef)
+    assert store.get(other.orderRef) is None
+
+    with pytest.raises(BankIdValidationError):
+        BankIdClient(key_pem='test').qr_data(order.orderRef)
+
+
+def test_sqlite_store_survives_failed_flushes(tmp_path):
+    path = str(tmp_path / 'orders.db')
+    with SQLiteOrderStore(path, flush_interval=0.01) as writer, SQLiteOrderStore(path) as reader:
+        write = writer._write
+        failures = []
+
+        def locked(*args):
+            if len(failures) < 2:
+                failures.append(args)
+                raise sqlite3.OperationalError('database is locked')
+            return write(*args)
+
+        writer._write = locked
+        writer.put(OrderState('a', 1000, 'token-a', 'secret-a'))
+        writer.set_ttl('a', 60)
+        writer._stop.wait(0.2)
+
+        assert len(failures) == 2
+        assert writer._thread.is_alive()
+        assert reader.get('a').qrStartToken == 'token-a'
+
+        writer._write = lambda *args: (_ for _ in ()).throw(sqlite3.OperationalError('database is locked'))
+        state = OrderState('b', 1000, 'token-b', 'secret-b', started=990.5)
+        state.is_mobile = True
+        writer.put(state)
+        writer.put(OrderState('c'))
+        with pytest.raises(sqlite3.OperationalError):
+            writer.flush()
+        writer.set_ttl('b', 5)
+        assert writer._pending['b'][0].qrStartToken == 'token-b'
+        writer._write = write
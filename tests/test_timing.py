@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from bankid6 import BankIdClient, AsyncBankIdClient, BankIdError
+from bankid6.simulator import SimulatorServer, fixed_latency
+from bankid6.timing import RequestTimings
+
+
+@pytest.fixture
+def server():
+    with SimulatorServer(latency=fixed_latency(0.02)) as server:
+        yield server
+
+
+def test_timings_off_by_default(server):
+    client = BankIdClient(base_url=server.url)
+    assert client.auth('127.0.0.1').timings is None
+    client.close()
+
+
+def test_sync_timings(server):
+    client = BankIdClient(base_url=server.url, timings=True, keep_response=False)
+
+    order = client.auth('127.0.0.1')
+    timings = order.timings
+    assert timings.reused is False
+    assert timings.connect is not None and timings.tls is None
+    assert timings.ttfb >= 0.02
+    assert timings.total >= timings.connect + timings.ttfb + timings.read + timings.decode
+
+    timings = order.collect().timings
+    assert timings.reused is True
+    assert timings.connect is None
+
+    with pytest.raises(BankIdError) as exc:
+        client.cancel(orderRef='missing')
+    assert exc.value.timings.ttfb >= 0.02
+    client.close()
+
+
+def test_async_timings(server):
+    async def scenario():
+        async with AsyncBankIdClient(base_url=server.url, timings=True) as client:
+            order = await client.auth('127.0.0.1')
+            assert order.timings.reused is False
+            assert order.timings.ttfb >= 0.02
+
+            result = await client.collect(order=order)
+            assert result.timings.reused is True
+            assert result.timings.total >= result.timings.ttfb
+
+    pytest.importorskip('aiohttp')
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(scenario())
+    finally:
+        loop.close()
+
+
+def test_request_timings_repr():
+    timings = RequestTimings()
+    timings.ttfb = 0.0123
+    assert timings.to_dict()['ttfb'] == 0.0123
+    assert repr(timings) == '<RequestTimings reused=True ttfb=12.3ms>'
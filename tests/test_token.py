@@ -0,0 +1,103 @@
+import time
+
+import pytest
+
+from bankid6 import BankIdClient, BankIdTokenError, BankIdValidationError, Messages, UseTypes, generate_qr_data
+from bankid6.simulator import BankIdSimulator
+from bankid6.store import OrderState
+from bankid6.token import OrderTokens, encode_order_token, decode_order_token
+
+from .factories import stub_client
+
+
+KEY = 'test-order-token-key'
+ORDER = OrderState(
+    '131daac9-16c6-4618-beb0-365768f37288', int(time.time()), '67df3917-fa0d-44e5-b327-edcc928297f8',
+    'd28db9a7-4cde-429e-a983-359be676944c'
+)
+
+
+def test_roundtrip_and_size():
+    tokens = OrderTokens(KEY)
+    token = tokens.encode(ORDER, is_mobile=True)
+    assert len(token) < 120
+    assert token != tokens.encode(ORDER, is_mobile=True)
+
+    state = tokens.decode(token)
+    assert (state.orderRef, state.order_time, state.qrStartToken, state.qrStartSecret, state.is_mobile) == (
+        ORDER.orderRef, ORDER.order_time, ORDER.qrStartToken, ORDER.qrStartSecret, True
+    )
+
+    other = OrderState('not-a-uuid', ORDER.order_time)
+    state = decode_order_token(encode_order_token(other, KEY), KEY)
+    assert (state.orderRef, state.qrStartToken, state.qrStartSecret, state.is_mobile) == (
+        'not-a-uuid', None, None, False
+    )
+
+
+def test_rejects_forged_and_expired_tokens():
+    tokens = OrderTokens(KEY, max_age=60)
+    token = tokens.encode(ORDER)
+
+    tampered = token[:20] + ('A' if token[20] != 'A' else 'B') + token[21:]
+    for bad in [tampered, token[:-2], 'garbage', '', OrderTokens('another-server-key').encode(ORDER)]:
+        with pytest.raises(BankIdTokenError):
+            tokens.decode(bad)
+
+    with pytest.raises(BankIdTokenError):
+        tokens.decode(token, now=ORDER.order_time + 61)
+    assert issubclass(BankIdTokenError, BankIdValidationError)
+
+    with pytest.raises(ValueError):
+        OrderTokens('short')
+
+
+def test_key_rotation():
+    old_token = OrderTokens('the-previous-token-key').encode(ORDER)
+    tokens = OrderTokens(KEY, old_keys=['the-previous-token-key'])
+    assert tokens.decode(old_token).orderRef == ORDER.orderRef
+
+
+def test_generate_qr_data_from_token():
+    token = encode_order_token(ORDER, KEY)
+    assert generate_qr_data(token=token, key=KEY) == generate_qr_data(
+        ORDER.order_time, ORDER.qrStartToken, ORDER.qrStartSecret
+    )
+
+    with pytest.raises(BankIdValidationError):
+        generate_qr_data(token=encode_order_token(OrderState(ORDER.orderRef, ORDER.order_time), KEY), key=KEY)
+    with pytest.raises(BankIdTokenError):
+        generate_qr_data(token=token)
+
+
+def test_client_collects_with_token():
+    simulator = BankIdSimulator(collects_per_step=1)
+    starter, collector = [stub_client(simulator, token_key=KEY) for _ in range(2)]
+
+    order = starter.auth('127.0.0.1')
+    token = order.to_token()
+    assert order.to_token(KEY) != token
+    assert collector.qr_data(token=token) == generate_qr_data(order.order_time, order.qrStartToken, order.qrStartSecret)
+
+    result = collector.collect(token=token)
+    assert result.orderRef == order.orderRef
+    assert result.qr_frames.qrStartToken == order.qrStartToken
+
+    phone_order = starter.phone_auth('199001011234', 'user')
+    assert collector.qr_data(token=phone_order.to_token()) is None
+    collector.cancel(token=phone_order.to_token())
+
+    with pytest.raises(BankIdValidationError):
+        BankIdClient(key_pem='test').collect(token=token)
+
+
+def test_token_chooses_collect_message_device():
+    simulator = BankIdSimulator(collects_per_step=1)
+    starter = stub_client(simulator, token_key=KEY, is_mobile=True)
+    collector = stub_client(simulator, token_key=KEY, is_mobile=False)
+
+    token = starter.auth('127.0.0.1').to_token()
+    collector.collect(token=token)
+    result = collector.collect(token=token)
+    assert result.hintCode == 'started'
+    assert result.message[UseTypes.qrcode] == Messages.RFA15B.json()
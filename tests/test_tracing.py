@@ -0,0 +1,63 @@
+import pytest
+
+from bankid6 import BankIdClient, BankIdError
+from bankid6.tracing import InMemoryExporter, RecordingTracer, NOOP_TRACER, current_span
+
+from .factories import stub_client
+
+
+def traced_client(maxlen=100):
+    exporter = InMemoryExporter(maxlen=maxlen)
+    return stub_client(tracer=RecordingTracer(exporter)), exporter
+
+
+def test_default_tracer_is_noop():
+    assert BankIdClient().tracer is NOOP_TRACER
+    with NOOP_TRACER.start_span('test') as span:
+        span.set_attribute('key', 'value')
+    assert current_span() is None
+
+
+def test_call_spans():
+    client, exporter = traced_client()
+    order = client.auth('127.0.0.1')
+
+    auth = exporter.spans('bankid.auth')[0]
+    assert auth.attributes == {'endpoint': 'auth', 'orderRef': order.orderRef}
+    children = [span for span in exporter.spans() if span.parent_id == auth.span_id]
+    assert [span.name for span in children] == ['bankid.validate', 'bankid.http', 'bankid.check_error', 'bankid.response']
+    assert children[1].attributes == {'http.status_code': 200}
+    assert all(span.trace_id == auth.trace_id for span in children)
+    assert auth.duration >= sum(span.duration for span in children)
+
+    exporter.clear()
+    order.collect()
+    collect = exporter.spans('bankid.collect')[0]
+    assert collect.attributes == {
+        'endpoint': 'collect', 'orderRef': order.orderRef, 'status': 'pending', 'hintCode': 'outstandingTransaction'
+    }
+    assert collect.parent_id is None
+    assert len(exporter.traces()) == 1
+    assert current_span() is None
+
+
+def test_error_spans():
+    client, exporter = traced_client()
+
+    with pytest.raises(BankIdError):
+        client.cancel(orderRef='missing')
+
+    check, cancel = exporter.spans()[-2:]
+    assert check.name == 'bankid.check_error'
+    assert check.error.startswith('BankIdError')
+    assert cancel.name == 'bankid.cancel' and cancel.error == check.error
+    assert cancel.to_dict()['attributes'] == {'endpoint': 'cancel', 'orderRef': 'missing'}
+
+
+def test_ring_buffer_is_bounded():
+    client, exporter = traced_client(maxlen=10)
+    for _ in range(5):
+        client.auth('127.0.0.1')
+
+    assert len(exporter.spans()) == 10
+    assert exporter.spans()[-1].name == 'bankid.auth'